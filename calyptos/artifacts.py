@@ -0,0 +1,193 @@
+from datetime import datetime
+import hashlib
+import json
+import os
+import pipes
+import time
+
+from calyptos.sshpool import get_pool
+
+ARTIFACT_DIR = os.path.expanduser('~/.calyptos/artifacts')
+CHUNK_SIZE = 1024 * 1024
+
+# Run on the host with its own python, prints path -> size, mtime and the
+# sha1 of every chunk of every regular file under the paths it is given
+CHUNK_SCRIPT = """
+import hashlib, json, os, stat, sys
+size = int(sys.argv[1])
+files = {}
+def add(path):
+    try:
+        info = os.lstat(path)
+        if not stat.S_ISREG(info.st_mode):
+            return
+        chunks, total = [], 0
+        with open(path, 'rb') as handle:
+            while True:
+                block = handle.read(size)
+                if not block:
+                    break
+                chunks.append(hashlib.sha1(block).hexdigest())
+                total += len(block)
+    except (IOError, OSError):
+        return
+    files[path] = {'size': total, 'mtime': info.st_mtime, 'chunks': chunks}
+for top in sys.argv[2:]:
+    if os.path.isfile(top):
+        add(top)
+    for dirpath, dirnames, filenames in os.walk(top):
+        for filename in filenames:
+            add(os.path.join(dirpath, filename))
+sys.stdout.write(json.dumps(files))
+"""
+
+
+class ArtifactStore(object):
+    """
+    Debug artifacts of every run, stored once per distinct chunk.
+
+    Files are cut in CHUNK_SIZE chunks stored under their sha1, so a chunk
+    shared by runs or hosts, like the unchanged start of a log, is only kept
+    and transferred once. Each run records a manifest of the files it saw on
+    every host and the chunks they are made of.
+    """
+
+    def __init__(self, root=ARTIFACT_DIR, chunk_size=CHUNK_SIZE, python='python'):
+        """
+        :param python: interpreter on the hosts that lists their chunks
+        """
+        self.root = root
+        self.chunk_size = chunk_size
+        self.python = python
+        self.chunk_dir = os.path.join(root, 'chunks')
+        self.run_dir = os.path.join(root, 'runs')
+        for directory in [self.chunk_dir, self.run_dir]:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunk_dir, digest[:2], digest)
+
+    def has_chunk(self, digest):
+        return os.path.exists(self._chunk_path(digest))
+
+    def put_chunk(self, data):
+        digest = hashlib.sha1(data).hexdigest()
+        path = self._chunk_path(digest)
+        if not os.path.exists(path):
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                try:
+                    os.makedirs(directory)
+                except OSError:
+                    # Made by another thread in the meantime
+                    pass
+            partial = '{0}.{1}.{2}'.format(path, os.getpid(), id(data))
+            with open(partial, 'wb') as chunk_file:
+                chunk_file.write(data)
+            os.rename(partial, path)
+        return digest
+
+    def get_chunk(self, digest):
+        with open(self._chunk_path(digest), 'rb') as chunk_file:
+            return chunk_file.read()
+
+    def collect(self, host, paths):
+        """
+        Store the files under paths on host, fetching only chunks the store
+        does not hold yet
+
+        :returns: (dict of path -> file entry for the manifest, dict of stats)
+        """
+        pool = get_pool()
+        command = '{0} -c {1} {2} {3}'.format(self.python, pipes.quote(CHUNK_SCRIPT),
+                                              self.chunk_size,
+                                              ' '.join(pipes.quote(path) for path in paths))
+        result = pool.run(host, command)
+        if result.failed:
+            raise IOError('Unable to list artifacts on {0}: {1}'.format(host, result))
+        files = json.loads(result)
+        stats = {'transferred': 0}
+        with pool.sftp(host) as sftp:
+            for path, entry in sorted(files.items()):
+                missing = [index for index, digest in enumerate(entry['chunks'])
+                           if not self.has_chunk(digest)]
+                if not missing:
+                    continue
+                try:
+                    remote_file = sftp.open(path, 'rb')
+                except IOError:
+                    # Gone since it was listed
+                    del files[path]
+                    continue
+                try:
+                    for index in missing:
+                        remote_file.seek(index * self.chunk_size)
+                        data = remote_file.read(self.chunk_size)
+                        stats['transferred'] += len(data)
+                        # A file that grew since it was listed, like a log,
+                        # is stored as it is now
+                        entry['chunks'][index] = self.put_chunk(data)
+                        if index == len(entry['chunks']) - 1:
+                            entry['size'] = index * self.chunk_size + len(data)
+                finally:
+                    remote_file.close()
+        stats['files'] = len(files)
+        stats['bytes'] = sum(entry['size'] for entry in files.itervalues())
+        return files, stats
+
+    def save_run(self, hosts, run_id=None):
+        """
+        :param hosts: dict of host -> files, as returned by collect
+        :returns: id of the run
+        """
+        run_id = run_id or datetime.strftime(datetime.now(), '%Y%m%d-%H%M%S')
+        path = os.path.join(self.run_dir, run_id + '.json')
+        with open(path + '.tmp', 'w') as run_file:
+            json.dump({'created': time.time(), 'chunk_size': self.chunk_size,
+                       'hosts': hosts}, run_file)
+        os.rename(path + '.tmp', path)
+        return run_id
+
+    def runs(self):
+        return sorted(name[:-len('.json')] for name in os.listdir(self.run_dir)
+                      if name.endswith('.json'))
+
+    def load_run(self, run_id):
+        with open(os.path.join(self.run_dir, run_id + '.json')) as run_file:
+            return json.load(run_file)
+
+    def restore(self, run_id, host, path, local_path):
+        """
+        Write path of host, as it was in run_id, to local_path
+        """
+        entry = self.load_run(run_id)['hosts'][host][path]
+        with open(local_path, 'wb') as local_file:
+            for digest in entry['chunks']:
+                local_file.write(self.get_chunk(digest))
+        return local_path
+
+    def prune(self, max_age_days):
+        """
+        Forget runs older than max_age_days and delete chunks that no
+        remaining run refers to
+
+        :returns: number of chunks deleted
+        """
+        cutoff = time.time() - max_age_days * 86400
+        referenced = set()
+        for run_id in self.runs():
+            run = self.load_run(run_id)
+            if run['created'] < cutoff:
+                os.remove(os.path.join(self.run_dir, run_id + '.json'))
+                continue
+            for files in run['hosts'].itervalues():
+                for entry in files.itervalues():
+                    referenced.update(entry['chunks'])
+        deleted = 0
+        for dirpath, _, filenames in os.walk(self.chunk_dir):
+            for filename in filenames:
+                if filename not in referenced:
+                    os.remove(os.path.join(dirpath, filename))
+                    deleted += 1
+        return deleted
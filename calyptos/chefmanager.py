@@ -1,11 +1,18 @@
-import glob
-from fabric.contrib.project import rsync_project
-import json
-from os.path import splitext
+from fabric.network import normalize
 import os
+import re
+import subprocess
 
 from fabric.api import *
 from fabric.colors import *
+from fabric.state import output as fabric_output
+
+from calyptos.cookbooks import CookbookCache
+from calyptos.deploydata import DeploymentTree, REMOVED_LIST, plan_distribution
+from calyptos.executor import get_executor
+from calyptos.nodestore import FailedToFindNodeException, NodeStore
+from calyptos.sshpool import get_pool
+from calyptos.tracing import span, traced
 
 
 def error(message):
@@ -21,31 +28,71 @@ def action(message):
     print cyan(message)
 
 
-class FailedToFindNodeException(Exception):
+class RemoteCommandException(Exception):
     pass
 
 
+def run_on_hosts(command, hosts):
+    # Run command on hosts through the executor, failing like fabric's
+    # execute() would if any host can not be reached or errors
+    results = get_executor().run_command(command, hosts)
+    for host, result in results.iteritems():
+        if isinstance(result, BaseException):
+            error('Unable to run "{0}" on {1}: {2}'.format(command, host, result))
+        if result.failed:
+            error('"{0}" failed on {1}: {2}'.format(command, host, result))
+    return results
+
+
+def run_task(task, hosts, *args, **kwargs):
+    # Run task(host, ...) on hosts through the executor, failing if any
+    # host raised
+    results = get_executor().run(task, hosts, *args, **kwargs)
+    for host, result in results.iteritems():
+        if isinstance(result, BaseException):
+            error('{0} failed on {1}: {2}'.format(task.__name__, host, result))
+    return results
+
+
 class ChefManager():
     CHEF_VERSION = "13.8.5"   # version in the chefdk 2.5.3, be consistent
     CHEFDK_VERSION = "2.5.3"
 
-    def __init__(self, password, environment_name, hosts, debug=False):
+    def __init__(self, password, environment_name, hosts, debug=False,
+                 push_mode='rsync', distribution='direct', fanout=2,
+                 seed_groups=None):
         env.password = password
         env.user = 'root'
-        env.parallel = True
-        env.pool_size = 20
         env.disable_known_hosts = True
         self.environment_name = environment_name
         self.current_path, self.folder_name = os.path.split(os.getcwd())
         self.remote_folder_path = '/root/' + self.folder_name + '/'
-        self.ssh_opts = "-o StrictHostKeyChecking=no"
-        self.node_hash = {}
+        # Let rsync's ssh reuse one master connection per host across pushes
+        control_dir = os.path.expanduser('~/.calyptos')
+        if not os.path.isdir(control_dir):
+            os.makedirs(control_dir)
+        self.ssh_opts = ("-o StrictHostKeyChecking=no -o ControlMaster=auto "
+                         "-o ControlPersist=300 "
+                         "-o ControlPath=" + control_dir + "/ssh-%r@%h:%p")
+        # 'rsync' mirrors the working directory on every push, 'incremental'
+        # only ships what changed since the host's last push
+        self.push_mode = push_mode
+        self.deployment_tree = DeploymentTree('./', remote_path=self.remote_folder_path)
+        # With 'tree' distribution the controller only seeds one host per
+        # seed group and the hosts relay incremental bundles to each other
+        self.distribution = distribution
+        self.fanout = fanout
+        self.seed_groups = seed_groups or []
+        self.node_store = NodeStore('chef-repo/nodes')
+        # Roles can be provisioned concurrently, node files are shared
+        self.node_lock = self.node_store.lock
         self.hidden_outputs = ['running', 'stdout', 'stderr']
         with hide(*self.hidden_outputs):
             self.local_hostname = local('hostname', capture=True)
-            self.remote_hostnames = execute(run, 'hostname', hosts=hosts)
+            self.remote_hostnames = run_on_hosts('hostname', hosts)
 
     @staticmethod
+    @traced('chef')
     def sync_ssh_key(hosts, debug=False):
         info('Syncing SSH keys with system under deployment')
         if debug:
@@ -62,9 +109,10 @@ class ChefManager():
                    "chmod 0644 /root/.ssh/authorized_keys;"
                    "grep '{0}' /root/.ssh/authorized_keys || echo '{0}' >> /root/.ssh/authorized_keys".format(pub_key))
             info('Running command: {0}'.format(cmd))
-            execute(run, cmd, hosts=hosts)
+            run_on_hosts(cmd, hosts)
 
     @staticmethod
+    @traced('chef')
     def install_chef_dk(version=CHEFDK_VERSION, debug=False):
         info('Installing Chef DK ' + version)
         if debug:
@@ -76,6 +124,7 @@ class ChefManager():
                                                  'sudo bash -s -- -P chefdk -v ' + version)
 
     @staticmethod
+    @traced('chef')
     def create_chef_repo(debug=False):
         info('Creating Chef repository')
         if debug:
@@ -88,6 +137,7 @@ class ChefManager():
             local('mkdir -p chef-repo/nodes')
 
     @staticmethod
+    @traced('chef')
     def download_cookbooks(berksfile, cookbook_path='chef-repo/cookbooks',
                            debug=False):
         info('Downloading Chef cookbooks')
@@ -95,74 +145,62 @@ class ChefManager():
             hidden_outputs = []
         else:
             hidden_outputs = ['running', 'stdout', 'stderr']
-        with hide(*hidden_outputs):
-            local('rm -rf {0}'.format(cookbook_path))
+
+        def vendor(berksfile, cookbook_path):
             local('berks vendor --berksfile {0} {1}'.format(berksfile,
                                                             cookbook_path))
+        with hide(*hidden_outputs):
+            if CookbookCache().vendor(berksfile, cookbook_path, vendor):
+                info('Using cached cookbooks')
 
-    def load_local_node_info(self, chef_repo_dir='chef-repo/'):
-        for node_file in glob.glob(chef_repo_dir + 'nodes/*.json'):
-            self.read_node_hash(node_file)
-
-    def read_node_hash(self, node_file):
-        with open(node_file) as handle:
-            data = handle.read()
-            node_name = splitext(node_file.split('/')[-1])[0]
-            try:
-                self.node_hash[node_name] = json.loads(data)
-            except ValueError, e:
-                print 'Unable to read: ' + node_name
-                raise e
-
-    def write_node_hash(self, node_name, chef_repo_dir='chef-repo/'):
-        node_json = chef_repo_dir + 'nodes/' + node_name + '.json'
-        node_info = json.dumps(self.node_hash[node_name], indent=4,
-                               sort_keys=True, separators=(',', ': '))
-        with open(node_json, 'w') as env_json:
-            env_json.write(node_info)
+    def load_local_node_info(self):
+        self.node_store.refresh()
 
     def get_node_name_by_ip(self, target_address):
-        for node, node_info in self.node_hash.iteritems():
-            #ipaddress = node_info['automatic']['ipaddress']
-            if target_address in self.get_node_address_list(node_info):
-                return node_info['name']
-        raise FailedToFindNodeException("Unable to find node: " +
-                                        target_address)
-
-    def get_node_address_list(self, node_info):
-        auto = node_info['automatic']
-        addrs = [auto['ipaddress']]
-        network = auto.get('network')
-        if network:
-            interfaces = network.get('interfaces')
-            for interface, i_info in interfaces.iteritems():
-                for address in i_info.get('addresses', {}):
-                    addrs.append(address)
-        return addrs
+        return self.node_store.find(target_address)
 
+    @traced('chef')
     def add_to_run_list(self, hosts, recipe_list):
+        self.load_local_node_info()
+        node_names = {}
+        unknown = []
         for node_ip in hosts:
-            self.load_local_node_info()
             try:
-                node_name = self.get_node_name_by_ip(node_ip)
+                node_names[node_ip] = self.get_node_name_by_ip(node_ip)
             except FailedToFindNodeException:
-                print yellow("Doing initial bootstrap of " + node_ip)
-                execute(self.push_deployment_data, hosts=hosts)
-                execute(self.run_chef_client, hosts=hosts)
-                node_name = self.get_node_name_by_ip(node_ip)
-            for recipe in recipe_list:
-                if 'run_list' not in self.node_hash[node_name]:
-                    # Create empty run_list if it doesnt exist
-                    self.node_hash[node_name]['run_list'] = []
-                if recipe not in self.node_hash[node_name]['run_list']:
-                    self.node_hash[node_name]['run_list'].append(recipe)
-            self.write_node_hash(node_name)
+                unknown.append(node_ip)
+        if unknown:
+            self.bootstrap_nodes(unknown)
+            for node_ip in unknown:
+                node_names[node_ip] = self.get_node_name_by_ip(node_ip)
+        for node_ip in hosts:
+            node_name = node_names[node_ip]
+            with self.node_lock:
+                run_list = list(self.node_store.record(node_name).run_list)
+                for recipe in recipe_list:
+                    if recipe not in run_list:
+                        run_list.append(recipe)
+                self.node_store.set_run_list(node_name, run_list)
+
+    def bootstrap_nodes(self, hosts):
+        """
+        Converge hosts that have no node file yet once, in one pass, and
+        bring their node files back
+        """
+        print yellow("Doing initial bootstrap of " + ', '.join(sorted(hosts)))
+        self.sync_deployment_data(hosts)
+        run_task(self.run_chef_client, hosts)
+        run_task(self.pull_node_info, hosts)
+
+    def get_node_record(self, ip):
+        self.load_local_node_info()
+        return self.node_store.record(self.get_node_name_by_ip(ip))
 
     def get_node_json(self, ip):
         self.load_local_node_info()
-        node_name = self.get_node_name_by_ip(ip)
-        return self.node_hash[node_name]
+        return self.node_store.document(self.get_node_name_by_ip(ip))
 
+    @traced('chef')
     def clear_run_list(self, hosts):
         self.load_local_node_info()
         for node_ip in hosts:
@@ -171,36 +209,191 @@ class ChefManager():
             except FailedToFindNodeException:
                 info('Unable to find node:' + node_ip)
                 continue
-            self.node_hash[node_name]['run_list'] = []
-            self.write_node_hash(node_name)
+            self.node_store.set_run_list(node_name, [])
 
-    def bootstrap_chef(self):
-        result = run('chef-client -v', warn_only=True)
+    @staticmethod
+    def remote_command(host, command, directory=None, warn_only=False,
+                       forward_agent=False):
+        """
+        Run command on host over its pooled session, raising
+        RemoteCommandException on failure unless warn_only is set
+        """
+        if directory:
+            command = 'cd {0} && {1}'.format(directory, command)
+        result = get_pool().run(host, command, forward_agent=forward_agent)
+        if result.failed and not warn_only:
+            raise RemoteCommandException('"{0}" exited with {1}: {2}'.format(
+                command, result.return_code, result))
+        return result
+
+    @traced('chef')
+    def bootstrap_chef(self, host):
+        result = self.remote_command(host, 'chef-client -v', warn_only=True)
         if result.return_code != 0:
-            info("Installing chef client on: " + str(env.host))
-            run('curl -Ls https://omnitruck.chef.io/install.sh | '
-                'sudo bash -s -- -v ' + self.CHEF_VERSION)
+            info("Installing chef client on: " + host)
+            self.remote_command(host, 'curl -Ls https://omnitruck.chef.io/install.sh | '
+                                'sudo bash -s -- -v ' + self.CHEF_VERSION)
 
-    def clear_node_info(self):
-        with cd(self.remote_folder_path + 'chef-repo'):
-            with hide('running'):
-                return run('knife node bulk delete -z -E {0} -y ".*"'.format(self.environment_name))
+    @traced('chef')
+    def clear_node_info(self, host):
+        return self.remote_command(host, 'knife node bulk delete -z -E {0} -y ".*"'
+                                   .format(self.environment_name),
+                                   directory=self.remote_folder_path + 'chef-repo')
 
-    def run_chef_client(self, chef_command="chef-client --local-mode --no-color --log_level info"):
-        with cd(self.remote_folder_path + 'chef-repo'):
-            with hide('running'):
-                return run(chef_command + " --environment " + self.environment_name)
+    @traced('chef')
+    def run_chef_client(self, host,
+                        chef_command="chef-client --local-mode --no-color --log_level info",
+                        warn_only=False):
+        return self.remote_command(host, chef_command + " --environment " +
+                                   self.environment_name,
+                                   directory=self.remote_folder_path + 'chef-repo',
+                                   warn_only=warn_only)
 
-    def push_deployment_data(self):
-        with hide(*self.hidden_outputs):
-            info("rsyncing deployment data...")
-            rsync_project(local_dir='./',
-                    remote_dir=self.remote_folder_path,
-                    ssh_opts=self.ssh_opts, delete=True)
-
-    def pull_node_info(self):
-        local_path = 'chef-repo/nodes/' + run('hostname') + '.json'
-        remote_path = self.remote_folder_path + local_path
-        if self.local_hostname != run('hostname'):
-            get(remote_path=remote_path, local_path=local_path)
-            self.read_node_hash(local_path)
+    @traced('chef')
+    def push_deployment_data(self, host):
+        info("rsyncing deployment data to " + host + "...")
+        user, hostname, port = normalize(host)
+        command = ('rsync --delete -pthrvz --rsh="ssh -p {0} {1}" ./ '
+                   'root@{2}:{3}'.format(port, self.ssh_opts, hostname,
+                                         self.remote_folder_path))
+        with span('rsync', 'transfer', host=host) as trace:
+            process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT)
+            lines = []
+            for line in iter(process.stdout.readline, ''):
+                lines.append(line)
+                if fabric_output.stdout:
+                    print '[{0}] out: {1}'.format(host, line.rstrip('\n'))
+            process.wait()
+            output = ''.join(lines)
+            sent = re.search(r'sent ([\d,]+) bytes', output)
+            if sent:
+                trace['bytes'] = int(sent.group(1).replace(',', ''))
+        if process.returncode != 0:
+            raise RemoteCommandException('rsync to {0} failed: {1}'.format(host, output))
+        return output
+
+    @traced('chef')
+    def sync_deployment_data(self, hosts):
+        """
+        Bring the deployment data on hosts up to date with the local working
+        directory, using the configured push mode
+        """
+        if self.push_mode != 'incremental':
+            return run_task(self.push_deployment_data, hosts)
+        entries = self.deployment_tree.scan()
+        bundles = {}
+        for host in hosts:
+            changed, removed = self.deployment_tree.diff(
+                self.deployment_tree.load_manifest(host), entries)
+            if changed or removed:
+                bundles[host] = self.deployment_tree.build_bundle(changed, removed, entries)
+        if not bundles:
+            info("Deployment data already up to date on all hosts")
+            return {}
+        info("Pushing deployment data to {0} of {1} hosts...".format(len(bundles),
+                                                                     len(hosts)))
+        if self.distribution == 'tree':
+            results = self._distribute_bundles(bundles)
+        else:
+            results = run_task(self.push_deployment_bundle, bundles.keys(),
+                               bundles=bundles)
+        for host in bundles:
+            self.deployment_tree.save_manifest(host, entries)
+        return results
+
+    def _distribute_bundles(self, bundles):
+        hosts_by_bundle = {}
+        for host, bundle in bundles.iteritems():
+            hosts_by_bundle.setdefault(bundle, []).append(host)
+        for bundle, bundle_hosts in hosts_by_bundle.iteritems():
+            remote_bundle = self._remote_bundle_path(bundle)
+            rounds = plan_distribution(bundle_hosts, self.seed_groups, self.fanout)
+            info("Distributing {0} to {1} hosts in {2} rounds".format(
+                os.path.basename(bundle), len(bundle_hosts), len(rounds)))
+            run_task(self.put_deployment_bundle, rounds[0][None], bundles=bundles)
+            missing = []
+            for relays in rounds[1:]:
+                results = run_task(self.relay_deployment_bundle, relays.keys(),
+                                   remote_bundle=remote_bundle, relays=relays)
+                for failed in results.values():
+                    missing.extend(failed)
+            if missing:
+                print yellow("Relay failed, pushing directly to: " + str(missing))
+                run_task(self.put_deployment_bundle, missing, bundles=bundles)
+        return run_task(self.apply_deployment_bundle, bundles.keys(),
+                        bundles=bundles)
+
+    def forget_deployment_data(self, hosts):
+        """
+        Drop what we know about the deployment data on hosts so the next
+        incremental push sends everything
+        """
+        for host in hosts:
+            self.deployment_tree.forget_manifest(host)
+
+    @staticmethod
+    def _remote_bundle_path(bundle):
+        return '/tmp/' + os.path.basename(bundle)
+
+    def push_deployment_bundle(self, host, bundles):
+        self.put_deployment_bundle(host, bundles)
+        return self.apply_deployment_bundle(host, bundles)
+
+    @traced('chef')
+    def put_deployment_bundle(self, host, bundles):
+        get_pool().put(host, bundles[host], self._remote_bundle_path(bundles[host]))
+
+    @traced('chef')
+    def relay_deployment_bundle(self, host, remote_bundle, relays):
+        """
+        Copy a bundle from this host to its relay targets in parallel
+
+        :returns: list of targets that did not receive the bundle
+        """
+        targets = relays[host]
+        scp = ('scp -q -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null '
+               '{0} root@{1}:{0} || echo "FAILED {1}"')
+        command = ' & '.join(scp.format(remote_bundle, target) for target in targets)
+        output = self.remote_command(host, '(' + command + ' & wait)',
+                                     warn_only=True, forward_agent=True)
+        return [target for target in targets
+                if 'FAILED ' + target in output or output.return_code != 0]
+
+    @traced('chef')
+    def apply_deployment_bundle(self, host, bundles):
+        remote_bundle = self._remote_bundle_path(bundles[host])
+        self.remote_command(host, 'mkdir -p {0}'.format(self.remote_folder_path))
+        return self.remote_command(
+            host, 'tar -xzpf {0} && xargs -r -d "\\n" rm -f -- < {1}; '
+            'status=$?; rm -f {1} {0}; exit $status'
+            .format(remote_bundle, REMOVED_LIST), directory=self.remote_folder_path)
+
+    @traced('chef')
+    def pull_node_info(self, host):
+        """
+        Read the host's node file over its pooled session and hand it to the
+        node store, without reading the file back
+        """
+        hostname = self.remote_hostnames.get(host) or self.remote_command(host, 'hostname')
+        hostname = hostname.strip()
+        if self.local_hostname == hostname:
+            return
+        remote_path = self.remote_folder_path + 'chef-repo/nodes/' + hostname + '.json'
+        with span('ingest_node', 'chef', host=host) as trace:
+            try:
+                with get_pool().sftp(host) as sftp:
+                    remote_file = sftp.open(remote_path, 'rb')
+                    try:
+                        data = remote_file.read()
+                    finally:
+                        remote_file.close()
+            except IOError, e:
+                raise RemoteCommandException('Unable to read node file {0} on {1}: {2}'.format(
+                    remote_path, host, e))
+            trace['bytes'] = len(data)
+            try:
+                self.node_store.ingest(hostname, data)
+            except ValueError, e:
+                raise RemoteCommandException('Invalid node file {0} on {1}: {2}'.format(
+                    remote_path, host, e))
@@ -0,0 +1,219 @@
+from datetime import datetime
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from fabric.colors import cyan, yellow
+
+REPORT_DIR = os.path.expanduser('~/.calyptos/chef-reports')
+
+LOG_LINE = re.compile(r'^\[(?P<time>[^\]]+)\] (?P<level>[A-Z]+): (?P<message>.*)$')
+PROCESSING = re.compile(r'^Processing (?P<resource>.+?\]) action (?P<action>\S+)'
+                        r'(?: \((?P<source>.*)\))?$')
+RUN_COMPLETE = re.compile(r'^Chef Run complete in (?P<seconds>[\d.]+) seconds')
+# Lines after the last resource that end its execution
+RUN_END = ('Chef Run complete', 'Running report handlers', 'Running exception handlers',
+           'Running queued delayed notifications')
+
+
+def _parse_time(stamp):
+    # Chef logs ISO 8601 with an offset that does not change during a run
+    return time.mktime(datetime.strptime(stamp[:19], '%Y-%m-%dT%H:%M:%S').timetuple())
+
+
+def _recipe(source):
+    # "eucalyptus::install-source line 12", or "dynamically defined"
+    if source and '::' in source:
+        return source.split(' line ')[0]
+    return '(none)'
+
+
+class ResourceRun(object):
+    """
+    One resource converged by chef-client
+    """
+
+    def __init__(self, resource, action, recipe, started):
+        self.resource = resource
+        self.action = action
+        self.recipe = recipe
+        self.started = started
+        self.duration = 0.0
+        self.changed = False
+
+    def finish(self, finished):
+        self.duration = max(0.0, finished - self.started)
+
+    def to_dict(self):
+        return {'resource': self.resource, 'action': self.action, 'recipe': self.recipe,
+                'duration': self.duration, 'changed': self.changed}
+
+
+def parse_chef_log(output):
+    """
+    Split the info log of a chef-client run into the resources it
+    converged. A resource lasts until the next one starts. It changed when
+    chef logged what it did to it, up to date resources log nothing.
+
+    :returns: (list of ResourceRun in converge order, run seconds reported
+              by chef or None)
+    """
+    resources = []
+    current = None
+    last_time = None
+    total = None
+    for line in output.splitlines():
+        match = LOG_LINE.match(line.strip())
+        if not match:
+            continue
+        try:
+            now = _parse_time(match.group('time'))
+        except ValueError:
+            continue
+        last_time = now
+        message = match.group('message')
+        processing = PROCESSING.match(message)
+        if processing:
+            if current is not None:
+                current.finish(now)
+            current = ResourceRun(processing.group('resource'), processing.group('action'),
+                                  _recipe(processing.group('source')), now)
+            resources.append(current)
+            continue
+        complete = RUN_COMPLETE.match(message)
+        if complete:
+            total = float(complete.group('seconds'))
+        if message.startswith(RUN_END):
+            if current is not None:
+                current.finish(now)
+            current = None
+        elif current is not None and message.startswith(current.resource + ' '):
+            current.changed = True
+    if current is not None and last_time is not None:
+        current.finish(last_time)
+    return resources, total
+
+
+class ChefRunReport(object):
+    """
+    Timings of the chef-client runs of a deployment, per host and role,
+    aggregated per recipe and per resource
+    """
+
+    def __init__(self, branch=None):
+        self.branch = branch
+        self.runs = []
+        self.lock = threading.Lock()
+        self.path = None
+
+    def add(self, host, output, role=None):
+        resources, total = parse_chef_log(output)
+        run = {'host': host, 'role': role, 'total': total,
+               'resources': [resource.to_dict() for resource in resources]}
+        with self.lock:
+            self.runs.append(run)
+        return run
+
+    def _aggregate(self, key):
+        totals = {}
+        for run in self.runs:
+            for resource in run['resources']:
+                name = key(resource)
+                entry = totals.setdefault(name, {'seconds': 0.0, 'count': 0, 'changed': 0,
+                                                 'hosts': set(), 'roles': set()})
+                entry['seconds'] += resource['duration']
+                entry['count'] += 1
+                entry['changed'] += resource['changed']
+                entry['hosts'].add(run['host'])
+                if run['role']:
+                    entry['roles'].add(run['role'])
+        return totals
+
+    def recipes(self):
+        """
+        :returns: dict of recipe -> seconds, resources converged, resources
+                  changed, hosts and roles
+        """
+        return self._aggregate(lambda resource: resource['recipe'])
+
+    def resources(self):
+        return self._aggregate(lambda resource: resource['resource'])
+
+    def print_summary(self, top=10):
+        if not self.runs:
+            return
+        for title, totals in [('recipes', self.recipes()), ('resources', self.resources())]:
+            print cyan('Slowest chef {0}:'.format(title))
+            slowest = sorted(totals.iteritems(), key=lambda item: -item[1]['seconds'])[:top]
+            for name, entry in slowest:
+                print cyan('  {0:>9.1f}s  {1: <48} {2}/{3} changed on {4} hosts'.format(
+                    entry['seconds'], name, entry['changed'], entry['count'],
+                    len(entry['hosts'])))
+
+    def save(self, directory=REPORT_DIR):
+        """
+        Write the report, named after the time of the first save and the
+        cookbook branch. Later saves update the same file.
+
+        :returns: path of the report
+        """
+        # Roles provisioned concurrently save the same report
+        with self.lock:
+            if self.path is None:
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                name = datetime.strftime(datetime.now(), '%Y%m%d-%H%M%S')
+                if self.branch:
+                    name += '-' + re.sub(r'[^\w.-]', '_', self.branch)
+                self.path = os.path.join(directory, name + '.json')
+            with open(self.path + '.tmp', 'w') as report_file:
+                json.dump({'branch': self.branch, 'created': time.time(), 'runs': self.runs},
+                          report_file, indent=1)
+            os.rename(self.path + '.tmp', self.path)
+            return self.path
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as report_file:
+            data = json.load(report_file)
+        report = cls(data.get('branch'))
+        report.runs = data['runs']
+        return report
+
+
+def compare_reports(before, after):
+    """
+    :returns: list of (recipe, mean seconds per host before, after), the
+              recipes that slowed down the most first
+    """
+    def per_host(report):
+        return dict((recipe, entry['seconds'] / max(1, len(entry['hosts'])))
+                    for recipe, entry in report.recipes().iteritems())
+    old, new = per_host(before), per_host(after)
+    changes = [(recipe, old.get(recipe), new.get(recipe))
+               for recipe in set(old) | set(new)]
+    return sorted(changes, key=lambda change: (change[1] or 0) - (change[2] or 0))
+
+
+def main(argv):
+    if len(argv) == 1:
+        ChefRunReport.load(argv[0]).print_summary(top=25)
+        return 0
+    if len(argv) != 2:
+        print 'usage: python -m calyptos.chefreport REPORT [NEWER_REPORT]'
+        return 2
+    before, after = ChefRunReport.load(argv[0]), ChefRunReport.load(argv[1])
+    print cyan('Seconds per host, {0} -> {1}:'.format(before.branch, after.branch))
+    for recipe, old, new in compare_reports(before, after):
+        line = '  {0: <48} {1:>9} {2:>9}'.format(
+            recipe, '-' if old is None else '{0:.1f}s'.format(old),
+            '-' if new is None else '{0:.1f}s'.format(new))
+        print yellow(line) if (new or 0) > (old or 0) else line
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
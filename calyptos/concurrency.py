@@ -0,0 +1,172 @@
+from contextlib import contextmanager
+import threading
+import time
+
+from fabric.decorators import parallel
+from fabric.tasks import execute
+
+
+class ConcurrencyController(object):
+    """
+    Decides how many remote operations run at the same time.
+
+    There is one global limit, and optional per role limits that cap the
+    number of operations in flight on the hosts of a role, e.g. to be gentle
+    on the CLC. In adaptive mode the global limit starts at limit and moves
+    between min_limit and max_limit: it grows by one for every window of
+    healthy operations and is halved when SSH round trips slow down well
+    beyond the fastest seen or when too many operations fail.
+    """
+
+    def __init__(self, limit=20, adaptive=False, min_limit=1, max_limit=None,
+                 roles=None, role_hosts=None, latency_factor=3.0,
+                 latency_slack=0.05, max_failure_rate=0.2, smoothing=0.2):
+        """
+        :param limit: operations in flight at once, the starting point in
+                      adaptive mode
+        :param roles: dict of role name -> operations in flight at once on
+                      the hosts of that role
+        :param role_hosts: dict of role name -> hosts, as built by RoleBuilder
+        """
+        self.limit = max(1, int(limit))
+        self.adaptive = adaptive
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.limit, int(max_limit or self.limit * 4))
+        if not adaptive:
+            self.max_limit = self.limit
+        self.latency_factor = latency_factor
+        self.latency_slack = latency_slack
+        self.max_failure_rate = max_failure_rate
+        self.smoothing = smoothing
+        self.groups = {}
+        self.groups_of = {}
+        role_hosts = role_hosts or {}
+        for role, role_limit in (roles or {}).iteritems():
+            hosts = role_hosts.get(role)
+            if not hosts or not isinstance(hosts, (set, frozenset, list, tuple)):
+                continue
+            self.groups[role] = max(1, int(role_limit))
+            for host in hosts:
+                self.groups_of.setdefault(host, []).append(role)
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.group_in_flight = dict((role, 0) for role in self.groups)
+        self.latency = None
+        self.base_latency = None
+        self.failure_rate = 0.0
+        self.samples = 0
+        self.adjustments = []
+
+    def width(self, hosts):
+        """
+        :returns: how many of hosts a forking fabric execute() should run at
+                  once. Role limits apply when every host is in that role.
+        """
+        hosts = set(hosts)
+        width = min(self.limit, len(hosts)) or 1
+        for role, role_limit in self.groups.iteritems():
+            if all(role in self.groups_of.get(host, []) for host in hosts):
+                width = min(width, role_limit)
+        return width
+
+    def _has_room(self, host):
+        if self.in_flight >= self.limit:
+            return False
+        for role in self.groups_of.get(host, []):
+            if self.group_in_flight[role] >= self.groups[role]:
+                return False
+        return True
+
+    @contextmanager
+    def slot(self, host):
+        """
+        Hold one operation slot for host, waiting until the global and role
+        limits allow it
+        """
+        with self.condition:
+            while not self._has_room(host):
+                self.condition.wait(1)
+            self.in_flight += 1
+            for role in self.groups_of.get(host, []):
+                self.group_in_flight[role] += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                for role in self.groups_of.get(host, []):
+                    self.group_in_flight[role] -= 1
+                self.condition.notify_all()
+
+    def observe(self, latency=None, failed=False):
+        """
+        Feed the outcome of one SSH operation to the adaptive limit
+
+        :param latency: round trip time in seconds, None if not measured
+        :param failed: True if the operation failed at the SSH level
+        """
+        if not self.adaptive:
+            return
+        with self.condition:
+            self.samples += 1
+            self.failure_rate += self.smoothing * ((1.0 if failed else 0.0) -
+                                                   self.failure_rate)
+            if latency is not None:
+                if self.latency is None:
+                    self.latency = latency
+                else:
+                    self.latency += self.smoothing * (latency - self.latency)
+                if self.base_latency is None or latency < self.base_latency:
+                    self.base_latency = latency
+            # Only react once per window so a single burst is not counted twice
+            if self.samples < max(1, self.limit // 2):
+                return
+            if self._congested():
+                self._set_limit(max(self.min_limit, self.limit // 2))
+            elif self.samples >= self.limit:
+                self._set_limit(min(self.max_limit, self.limit + 1))
+
+    def _congested(self):
+        if self.failure_rate > self.max_failure_rate:
+            return True
+        if self.latency is None or self.base_latency is None:
+            return False
+        return self.latency > (self.base_latency * self.latency_factor +
+                               self.latency_slack)
+
+    def _set_limit(self, limit):
+        self.samples = 0
+        if limit != self.limit:
+            self.adjustments.append((time.time(), self.limit, limit))
+            self.limit = limit
+            self.condition.notify_all()
+
+
+def parallel_execute(task, hosts, *args, **kwargs):
+    """
+    fabric execute() of task on hosts in parallel, running as many hosts at
+    once as the controller allows
+    """
+    hosts = list(hosts)
+    pool_size = get_controller().width(hosts)
+    return execute(parallel(pool_size=pool_size)(task), *args, hosts=hosts,
+                   **kwargs)
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def configure_concurrency(**kwargs):
+    global _controller
+    with _controller_lock:
+        _controller = ConcurrencyController(**kwargs)
+        return _controller
+
+
+def get_controller():
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = ConcurrencyController()
+        return _controller
@@ -0,0 +1,129 @@
+import errno
+import hashlib
+import os
+import shutil
+import subprocess
+
+COOKBOOK_CACHE_DIR = os.path.expanduser('~/.calyptos/cookbooks')
+
+
+def _git(directory, *args):
+    process = subprocess.Popen(['git'] + list(args), cwd=directory,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output = process.communicate()[0]
+    return output if process.returncode == 0 else None
+
+
+def link_tree(source, target):
+    """
+    Recreate the tree under source at target with hard links, copying files
+    where the two are on different file systems
+    """
+    for dirpath, dirnames, filenames in os.walk(source):
+        destination = os.path.join(target, os.path.relpath(dirpath, source))
+        if not os.path.isdir(destination):
+            os.makedirs(destination)
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), os.path.join(destination, filename))
+                continue
+            try:
+                os.link(path, os.path.join(destination, filename))
+            except OSError, e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+                shutil.copy2(path, os.path.join(destination, filename))
+
+
+class CookbookCache(object):
+    """
+    Vendored cookbooks, kept per resolved Berksfile.
+
+    An entry is keyed by the Berksfile, its Berksfile.lock and the commit
+    the cookbook repository holding them is at. A hit is linked into place
+    instead of running berks vendor. The least recently used entries beyond
+    max_entries are removed.
+    """
+
+    def __init__(self, root=COOKBOOK_CACHE_DIR, max_entries=5):
+        self.root = root
+        self.max_entries = max_entries
+
+    def key(self, berksfile):
+        """
+        :returns: cache key for berksfile, None when the cookbooks can not
+                  be cached because the repository has uncommitted changes
+                  or is not a git repository
+        """
+        directory = os.path.dirname(os.path.abspath(berksfile))
+        commit = _git(directory, 'rev-parse', 'HEAD')
+        status = _git(directory, 'status', '--porcelain', '--untracked-files=no')
+        if commit is None or status is None:
+            return None
+        # berks vendor updates a tracked lock file, its content is hashed below
+        if [line for line in status.splitlines() if not line.endswith('Berksfile.lock')]:
+            return None
+        digest = hashlib.sha1(commit.strip())
+        for name in [berksfile, berksfile + '.lock']:
+            if os.path.exists(name):
+                with open(name, 'rb') as berks_file:
+                    digest.update('\0' + os.path.basename(name) + '\0' + berks_file.read())
+        return digest.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def materialize(self, key, cookbook_path):
+        """
+        Replace cookbook_path with the cached cookbooks of key
+
+        :returns: True on a hit, False if key is not cached
+        """
+        if key is None or not os.path.isdir(self._entry(key)):
+            return False
+        entry = self._entry(key)
+        if os.path.exists(cookbook_path):
+            shutil.rmtree(cookbook_path)
+        link_tree(entry, cookbook_path)
+        # The entry's mtime records when it was last used
+        os.utime(entry, None)
+        return True
+
+    def store(self, key, cookbook_path):
+        """
+        Add the cookbooks vendored at cookbook_path to the cache as key
+        """
+        if key is None or os.path.isdir(self._entry(key)):
+            return
+        entry = self._entry(key)
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        partial = '{0}.{1}.tmp'.format(entry, os.getpid())
+        link_tree(cookbook_path, partial)
+        os.rename(partial, entry)
+        self.evict()
+
+    def evict(self):
+        entries = [os.path.join(self.root, name) for name in os.listdir(self.root)
+                   if not name.endswith('.tmp')]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for entry in entries[self.max_entries:]:
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def vendor(self, berksfile, cookbook_path, vendor):
+        """
+        Put the cookbooks of berksfile at cookbook_path, calling
+        vendor(berksfile, cookbook_path) on a miss
+
+        :returns: True if the cookbooks came from the cache
+        """
+        if self.materialize(self.key(berksfile), cookbook_path):
+            return True
+        if os.path.exists(cookbook_path):
+            shutil.rmtree(cookbook_path)
+        vendor(berksfile, cookbook_path)
+        # Keyed after vendoring, berks creates or updates the lock file
+        self.store(self.key(berksfile), cookbook_path)
+        return False
+
@@ -0,0 +1,233 @@
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tarfile
+import tempfile
+import threading
+
+
+STATE_DIR = os.path.expanduser('~/.calyptos/state')
+REMOVED_LIST = '.calyptos-removed'
+
+
+class DeploymentTree(object):
+    """
+    Content addressed view of the local deployment directory.
+
+    File digests are cached by path, size and mtime (also across invocations)
+    so only files that changed since the last scan are hashed again. Each
+    host's manifest points at the tree it was last sent, trees are stored once
+    no matter how many hosts hold them. Manifests are kept per local root and
+    remote path, a host can hold several deployments.
+    """
+
+    def __init__(self, root='./', state_dir=STATE_DIR, remote_path=''):
+        self.root = os.path.abspath(root)
+        self.state_dir = state_dir
+        self.manifest_key = hashlib.sha1(self.root + '\0' + remote_path).hexdigest()[:16]
+        self.tree_dir = os.path.join(state_dir, 'trees')
+        self.hash_cache_file = os.path.join(
+            state_dir, 'local-' + hashlib.sha1(self.root).hexdigest() + '.hashes')
+        self.lock = threading.RLock()
+        self.hash_cache = None
+        self.bundle_dir = None
+        self.bundles = {}
+        self.trees = {}
+
+    def _ensure_dirs(self):
+        for directory in [self.state_dir, self.tree_dir]:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+    def _load_hash_cache(self):
+        if self.hash_cache is None:
+            try:
+                with open(self.hash_cache_file) as cache_file:
+                    self.hash_cache = json.load(cache_file)
+            except (IOError, ValueError):
+                self.hash_cache = {}
+        return self.hash_cache
+
+    @staticmethod
+    def _hash_file(path):
+        digest = hashlib.sha1()
+        with open(path, 'rb') as handle:
+            for block in iter(lambda: handle.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def scan(self):
+        """
+        :returns: dict of relative path -> 'sha1:mode' for every regular file
+                  under the root, symlinks are skipped just like rsync does
+                  without --links
+        """
+        with self.lock:
+            cache = self._load_hash_cache()
+            seen = {}
+            entries = {}
+            for dirpath, dirnames, filenames in os.walk(self.root):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    info = os.lstat(path)
+                    if not stat.S_ISREG(info.st_mode):
+                        continue
+                    relpath = os.path.relpath(path, self.root)
+                    key = [info.st_size, info.st_mtime]
+                    cached = cache.get(relpath)
+                    if cached and cached[:2] == key:
+                        digest = cached[2]
+                    else:
+                        digest = self._hash_file(path)
+                    seen[relpath] = key + [digest]
+                    entries[relpath] = '{0}:{1:o}'.format(digest, stat.S_IMODE(info.st_mode))
+            if seen != cache:
+                self._ensure_dirs()
+                self.hash_cache = seen
+                with open(self.hash_cache_file, 'w') as cache_file:
+                    json.dump(seen, cache_file)
+            return entries
+
+    @staticmethod
+    def tree_digest(entries):
+        digest = hashlib.sha1()
+        for relpath in sorted(entries):
+            digest.update(relpath + '\0' + entries[relpath] + '\n')
+        return digest.hexdigest()
+
+    def _manifest_path(self, host):
+        return os.path.join(self.state_dir,
+                            '{0}-{1}.manifest'.format(host, self.manifest_key))
+
+    def load_manifest(self, host):
+        """
+        :returns: the entries last sent to host, empty if unknown
+        """
+        try:
+            with open(self._manifest_path(host)) as manifest_file:
+                tree = json.load(manifest_file)['tree']
+        except (IOError, ValueError, KeyError):
+            return {}
+        with self.lock:
+            if tree not in self.trees:
+                try:
+                    with gzip.open(os.path.join(self.tree_dir, tree + '.json.gz')) as tree_file:
+                        self.trees[tree] = json.loads(tree_file.read())
+                except (IOError, ValueError):
+                    return {}
+            return self.trees[tree]
+
+    def save_manifest(self, host, entries):
+        tree = self.tree_digest(entries)
+        with self.lock:
+            self._ensure_dirs()
+            tree_path = os.path.join(self.tree_dir, tree + '.json.gz')
+            if not os.path.exists(tree_path):
+                with gzip.open(tree_path, 'wb') as tree_file:
+                    tree_file.write(json.dumps(entries))
+            self.trees[tree] = entries
+        with open(self._manifest_path(host), 'w') as manifest_file:
+            json.dump({'tree': tree}, manifest_file)
+
+    def forget_manifest(self, host):
+        try:
+            os.remove(self._manifest_path(host))
+        except OSError:
+            pass
+
+    @staticmethod
+    def diff(held, entries):
+        """
+        :returns: (paths to send, paths to remove) to turn held into entries
+        """
+        changed = sorted(relpath for relpath, entry in entries.iteritems()
+                         if held.get(relpath) != entry)
+        removed = sorted(relpath for relpath in held if relpath not in entries)
+        return changed, removed
+
+    def build_bundle(self, changed, removed, entries):
+        """
+        Pack the changed files and the list of removed files into one
+        compressed tarball. Hosts that need the same delta share the bundle.
+
+        :param entries: the scan the delta was computed from, the digests of
+                        the changed files are part of the bundle's key so a
+                        file that changed again gets a new bundle
+        :returns: local path of the bundle
+        """
+        key = hashlib.sha1(json.dumps([[(relpath, entries[relpath]) for relpath in changed],
+                                       removed])).hexdigest()
+        with self.lock:
+            if key in self.bundles:
+                return self.bundles[key]
+            if self.bundle_dir is None:
+                self.bundle_dir = tempfile.mkdtemp(prefix='calyptos-bundles-')
+                atexit.register(shutil.rmtree, self.bundle_dir, True)
+            bundle_path = os.path.join(self.bundle_dir, key + '.tar.gz')
+            removed_path = os.path.join(self.bundle_dir, key + '.removed')
+            with open(removed_path, 'w') as removed_file:
+                removed_file.write(''.join(relpath + '\n' for relpath in removed))
+            bundle = tarfile.open(bundle_path, 'w:gz')
+            try:
+                for relpath in changed:
+                    bundle.add(os.path.join(self.root, relpath), arcname=relpath,
+                               recursive=False)
+                bundle.add(removed_path, arcname=REMOVED_LIST)
+            finally:
+                bundle.close()
+            self.bundles[key] = bundle_path
+            return bundle_path
+
+
+def plan_distribution(hosts, seed_groups=None, fanout=2):
+    """
+    Plan a tree shaped distribution of one bundle to hosts. The controller
+    sends to one seed per group (the first fanout hosts if there are no
+    groups), after that every host holding the bundle relays it to up to
+    fanout hosts per round, preferring hosts of its own group. The number of
+    rounds grows with the logarithm of the number of hosts.
+
+    :param hosts: hosts that need the bundle
+    :param seed_groups: iterable of host sets, e.g. the clusters
+    :param fanout: number of hosts each holder sends to per round
+    :returns: list of rounds, each a dict of source -> list of targets where
+              a source of None is the controller
+    """
+    fanout = max(1, int(fanout))
+    group_of = {}
+    for index, group in enumerate(seed_groups or []):
+        for host in group:
+            group_of.setdefault(host, index)
+    remaining = sorted(hosts, key=lambda host: (group_of.get(host, -1), host))
+    seeds = []
+    seen_groups = set()
+    for host in remaining:
+        group = group_of.get(host)
+        if group is not None and group not in seen_groups:
+            seen_groups.add(group)
+            seeds.append(host)
+    if not seeds:
+        seeds = remaining[:fanout]
+    rounds = [{None: seeds}]
+    holders = list(seeds)
+    remaining = [host for host in remaining if host not in seeds]
+    while remaining:
+        relays = {}
+        for holder in holders:
+            targets = [host for host in remaining
+                       if group_of.get(host) == group_of.get(holder)][:fanout]
+            if len(targets) < fanout:
+                targets += [host for host in remaining
+                            if host not in targets][:fanout - len(targets)]
+            if not targets:
+                break
+            relays[holder] = targets
+            remaining = [host for host in remaining if host not in targets]
+        rounds.append(relays)
+        for targets in relays.values():
+            holders.extend(targets)
+    return rounds
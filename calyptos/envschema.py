@@ -0,0 +1,260 @@
+"""
+Structural validation of environment.yml.
+
+The schema below is compiled once into a plain Python check function. The
+compiled code is cached on disk, keyed by the hash of the generated source,
+so most runs skip compiling entirely. Every error is reported in a single pass and
+points at the line of environment.yml it was found on.
+
+Can be used as a pre-commit hook:
+
+    python -m calyptos.envschema environment.yml
+"""
+import hashlib
+import marshal
+import os
+import sys
+import threading
+
+import yaml
+
+
+class Optional(object):
+    """
+    Marks a schema key that may be left out
+    """
+
+    def __init__(self, key):
+        self.key = key
+
+    def __repr__(self):
+        return 'Optional({0!r})'.format(self.key)
+
+
+SCHEMA = {
+    'description': str,
+    'name': str,
+    Optional('cookbook_versions'): dict,
+    Optional('override_attributes'): dict,
+    'default_attributes': {
+        'eucalyptus': {
+            'network': {
+                'mode': str,
+                Optional('config-json'): {
+                    'PublicIps': list,
+                    Optional('Clusters'): list,
+                    Optional('InstanceDnsServers'): list,
+                    Optional('Mode'): str,
+                },
+                'bridge-interface': str,
+                Optional('bridged-nic'): str,
+                Optional('public-interface'): str,
+                Optional('private-interface'): str,
+                Optional('nc-router'): str,
+            },
+            'topology': {
+                'clusters': dict,
+                'clc-1': str,
+                Optional('walrus'): str,
+                'user-facing': list,
+                Optional('riakcs'): {
+                    'access-key': str,
+                    'admin-email': str,
+                    'admin-name': str,
+                    'endpoint': str,
+                    'port': int,
+                    'secret-key': str,
+                },
+            },
+            'eucalyptus-repo': str,
+            'euca2ools-repo': str,
+            Optional('default-img-url'): str,
+            Optional('enterprise-repo'): str,
+            Optional('init-script-url'): str,
+            Optional('post-script-url'): str,
+            Optional('yum-options'): str,
+            Optional('nc'): dict,
+            Optional('install-imaging-worker'): str,
+            Optional('install-load-balancer'): str,
+            Optional('install-type'): str,
+            Optional('log-level'): str,
+            Optional('source-branch'): str,
+            Optional('source-repo'): str,
+            Optional('system-properties'): dict,
+        },
+    },
+}
+
+CACHE_DIR = os.path.expanduser(os.path.join('~', '.cache', 'calyptos'))
+
+
+def _key_name(key):
+    return key.key if isinstance(key, Optional) else key
+
+
+def _canonical(spec):
+    # Stable text form of a schema, independent of dict ordering
+    if isinstance(spec, dict):
+        return '{' + ','.join(sorted(repr(key) + ':' + _canonical(value)
+                                     for key, value in spec.iteritems())) + '}'
+    return spec.__name__
+
+
+def schema_hash(spec):
+    return hashlib.sha1(_canonical(spec)).hexdigest()
+
+
+class _Generator(object):
+    """
+    Turns a schema into the source of check(node, errors), one nested block
+    of isinstance checks and key lookups per mapping. Errors are appended as
+    (path, message) tuples.
+    """
+
+    def __init__(self):
+        self.lines = ['def check(node_0, errors):']
+        self.variables = 0
+
+    def emit(self, depth, line):
+        self.lines.append('    ' * depth + line)
+
+    def mapping(self, spec, variable, path, depth):
+        name = path[-1] if path else 'environment.yml'
+        self.emit(depth, 'if not isinstance({0}, dict):'.format(variable))
+        self.emit(depth + 1, 'errors.append(({0!r}, {1!r}))'.format(
+            path, "Invalid environment.yml value(s) for '{0}'.".format(name)))
+        self.emit(depth, 'else:')
+        known = set()
+        for key in sorted(spec, key=lambda key: str(_key_name(key))):
+            name = _key_name(key)
+            known.add(name)
+            self.variables += 1
+            child = 'node_{0}'.format(self.variables)
+            self.emit(depth + 1, 'if {0!r} in {1}:'.format(name, variable))
+            self.emit(depth + 2, '{0} = {1}[{2!r}]'.format(child, variable, name))
+            self.value(spec[key], child, path + (name,), depth + 2)
+            if not isinstance(key, Optional):
+                self.emit(depth + 1, 'else:')
+                self.emit(depth + 2, 'errors.append(({0!r}, {1!r}))'.format(
+                    path, "Missing key: '{0}'".format(name)))
+        self.emit(depth + 1, 'for key in {0}:'.format(variable))
+        self.emit(depth + 2, 'if key not in {0!r}:'.format(frozenset(known)))
+        self.emit(depth + 3, 'errors.append(({0!r} + (key,), "Unexpected key: %r" % key))'.format(
+            path))
+
+    def value(self, spec, variable, path, depth):
+        if isinstance(spec, dict):
+            self.mapping(spec, variable, path, depth)
+            return
+        self.emit(depth, 'if not isinstance({0}, {1}):'.format(variable, spec.__name__))
+        self.emit(depth + 1, 'errors.append(({0!r}, {1!r}))'.format(
+            path, "Invalid environment.yml value(s) for '{0}'.".format(path[-1])))
+
+
+def generate_source(spec):
+    generator = _Generator()
+    generator.mapping(spec, 'node_0', (), 1)
+    return '\n'.join(generator.lines) + '\n'
+
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def _load_code(spec, cache_dir):
+    # Keyed by the source, not the schema, so a changed generator does not
+    # pick up code compiled by an older one
+    source = generate_source(spec)
+    digest = hashlib.sha1(source).hexdigest()
+    # marshal output is only readable by the same Python version
+    name = 'envschema-{0}-py{1}{2}.marshal'.format(digest, *sys.version_info[:2])
+    path = os.path.join(cache_dir, name) if cache_dir else None
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'rb') as cache_file:
+                return marshal.load(cache_file)
+        except (EOFError, ValueError, TypeError, IOError):
+            pass
+    code = compile(source, '<envschema {0}>'.format(digest[:8]), 'exec')
+    if path:
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            partial = path + '.' + str(os.getpid())
+            with open(partial, 'wb') as cache_file:
+                marshal.dump(code, cache_file)
+            os.rename(partial, path)
+        except (IOError, OSError):
+            # Only a cache, compile again next time
+            pass
+    return code
+
+
+def compile_schema(spec=SCHEMA, cache_dir=None):
+    """
+    :returns: check(data, errors) function for spec, compiled once per
+              process and cached in cache_dir, CACHE_DIR by default, across
+              processes
+    """
+    digest = schema_hash(spec)
+    with _compiled_lock:
+        if digest not in _compiled:
+            namespace = {}
+            exec _load_code(spec, cache_dir or CACHE_DIR) in namespace
+            _compiled[digest] = namespace['check']
+        return _compiled[digest]
+
+
+def find_line(node, path):
+    """
+    :param node: yaml node as returned by yaml.compose
+    :returns: 1-based line of the deepest part of path found under node
+    """
+    line = node.start_mark.line
+    for key in path:
+        if not isinstance(node, yaml.MappingNode):
+            break
+        for key_node, value_node in node.value:
+            if key_node.value == key:
+                node = value_node
+                line = key_node.start_mark.line
+                break
+        else:
+            break
+    return line + 1
+
+
+def validate_environment(data, environment_file=None, spec=SCHEMA):
+    """
+    :param data: the parsed environment
+    :param environment_file: file data was parsed from, used to look up the
+                             line of every error
+    :returns: list of (line, message), line is None when unknown
+    """
+    errors = []
+    compile_schema(spec)(data, errors)
+    if not errors:
+        return []
+    root = None
+    if environment_file:
+        # Only composed when something is wrong, a clean file is never
+        # parsed a second time
+        with open(environment_file) as env_file:
+            root = yaml.compose(env_file)
+    return [(find_line(root, path) if root is not None else None, message)
+            for path, message in errors]
+
+
+def main(argv):
+    status = 0
+    for environment_file in argv:
+        with open(environment_file) as env_file:
+            data = yaml.load(env_file)
+        for line, message in validate_environment(data, environment_file):
+            print '{0}:{1}: {2}'.format(environment_file, line, message)
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:] or ['environment.yml']))
@@ -0,0 +1,90 @@
+import threading
+
+from calyptos.concurrency import parallel_execute
+from calyptos.sshpool import get_pool, imap_hosts, reset_pool_after_fork
+from fabric.state import env
+
+
+def run_command(host, command, timeout=None, forward_agent=False):
+    return get_pool().run(host, command, timeout=timeout,
+                          forward_agent=forward_agent)
+
+
+class Executor(object):
+    """
+    Runs task(host, *args, **kwargs) for a set of hosts.
+
+    Results can be consumed as a stream of (host, result) pairs while hosts
+    finish, or all at once as a dict of host -> result. Exceptions raised by
+    the task are returned as the host's result instead of being raised.
+    """
+    name = None
+
+    def stream(self, task, hosts, *args, **kwargs):
+        raise NotImplementedError
+
+    def run(self, task, hosts, *args, **kwargs):
+        return dict(self.stream(task, hosts, *args, **kwargs))
+
+    def stream_command(self, command, hosts, timeout=None):
+        return self.stream(run_command, hosts, command, timeout=timeout)
+
+    def run_command(self, command, hosts, timeout=None):
+        return dict(self.stream_command(command, hosts, timeout=timeout))
+
+
+class ThreadedExecutor(Executor):
+    """
+    Non forking executor, hosts are driven by threads sharing the pooled SSH
+    sessions and results stream back as each host finishes
+    """
+    name = 'threaded'
+
+    def stream(self, task, hosts, *args, **kwargs):
+        return imap_hosts(lambda host: task(host, *args, **kwargs), hosts)
+
+
+class ForkingExecutor(Executor):
+    """
+    Runs every host in a process forked by fabric's parallel execute(), the
+    results are only available once all hosts are done
+    """
+    name = 'fabric'
+
+    def stream(self, task, hosts, *args, **kwargs):
+        hosts = list(hosts)
+        if not hosts:
+            return
+
+        def forked():
+            reset_pool_after_fork()
+            try:
+                return task(env.host_string, *args, **kwargs)
+            except (Exception, SystemExit) as e:
+                return e
+        forked.__name__ = getattr(task, '__name__', 'task')
+        results = parallel_execute(forked, hosts)
+        for host in hosts:
+            yield host, results.get(host)
+
+
+EXECUTORS = dict((executor.name, executor)
+                 for executor in [ThreadedExecutor, ForkingExecutor])
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def configure_executor(name='threaded'):
+    global _executor
+    with _executor_lock:
+        _executor = EXECUTORS[name]()
+        return _executor
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadedExecutor()
+        return _executor
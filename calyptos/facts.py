@@ -0,0 +1,199 @@
+import threading
+
+from calyptos.executor import get_executor
+from calyptos.probes import run_probes
+
+
+# Services whose state is recorded for every host
+SERVICES = ['eucalyptus-cloud', 'eucalyptus-cc', 'eucalyptus-nc', 'libvirtd',
+            'ntpd']
+# Paths whose file system is looked up for every host
+PATHS = ['/var/lib/eucalyptus', '/var/log/eucalyptus']
+
+FACT_PROBES = {
+    'os_release': 'cat /etc/system-release',
+    'arch': 'uname -m',
+    'cpuinfo': 'cat /proc/cpuinfo',
+    'memory': 'free',
+    'disks': 'df -P -T --sync --block-size G',
+    'path_mounts': 'for path in ' + ' '.join(PATHS) + '; do '
+                   'echo "$path $(df -P $path 2>/dev/null | awk \'NR > 1 {print $NF}\')"; '
+                   'done',
+    'listening': 'netstat -lnp',
+    'packages': 'rpm --query --all --queryformat "%{NAME}\\n"',
+    'runlevels': 'chkconfig --list',
+}
+for service in SERVICES:
+    FACT_PROBES['service_' + service] = 'service ' + service + ' status'
+
+
+class HostFacts(object):
+    """
+    Structured facts about one host, parsed from the output of FACT_PROBES.
+    A host that could not be probed has error set and empty facts.
+    """
+
+    def __init__(self, host, outputs=None, error=None):
+        outputs = outputs or {}
+        self.host = host
+        self.error = error
+        self.os_release = outputs.get('os_release', '')
+        self.arch = outputs.get('arch', '')
+        self.cpu_count, self.cpu_models, self.cpu_flags = \
+            self._parse_cpuinfo(outputs.get('cpuinfo', ''))
+        self.memory = self._parse_free(outputs.get('memory', ''))
+        self.disks = self._parse_df(outputs.get('disks', ''))
+        self.path_mounts = dict(line.split(None, 1)
+                                for line in outputs.get('path_mounts', '').splitlines()
+                                if len(line.split()) == 2)
+        self.netstat = outputs.get('listening', '')
+        self.listening = self._parse_netstat(self.netstat)
+        self.packages = set(outputs.get('packages', '').split())
+        self.runlevels = self._parse_chkconfig(outputs.get('runlevels', ''))
+        self.services = dict((service, outputs.get('service_' + service, ''))
+                             for service in SERVICES)
+
+    @staticmethod
+    def _parse_cpuinfo(cpuinfo):
+        count = 0
+        models = []
+        flags = set()
+        for line in cpuinfo.splitlines():
+            key, _, value = line.partition(':')
+            key = key.strip()
+            if key == 'processor':
+                count += 1
+            elif key == 'model name':
+                models.append(value.strip())
+            elif key == 'flags' and not flags:
+                flags = set(value.split())
+        return count, models, flags
+
+    @staticmethod
+    def _parse_free(free):
+        """
+        :returns: dict of column -> KB of the Mem: line, plus 'available'
+                  which also counts buffers and cache on older procps
+        """
+        lines = free.splitlines()
+        if not lines:
+            return {}
+        columns = lines[0].split()
+        memory = {}
+        for line in lines[1:]:
+            fields = line.split()
+            if fields and fields[0] == 'Mem:':
+                memory = dict(zip(columns, [int(value) for value in fields[1:]]))
+            elif line.startswith('-/+ buffers/cache:') and len(fields) == 4:
+                memory['available'] = int(fields[3])
+        if memory and 'available' not in memory:
+            memory['available'] = memory.get('free', 0)
+        return memory
+
+    @staticmethod
+    def _parse_df(df):
+        """
+        :returns: dict of mount point -> file system details, sizes in GB
+        """
+        disks = {}
+        for line in df.splitlines()[1:]:
+            fields = line.split(None, 6)
+            if len(fields) < 7:
+                continue
+            try:
+                disks[fields[6]] = {'device': fields[0],
+                                    'type': fields[1],
+                                    'size': int(fields[2].rstrip('G')),
+                                    'used': int(fields[3].rstrip('G')),
+                                    'available': int(fields[4].rstrip('G')),
+                                    'use_percent': int(fields[5].rstrip('%'))}
+            except ValueError:
+                continue
+        return disks
+
+    @staticmethod
+    def _parse_netstat(netstat):
+        listening = []
+        for line in netstat.splitlines():
+            fields = line.split()
+            if not fields or not fields[0].startswith(('tcp', 'udp')):
+                continue
+            address, _, port = fields[3].rpartition(':')
+            program = fields[-1] if '/' in fields[-1] else None
+            listening.append({'proto': fields[0], 'address': address,
+                              'port': int(port) if port.isdigit() else None,
+                              'program': program})
+        return listening
+
+    @staticmethod
+    def _parse_chkconfig(chkconfig):
+        runlevels = {}
+        for line in chkconfig.splitlines():
+            fields = line.split()
+            if len(fields) < 2 or not all(':' in field for field in fields[1:]):
+                continue
+            runlevels[fields[0]] = set(field.split(':')[0] for field in fields[1:]
+                                       if field.endswith(':on'))
+        return runlevels
+
+    def disk_for(self, path):
+        """
+        :returns: details of the file system holding path, None if unknown
+        """
+        return self.disks.get(self.path_mounts.get(path))
+
+    def listening_on(self, proto, port):
+        return any(entry['proto'].startswith(proto) and entry['port'] == port
+                   for entry in self.listening)
+
+    def service_running(self, service):
+        return 'running' in self.services.get(service, '')
+
+    def has_package(self, package):
+        return package in self.packages
+
+
+class FactsCache(object):
+    """
+    Facts gathered once per run and shared by every plugin. Hosts missing
+    from the cache are probed together in one parallel sweep, with one round
+    trip per host.
+    """
+
+    def __init__(self):
+        self.facts = {}
+        self.lock = threading.Lock()
+
+    def gather(self, hosts):
+        with self.lock:
+            missing = [host for host in hosts if host not in self.facts]
+            if not missing:
+                return
+            results = get_executor().run(run_probes, missing, FACT_PROBES)
+            for host, outputs in results.iteritems():
+                if isinstance(outputs, BaseException):
+                    self.facts[host] = HostFacts(host, error=outputs)
+                else:
+                    self.facts[host] = HostFacts(host, outputs)
+
+    def get(self, hosts):
+        """
+        :returns: dict of host -> HostFacts
+        """
+        hosts = list(hosts)
+        self.gather(hosts)
+        return dict((host, self.facts[host]) for host in hosts)
+
+    def invalidate(self, hosts=None):
+        with self.lock:
+            if hosts is None:
+                self.facts = {}
+            for host in hosts or []:
+                self.facts.pop(host, None)
+
+
+_cache = FactsCache()
+
+
+def get_facts_cache():
+    return _cache
@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+
+# Attributes of a node calyptos reads, kept in its record
+NODE_ATTRIBUTES = [('normal', 'eucalyptus', 'cloud-keys')]
+
+
+class FailedToFindNodeException(Exception):
+    pass
+
+
+def node_addresses(document):
+    """
+    :returns: list of the addresses and names a node can be looked up by
+    """
+    auto = document.get('automatic', {})
+    addresses = [auto.get('ipaddress')]
+    network = auto.get('network')
+    if network:
+        for interface in network.get('interfaces', {}).itervalues():
+            addresses.extend(interface.get('addresses', {}))
+    addresses.extend([auto.get('hostname'), auto.get('fqdn'), document.get('name')])
+    return [address for address in addresses if address]
+
+
+class NodeRecord(object):
+    """
+    What calyptos uses of a node document: its addresses, run list and
+    NODE_ATTRIBUTES. The ohai data of the full document is not kept.
+    """
+    __slots__ = ['name', 'addresses', 'run_list', 'attributes']
+
+    def __init__(self, name, document):
+        self.name = name
+        self.addresses = node_addresses(document)
+        self.run_list = list(document.get('run_list', []))
+        self.attributes = {}
+        for path in NODE_ATTRIBUTES:
+            value = document
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            if value is not None:
+                self.attributes[path] = value
+
+    def attribute(self, *path):
+        return self.attributes.get(path)
+
+
+class NodeStore(object):
+    """
+    The node files of the local chef repo, indexed by every address and
+    hostname of each node.
+
+    A file is only parsed when it is new or its mtime or size changed since
+    it was last read, so refresh() costs a directory listing and a stat per
+    node. Only a NodeRecord of each node is held, full documents are read
+    from disk when asked for. Writes go through the store and keep the
+    index up to date without reading the file back.
+    """
+
+    def __init__(self, node_dir='chef-repo/nodes'):
+        self.node_dir = node_dir
+        self.lock = threading.RLock()
+        self.records = {}
+        self.stamps = {}
+        self.addresses = {}
+        self.node_index = {}
+
+    def _path(self, name):
+        return os.path.join(self.node_dir, name + '.json')
+
+    @staticmethod
+    def _stamp(path):
+        info = os.stat(path)
+        return info.st_mtime, info.st_size
+
+    def _index(self, name, record):
+        for address in self.node_index.pop(name, []):
+            if self.addresses.get(address) == name:
+                del self.addresses[address]
+        if record is None:
+            return
+        for address in record.addresses:
+            self.addresses[address] = name
+        self.node_index[name] = record.addresses
+
+    def _forget(self, name):
+        self._index(name, None)
+        self.records.pop(name, None)
+        self.stamps.pop(name, None)
+
+    def _read(self, path):
+        with open(path) as node_file:
+            try:
+                return json.load(node_file)
+            except ValueError:
+                print 'Unable to read: ' + path
+                raise
+
+    def load(self, path):
+        """
+        Read the node file at path into the store
+
+        :returns: name of the node
+        """
+        name = os.path.splitext(os.path.basename(path))[0]
+        with self.lock:
+            stamp = self._stamp(path)
+            record = NodeRecord(name, self._read(path))
+            self.records[name] = record
+            self.stamps[name] = stamp
+            self._index(name, record)
+        return name
+
+    def ingest(self, name, data):
+        """
+        Store data, the text of a node file obtained elsewhere, as the node
+        file of name
+
+        :returns: name
+        """
+        self._write(name, data, NodeRecord(name, json.loads(data)))
+        return name
+
+    def refresh(self):
+        """
+        Pick up node files that were added, changed or removed on disk
+        """
+        with self.lock:
+            try:
+                filenames = os.listdir(self.node_dir)
+            except OSError:
+                filenames = []
+            present = set()
+            for filename in filenames:
+                if not filename.endswith('.json'):
+                    continue
+                name = filename[:-len('.json')]
+                path = os.path.join(self.node_dir, filename)
+                try:
+                    stamp = self._stamp(path)
+                except OSError:
+                    continue
+                present.add(name)
+                if self.stamps.get(name) != stamp:
+                    self.load(path)
+            for name in set(self.records) - present:
+                self._forget(name)
+
+    def find(self, address):
+        """
+        :returns: name of the node with address or hostname
+        """
+        with self.lock:
+            name = self.addresses.get(address)
+            if name is None:
+                # The node may have been written since the last refresh
+                self.refresh()
+                name = self.addresses.get(address)
+        if name is None:
+            raise FailedToFindNodeException("Unable to find node: " + address)
+        return name
+
+    def record(self, name):
+        with self.lock:
+            return self.records[name]
+
+    def document(self, name):
+        """
+        :returns: the full node document, read from its file
+        """
+        return self._read(self._path(name))
+
+    def _write(self, name, data, record):
+        with self.lock:
+            path = self._path(name)
+            with open(path + '.tmp', 'w') as node_file:
+                node_file.write(data)
+            os.rename(path + '.tmp', path)
+            self.records[name] = record
+            self.stamps[name] = self._stamp(path)
+            self._index(name, record)
+
+    def save(self, name, document):
+        self._write(name, json.dumps(document, indent=4, sort_keys=True,
+                                     separators=(',', ': ')),
+                    NodeRecord(name, document))
+
+    def set_run_list(self, name, run_list):
+        """
+        Write run_list to the node, unless it already has that run list
+        """
+        with self.lock:
+            if self.records[name].run_list == list(run_list):
+                return
+            document = self.document(name)
+            document['run_list'] = list(run_list)
+            self.save(name, document)
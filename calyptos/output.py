@@ -0,0 +1,86 @@
+from contextlib import contextmanager
+import sys
+import threading
+
+
+class ThreadedOutput(object):
+    """
+    Stand-in for sys.stdout that keeps the output of threads which capture
+    it apart, so concurrent work can be printed as one block per owner.
+    Threads that do not capture write straight through.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    @property
+    def buffer(self):
+        return getattr(self.local, 'buffer', None)
+
+    def write(self, data):
+        buffer = self.buffer
+        if buffer is not None:
+            buffer.append(data)
+        else:
+            with self.lock:
+                self.stream.write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self.buffer is None:
+            self.stream.flush()
+
+    def emit(self, chunks):
+        # Write a captured block in one piece
+        with self.lock:
+            self.stream.write(''.join(chunks))
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def install():
+    if not isinstance(sys.stdout, ThreadedOutput):
+        sys.stdout = ThreadedOutput(sys.stdout)
+    return sys.stdout
+
+
+def uninstall():
+    if isinstance(sys.stdout, ThreadedOutput):
+        sys.stdout = sys.stdout.stream
+
+
+@contextmanager
+def captured_output(buffer=None):
+    """
+    Collect everything the current thread prints into a list of chunks
+    """
+    output = install()
+    previous = output.buffer
+    output.local.buffer = [] if buffer is None else buffer
+    try:
+        yield output.local.buffer
+    finally:
+        output.local.buffer = previous
+
+
+def bind_output(function):
+    """
+    :returns: function wrapped so that, when called from another thread, its
+              output goes where the calling thread's output goes
+    """
+    output = sys.stdout
+    if not isinstance(output, ThreadedOutput) or output.buffer is None:
+        return function
+    buffer = output.buffer
+
+    def bound(*args, **kwargs):
+        with captured_output(buffer):
+            return function(*args, **kwargs)
+    return bound
@@ -1,13 +1,10 @@
-from fabric.context_managers import hide
-import re
 from calyptos.plugins.debugger.debuggerplugin import DebuggerPlugin
 
 class CheckPorts(DebuggerPlugin):
     def debug(self):
         all_hosts = self.component_deployer.all_hosts
-        with hide('everything'):
-            ports = self.run_command_on_hosts('netstat -lnp', all_hosts)
-        roles = self.component_deployer.get_roles()
+        facts = self.get_facts(all_hosts)
+        roles = self.roles
         clc_ports = {'tcp': [8773, 8777, 8443, 8779],
                      'udp': [7500, 8773]}
         ufs_ports = {'tcp': [53, 8773, 8779],
@@ -21,9 +18,9 @@ class CheckPorts(DebuggerPlugin):
         def check_port_map(port_map):
             for proto, ports in port_map.iteritems():
                 for port in ports:
-                    if not self._check_port(netstat, proto, port, host):
+                    if not self._check_port(host_facts, proto, port, host):
                         closed_ports.append(port)
-        for host, netstat in ports.iteritems():
+        for host, host_facts in facts.iteritems():
             closed_ports = []
             if host in roles['clc']:
                 self.info('Confirm reserved ports are open on Cloud Controller')
@@ -46,10 +43,9 @@ class CheckPorts(DebuggerPlugin):
                           + str(closed_ports))
         return (self.passed, self.failed)
 
-    def _check_port(self, netstat, proto, port, host):
+    def _check_port(self, host_facts, proto, port, host):
         port_string = proto + '.*:' + str(port)
-        search = re.search(port_string, netstat)
-        if search:
+        if host_facts.listening_on(proto, port):
             self.success(host + ': Open ' + port_string)
             return True
         else:
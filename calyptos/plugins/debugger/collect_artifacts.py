@@ -0,0 +1,33 @@
+from calyptos.artifacts import ArtifactStore
+from calyptos.executor import get_executor
+from calyptos.plugins.debugger.debuggerplugin import DebuggerPlugin
+
+
+class CollectArtifacts(DebuggerPlugin):
+    # Logs and configuration kept for every run
+    paths = ['/etc/eucalyptus', '/var/log/eucalyptus']
+    # Runs older than this many days are forgotten along with the chunks
+    # only they referred to, None keeps every run
+    retention_days = 14
+
+    def debug(self):
+        all_hosts = self.component_deployer.get_euca_hosts()
+        store = ArtifactStore()
+        self.info('Collecting ' + ', '.join(self.paths) + ' into ' + store.root)
+        collected = {}
+        for host, result in get_executor().stream(store.collect, all_hosts, self.paths):
+            if isinstance(result, BaseException):
+                self.failure(host + ': Unable to collect artifacts - ' + str(result))
+                continue
+            files, stats = result
+            collected[host] = files
+            self.success('{0}: collected {1} files, {2} bytes, transferred {3} bytes'.format(
+                host, stats['files'], stats['bytes'], stats['transferred']))
+        run_id = store.save_run(collected)
+        self.info('Artifacts of this run recorded as ' + run_id)
+        if self.retention_days is not None:
+            deleted = store.prune(self.retention_days)
+            if deleted:
+                self.info('Pruned {0} chunks of runs older than {1} days'.format(
+                    deleted, self.retention_days))
+        return (self.passed, self.failed)
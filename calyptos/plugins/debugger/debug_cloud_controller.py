@@ -1,32 +1,38 @@
-from fabric.context_managers import hide, show
 import re
 from calyptos.plugins.debugger.debuggerplugin import DebuggerPlugin
 
 
 class DebugCloudController(DebuggerPlugin):
+    # Service, disk and memory state come from the shared facts
+    probes = {
+        'describe_services': 'euca-describe-services',
+        'psql_dt': 'echo "\pset pager false;\dt *.*;" | psql -h /var/lib/eucalyptus/db/data/ -p 8777 eucalyptus_shared',
+        'db_size': 'du -s /var/lib/eucalyptus/db/',
+    }
+
     def debug(self):
         clcs = self.component_deployer.roles['clc'] 
-        with hide('everything'):
-            for clc in clcs:
-                self._check_service_running(clc)
-                self._services_enabled(clc)
-                self._psql_available(clc)
-                self._db_size_check(clc)
-                self._var_lib_euca_size_check(clc)
-                self._memory_usage(clc)
+        probe_results = self.run_probes(self.probes, clcs)
+        facts = self.get_facts(clcs)
+        for clc in facts:
+            self.probe_results = probe_results[clc]
+            self.facts = facts[clc]
+            self._check_service_running(clc)
+            self._services_enabled(clc)
+            self._psql_available(clc)
+            self._db_size_check(clc)
+            self._var_lib_euca_size_check(clc)
+            self._memory_usage(clc)
         return (self.passed, self.failed)
 
     def _check_service_running(self, clc):
-        clc_service_state = self.run_command_on_host(
-            'service eucalyptus-cloud status', host=clc)
-        if re.search('running', clc_service_state):
+        if self.facts.service_running('eucalyptus-cloud'):
             self.success(clc + ': CLC service running')
         else:
             self.failure(clc + ': CLC service not running')
 
     def _services_enabled(self, clc):
-        describe_services = self.run_command_on_host('euca-describe-services',
-                                                     host=clc)
+        describe_services = self.probe_results['describe_services']
         for state in ['DISABLED', 'BROKEN', 'NOTREADY']:
             search = re.search('.*' + state + '.*', describe_services)
             if search:
@@ -36,8 +42,7 @@ class DebugCloudController(DebuggerPlugin):
                 self.success(clc + ': No services in ' + state)
 
     def _psql_available(self, clc):
-        psql_dt = 'echo "\pset pager false;\dt *.*;" | psql -h /var/lib/eucalyptus/db/data/ -p 8777 eucalyptus_shared'
-        psql_dt_out = self.run_command_on_host(psql_dt, host=clc)
+        psql_dt_out = self.probe_results['psql_dt']
         if re.search('eucalyptus_cloud', psql_dt_out):
             self.success(clc + ': Was able to access postgres DB')
         else:
@@ -45,8 +50,7 @@ class DebugCloudController(DebuggerPlugin):
             print psql_dt_out
 
     def _db_size_check(self, clc):
-        db_size = 'du -s /var/lib/eucalyptus/db/'
-        db_size_out = self.run_command_on_host(db_size, host=clc)
+        db_size_out = self.probe_results['db_size']
         db_size_mb = int(db_size_out.split()[0]) / 1024
         if db_size_mb > 3000:
             self.failure(clc + ': Database is larger than 3GB. '
@@ -56,10 +60,11 @@ class DebugCloudController(DebuggerPlugin):
             self.success(clc + ': DB size smaller than 3GB  ')
 
     def _var_lib_euca_size_check(self, clc):
-        df_vle = 'df -h --sync /var/lib/eucalyptus/ -P | ' \
-                 'awk \'{print $5}\' | grep -v Use'
-        vle_size = self.run_command_on_host(df_vle, host=clc)
-        vle_usage = int(vle_size.strip('%'))
+        disk = self.facts.disk_for('/var/lib/eucalyptus')
+        if not disk:
+            self.failure(clc + ': Unable to find file system of /var/lib/eucalyptus')
+            return
+        vle_usage = disk['use_percent']
         if vle_usage > 85:
             self.failure(clc + ': /var/lib/eucalyptus is more that 85% full. '
                                'Consider deleting some files from '
@@ -68,8 +73,7 @@ class DebugCloudController(DebuggerPlugin):
             self.success(clc + ': /var/lib/eucalyptus is less than 85% full  ')
 
     def _memory_usage(self, clc):
-        free_mem = 'free | grep buffers | grep -v free | awk \'{print $3}\''
-        free_mem_size = int(self.run_command_on_host(free_mem, host=clc))
+        free_mem_size = self.facts.memory.get('available', 0)
         if free_mem_size < 2000000:
             self.failure(clc + ': Less than 2GB of memory available. '
                                'Consider stop other process on this host')
@@ -1,15 +1,21 @@
-from fabric.context_managers import hide
 import re
 from calyptos.plugins.debugger.debuggerplugin import DebuggerPlugin
 
 class CheckComputeRequirements(DebuggerPlugin):
+    # Clocks are read fresh, everything else comes from the shared facts
+    probes = {
+        'date_stamp': 'date --utc +%m%d%y',
+        'time_stamp': 'date --utc +%H%M%S',
+    }
+
     def debug(self):
         # Supported CentOS/RHEL OS version for each component
         self.os_version = 6
         # Default clock skew allowed for cloud components
         self.clock_skew_sec = 20
         all_hosts = self.component_deployer.all_hosts
-        roles = self.component_deployer.get_roles()
+        roles = self.roles
+        self.facts = self.get_facts(all_hosts)
         self._verify_os_proc(all_hosts)
         self._verify_clocks(all_hosts)
         self._check_virtualization(roles['node-controller'])
@@ -24,46 +30,31 @@ class CheckComputeRequirements(DebuggerPlugin):
         :param all_hosts: a set of Eucalyptus cloud components
         """
         self.info('Operation System and Processor verification on all hosts')
-        os_output = 'cat /etc/system-release' 
-        with hide('everything'):
-            os_version = self.run_command_on_hosts(os_output, all_hosts)
-       
         os_search_string = '(CentOS|Red).*(' + str(self.os_version) + '.\w+)' 
-        for host in all_hosts:
-            if re.search(os_search_string, os_version[host]):
+        for host, facts in self.facts.iteritems():
+            if re.search(os_search_string, facts.os_release):
                 self.success(host + ': Correct OS Version')
             else:
                 self.failure(host + ': Incorrect OS Version')
         
-        arch_output = 'uname -m'
-        with hide('everything'):
-            arch_version = self.run_command_on_hosts(arch_output, all_hosts)
-
-        for host in all_hosts:
-            if re.search('x86_64', arch_version[host]):
+        for host, facts in self.facts.iteritems():
+            if re.search('x86_64', facts.arch):
                 self.success(host + ': Correct chip architecture')
             else:
                 self.failure(host + ': Incorrect chip architecture')
 
-        cpu_output = 'cat /proc/cpuinfo | grep processor'        
-        cputype_output = 'cat /proc/cpuinfo | grep \"model name\"'
-        with hide('everything'):
-            cpu_count = self.run_command_on_hosts(cpu_output, all_hosts)
-            cpu_type = self.run_command_on_hosts(cputype_output, all_hosts)
-
-        for host in all_hosts:
-            cpus = re.findall('processor', cpu_count[host])
-            if len(cpus) >= 2:
+        for host, facts in self.facts.iteritems():
+            if facts.cpu_count >= 2:
                 self.success(host + ': Passed minimum number of'
                             + ' processors requirement')
             else:
                 self.failure(host + ': Failed minimum number of'
                             + ' processors requirement')
 
-            proc_type = re.findall('(model).*([Intel|AMD].*)\w+',
-                                   cpu_type[host])
+            proc_type = [model for model in facts.cpu_models
+                         if re.search('(Intel|AMD)', model)]
           
-            if len(cpus) == len(proc_type):
+            if facts.cpu_count == len(proc_type):
                 self.success(host + ': Passed requirement of '
                              + 'Intel/AMD processor support')
             else:
@@ -83,35 +74,21 @@ class CheckComputeRequirements(DebuggerPlugin):
         self.info('NTP/NTPD Test on all hosts')
         packages = ['ntp', 'ntpdate']
         for package in packages:
-            with hide('everything'):
-                # Use rpm --query --all to confirm packages exist
-                rpm_output = self.run_command_on_hosts('rpm '
-                             + '--query --all ' + package,
-                             all_hosts)
-            for host in all_hosts:
-                if re.search(package, rpm_output[host]):
+            for host, facts in self.facts.iteritems():
+                if facts.has_package(package):
                     self.success(host + ':Package found - ' + package)
                 else:
                     self.failure(host + ':Package not found - ' + package)
 
-        service_output = 'service ntpd status'
-        with hide('everything'):
-            ntpd_output = self.run_command_on_hosts(service_output, all_hosts)
-
-        for host in all_hosts:
-            if re.search('running', ntpd_output[host]):
+        for host, facts in self.facts.iteritems():
+            if facts.service_running('ntpd'):
                 self.success(host + ':ntpd running')
             else:
                 self.failure(host + ':ntpd not running')
 
         # Check to see if ntpd is set to default-start runlevel 
-        chkconfig_output = 'chkconfig --list ntpd | awk \'{print $4,$5,$6,$7}\''
-        with hide('everything'):
-            runlevel_output = self.run_command_on_hosts(chkconfig_output,
-                                                        all_hosts)
-
-        for host in all_hosts:
-            if re.search('off', runlevel_output[host]):
+        for host, facts in self.facts.iteritems():
+            if not set(['2', '3', '4', '5']).issubset(facts.runlevels.get('ntpd', [])):
                 self.failure(host + ':runlevel for ntpd'
                              + ' has not been set to default-start')
             else:
@@ -124,22 +101,20 @@ class CheckComputeRequirements(DebuggerPlugin):
         confirm there isn't more than the clock skew (in seconds) between
         all components.
         """
-        date_output = 'date --utc +%m%d%y'
-        time_output = 'date --utc +%H%M%S'    
-        with hide('everything'):
-            date_stamp = self.run_command_on_hosts(date_output, all_hosts)
-            time_stamp = self.run_command_on_hosts(time_output, all_hosts)
+        clocks = self.run_probes(self.probes, all_hosts)
        
         host_dates = []
         host_times = []
         for host in all_hosts:
-            if not date_stamp[host] or not time_stamp[host]:
+            date_stamp = clocks[host]['date_stamp']
+            time_stamp = clocks[host]['time_stamp']
+            if not date_stamp or not time_stamp:
                 self.failure(host + ': No date returned. Make sure machine clock'
                              + ' is set and synced across all nodes')
                 return
             else:
-                host_dates.append(date_stamp[host])
-                host_times.append(time_stamp[host])
+                host_dates.append(date_stamp)
+                host_times.append(time_stamp)
         
         if all(date == host_dates[0] for date in host_dates):
             self.success('All cloud components are using the same date')
@@ -162,13 +137,10 @@ class CheckComputeRequirements(DebuggerPlugin):
         :param nodes: a set of Eucalyptus Node Controller components
         """
         self.info('Confirm virtualization is enabled on Node Controllers')
-        virt_output = 'egrep -m1 -w \'^flags[[:blank:]]*:\' /proc/cpuinfo |' \
-                      ' egrep -wo \'(vmx|svm)\''
-        with hide('everything'):
-            virt_test = self.run_command_on_hosts(virt_output, nodes)
-
         for host in nodes:
-            if re.match('(vmx|svm)', virt_test[host]):
+            if host not in self.facts:
+                continue
+            if self.facts[host].cpu_flags & set(['vmx', 'svm']):
                 self.success(host + ': Passed requirement of '
                             + 'Intel/AMD hardware virtualization support')
             else:
@@ -1,23 +1,25 @@
 # stevedore/example/base.py
 import abc
-import fabric
 from fabric.colors import red, green, cyan, yellow, white
-from fabric.decorators import task
-from fabric.operations import run, get, settings
-from fabric.state import env
-from fabric.tasks import execute
-from fabric.network import disconnect_all
 import six
+from calyptos.executor import get_executor
+from calyptos.facts import get_facts_cache
+from calyptos.probes import run_probes
+from calyptos.sshpool import get_pool
 
 
 @six.add_metaclass(abc.ABCMeta)
 class DebuggerPlugin(object):
     #Base class for Debugger Plugin.
 
+    # Exclusive plugins never run next to other plugins, e.g. bandwidth tests
+    exclusive = False
+
     def __init__(self, component_deployer):
         self.passed = 0
         self.failed = 0
         self.warnings = 0
+        self.reported = False
         self.message_style = "[{0: <20}] {1}"
         self.name = self.__class__.__name__
         self.component_deployer = component_deployer
@@ -26,13 +28,8 @@ class DebuggerPlugin(object):
         print cyan(self.message_style.format('DEBUG STARTING', self.name))
 
     def __del__(self):
-        try:
-            disconnect_all()
-        except Exception as e:
-            message = "Failed to disconnect from all hosts - " + e.message
-            print red(self.message_style.format('DISCONNECT FAILED', message))
-        finally:
-            self.report()
+        # Sessions are pooled for the whole run, see calyptos.sshpool
+        self.report()
 
     def success(self, message):
         # Function to display and tally success of a debug step
@@ -54,7 +51,10 @@ class DebuggerPlugin(object):
         print yellow(self.message_style.format('DEBUG WARNING', message))
 
     def report(self):
-        # Function to display report of debug results
+        # Function to display report of debug results, only once
+        if self.reported:
+            return
+        self.reported = True
         text_color = red
         if self.failed == 0:
             text_color = cyan
@@ -65,35 +65,71 @@ class DebuggerPlugin(object):
                                               str(self.passed),
                                               str(self.failed))))
 
-    @task
-    def run_command_task(command, user='root', password='foobar'):
-        # Task to run command on host and return result
-        env.user = user
-        env.password = password
-        env.parallel = True
-        return run(command)
-
-    @task
-    def get_file_task(remote_path, local_path, user='root', password='foobar'):
-        # Task to grab file from host and return result
-        env.user = user
-        env.password = password
-        env.parallel = True
-        with settings(warn_only=True):
-            return get(remote_path, local_path)
-
     def get_file_on_host(self, remote_path, local_path, host):
-        # Function to execute get_file_task on host
-        return execute(self.get_file_task, remote_path=remote_path,
-                       local_path=local_path, host=host)[host]
+        # Function to download a file from host, returns None on failure
+        try:
+            return get_pool().get(host, remote_path, local_path)
+        except Exception as e:
+            self.info(host + ': Unable to download ' + remote_path + ' - ' + str(e))
+            return None
+
+    def stream_command_on_hosts(self, command, hosts):
+        # Function to run command on list of hosts, yields (host, output)
+        # as each host finishes
+        for result_host, result in get_executor().stream_command(command, hosts):
+            if isinstance(result, BaseException):
+                self.failure(result_host + ': Unable to run command - ' + str(result))
+                result = ''
+            yield result_host, result
 
     def run_command_on_hosts(self, command, hosts, host=None):
-        # Function to execute run_command_task on list of hosts
-        return execute(self.run_command_task, command=command, hosts=hosts)
+        # Function to run command on list of hosts, returns host -> output
+        return dict(self.stream_command_on_hosts(command, hosts))
 
     def run_command_on_host(self, command, host):
-        # Function to execute run_command_task on host
-        return execute(self.run_command_task, command=command, host=host)[host]
+        # Function to run command on host over its pooled session
+        return self.run_command_on_hosts(command, [host])[host]
+
+    def get_facts(self, hosts):
+        # Function to get the cached facts of hosts, returns host -> HostFacts
+        # for every host that could be probed
+        facts = {}
+        for host, host_facts in get_facts_cache().get(hosts).iteritems():
+            if host_facts.error:
+                self.failure(host + ': Unable to gather facts - ' + str(host_facts.error))
+            else:
+                facts[host] = host_facts
+        return facts
+
+    def check_packages(self, packages, hosts):
+        # Function to confirm packages are installed on hosts, installing
+        # the ones that are missing
+        facts = self.get_facts(hosts)
+        for package in packages:
+            for host, host_facts in facts.iteritems():
+                if host_facts.has_package(package):
+                    self.success(host + ':Package found - ' + package)
+                else:
+                    self.warning(host + ':Package not installed - '
+                                + package + '; Installing ' + package)
+                    yum_output = self.run_command_on_host('yum install '
+                                 + ' --assumeyes --quiet --nogpgcheck ' + package,
+                                 host=host)
+                    get_facts_cache().invalidate([host])
+                    if not yum_output:
+                        self.success(host + ':Package installed - ' + package)
+                    else:
+                        self.failure(host + ':Package failed to install - ' + package)
+
+    def run_probes(self, probes, hosts):
+        # Function to run a dict of named probes on list of hosts with one
+        # round trip per host, returns host -> probe name -> output
+        results = get_executor().run(run_probes, hosts, probes)
+        for result_host, result in results.iteritems():
+            if isinstance(result, BaseException):
+                self.failure(result_host + ': Unable to run probes - ' + str(result))
+                results[result_host] = dict((name, '') for name in dict(probes))
+        return results
 
     def debug(self):
         """Format the data and return unicode text.
@@ -1,24 +1,30 @@
-import fabric
-from fabric.colors import white
 from fabric.decorators import task
-from fabric.operations import run, local
-from fabric.state import env
-from fabric.tasks import execute
+from fabric.operations import local
 from fabric.context_managers import hide
+import glob
+import os
 import re
 from datetime import datetime
 from calyptos.plugins.debugger.debuggerplugin import DebuggerPlugin
+from calyptos.executor import get_executor
+from calyptos.sshpool import get_pool
+from calyptos.transfer import DiskQuota, DownloadQueue, PARTIAL_SUFFIX
 
+# Left in a run's local directory until all of its sosreports are downloaded
+UNFINISHED_MARKER = '.unfinished'
 
 
 class EucalyptusSosReports(DebuggerPlugin):
-    def debug(self):
-        roles = self.component_deployer.get_roles()
+    # Sosreports downloaded at the same time
+    transfers = 4
+    # Bytes the local sosreport directory may hold, downloads pause once it
+    # is full. None for no limit
+    disk_quota = None
 
+    def debug(self):
         # Create set of Eucalytpus only componnents
         all_hosts = self.component_deployer.get_euca_hosts()
 
-        env.parallel = True
         """
         Check to make sure sos and eucalyptus-sos-plugins
         packages are installed
@@ -34,91 +40,124 @@ class EucalyptusSosReports(DebuggerPlugin):
         return (self.passed, self.failed)
 
     def _check_packages(self, all_hosts, packages):
-        for package in packages:
-            with hide('everything'):
-                """
-                Use rpm --query --all to confirm package
-                exists; if not, issue a warning and install
-                missing package
-                """
-                rpm_output = self.run_command_on_hosts('rpm ' 
-                             + '--query --all ' + package,
-                             hosts=all_hosts)
-            for host in all_hosts:
-                if re.search(package, rpm_output[host]):
-                    self.success(host + ':Package found - ' + package)
-                else:
-                    self.warning(host + ':Package not installed - '
-                                + package + '; Installing ' + package)
-                    with hide('everything'):
-                        yum_output = self.run_command_on_host('yum install '
-                                     + ' --assumeyes --quiet --nogpgcheck ' + package,
-                                     host=host)
-                    if not yum_output:
-                        self.success(host + ':Package installed - ' + package)
-                    else:
-                        self.failure(host + ':Package failed to install - ' + package)
+        self.check_packages(packages, all_hosts)
 
     def _grab_sosreports(self, all_hosts):
         """
-        Create local directory
-        for downloaded sosreports
+        Reuse the local directory of the last unfinished run, or
+        create one for downloaded sosreports
         """
-        timestamp = datetime.strftime(datetime.now(), '%Y%m%d-%H%M%S') 
-        directory = 'sosreport-' + timestamp
-        message = 'Creating directory ' + directory + " on localhost"
-        self.info(message)
-        with hide('everything'):
-            mkdir_output = self.create_localdir(directory)
-        if re.search('created', mkdir_output):
-            self.success('localhost: Directory ' + directory
-                         + ' created successfully')
+        directory = self._unfinished_directory()
+        resumed = {}
+        if directory:
+            self.info('Resuming unfinished run in directory ' + directory)
+            for host in all_hosts:
+                partial, downloaded = self._downloads(directory, host)
+                if partial or downloaded:
+                    resumed[host] = partial
         else:
-            self.failure('localhost: Directory ' + directory
-                         + ' creation failed')
+            timestamp = datetime.strftime(datetime.now(), '%Y%m%d-%H%M%S')
+            directory = 'sosreport-' + timestamp
+            message = 'Creating directory ' + directory + " on localhost"
+            self.info(message)
+            with hide('everything'):
+                mkdir_output = self.create_localdir(directory)
+            if re.search('created', mkdir_output):
+                self.success('localhost: Directory ' + directory
+                             + ' created successfully')
+                open(os.path.join(directory, UNFINISHED_MARKER), 'w').close()
+            else:
+                self.failure('localhost: Directory ' + directory
+                             + ' creation failed')
+        # Hosts with downloaded or partly downloaded reports keep them, a
+        # partial download continues from where it stopped
+        hosts = [host for host in all_hosts if host not in resumed]
+
         """
         Remove old sosreports are around in /tmp
         """
-        with hide('everything'):
-            rm_output = self.run_command_on_hosts('rm -rf /tmp/sosreport*',
-                                                  hosts=all_hosts)
-        for host in all_hosts:
+        if hosts:
+            with hide('everything'):
+                rm_output = self.run_command_on_hosts('rm -rf /tmp/sosreport*',
+                                                      hosts=hosts)
+        for host in hosts:
             if not rm_output[host]:
                 self.success(host + ':old sosreports successfully removed')
             else:
                 self.failure(host + ':old sosreports failed to be removed')
 
+        """
+        Execute sosreport on all hosts; each host's report is
+        downloaded as soon as that host is done
+        """
+        quota = None
+        if self.disk_quota:
+            quota = DiskQuota(directory, self.disk_quota)
+        downloads = DownloadQueue(transfers=self.transfers, quota=quota)
+        for host, local_files in resumed.iteritems():
+            for local_file in local_files:
+                self.info(host + ':resuming download of ' + local_file)
+                downloads.submit(host, '/tmp/' + local_file,
+                                 self._local_path(directory, host, local_file))
         with hide('everything'):
-            """
-            Execute sosreport on all hosts
-            """
-            sosreport_output = self.execute_sosreports_on_hosts(hosts=all_hosts)
-        for host in all_hosts:
-            """
-            Confirm sosreport ran successfully;
-            Download sosreport to local client
-            """
-            hostname = host.replace(".", '')
-            sosfile = 'sosreport-' + hostname
-            for output in sosreport_output[host].split('\n'):
-                sosreport_file = re.search(sosfile, output, re.I)
-                if sosreport_file:
-                    self.success(host + ':sosreport finished - '
-                                + output)
-                    remote_path = output.strip()
-                    local_file = remote_path.split('/')[2]
-                    format_host = host.replace(".", "_")
-                    local_path = directory + "/" + format_host + "-" + local_file
-                    with hide('everything'):
-                        cp_output = self.get_file_on_host(remote_path,
-                                                          local_path,
-                                                          host=host)
-                    if cp_output:
-                        self.success(host + ':sosreport downloaded - '
-                                    + local_path)
-                    else:
-                        self.failure(host + ':sosreport failed to download - '
-                                    + local_path)
+            for host, output in self.stream_sosreports_on_hosts(hosts=hosts):
+                """
+                Confirm sosreport ran successfully;
+                queue the sosreport for download to local client
+                """
+                hostname = host.replace(".", '')
+                sosfile = 'sosreport-' + hostname
+                for line in output.split('\n'):
+                    sosreport_file = re.search(sosfile, line, re.I)
+                    if sosreport_file:
+                        self.success(host + ':sosreport finished - '
+                                    + line)
+                        remote_path = line.strip()
+                        local_file = remote_path.split('/')[2]
+                        local_path = self._local_path(directory, host, local_file)
+                        downloads.submit(host, remote_path, local_path)
+        finished = True
+        for host, remote_path, local_path, result in downloads.wait():
+            if isinstance(result, BaseException):
+                finished = False
+                self.failure(host + ':sosreport failed to download - '
+                            + local_path + ' - ' + str(result))
+            else:
+                self.success(host + ':sosreport downloaded and verified - '
+                            + local_path)
+        if finished and os.path.exists(os.path.join(directory, UNFINISHED_MARKER)):
+            os.remove(os.path.join(directory, UNFINISHED_MARKER))
+
+    @staticmethod
+    def _local_path(directory, host, local_file):
+        return directory + "/" + host.replace(".", "_") + "-" + local_file
+
+    @staticmethod
+    def _unfinished_directory():
+        """
+        Local directory of the last run that did not download every
+        sosreport, None if there is none
+        """
+        unfinished = sorted(os.path.dirname(marker) for marker in
+                            glob.glob(os.path.join('sosreport-*', UNFINISHED_MARKER)))
+        return unfinished[-1] if unfinished else None
+
+    @staticmethod
+    def _downloads(directory, host):
+        """
+        Names of the remote sosreports of host that were partly and
+        fully downloaded into directory
+        """
+        prefix = host.replace(".", "_") + "-"
+        partial, downloaded = [], []
+        for name in sorted(os.listdir(directory)):
+            if not name.startswith(prefix):
+                continue
+            if name.endswith(PARTIAL_SUFFIX):
+                partial.append(name[len(prefix):-len(PARTIAL_SUFFIX)])
+            else:
+                downloaded.append(name[len(prefix):])
+        return partial, downloaded
 
     @task
     def create_localdir(directory):
@@ -128,26 +167,24 @@ class EucalyptusSosReports(DebuggerPlugin):
         """
         return local("mkdir -v " + directory, capture=True)
 
-    @task
-    def sosreport_command_task(user='root', password='foobar'):
+    def stream_sosreports_on_hosts(self, hosts):
         """
-        Execute sosreport on each host, passing hostname
-        and ticket number
+        Run sosreport on each host in parallel, yields (host, output)
+        as each host finishes
         """
-        env.user = user
-        env.password = password
-        hostname = env.host.replace(".", "_")
-        message = 'Running sosreport on ' + env.host
-        message_style = "[{0: <20}] {1}"
-        print white(message_style.format('INFO', message))
-        sosreport_command = ("sosreport --name=" + hostname
-                            + " --ticket-number=000 "
-                            + "--batch")
-        return run(sosreport_command)
+        for sos_host, result in get_executor().stream(self._run_sosreport, hosts):
+            if isinstance(result, BaseException):
+                self.failure(sos_host + ':sosreport failed to run - ' + str(result))
+                result = ''
+            yield sos_host, result
 
-    def execute_sosreports_on_hosts(self, hosts, host=None):
+    def _run_sosreport(self, host):
         """
-        Run sosreport_command_task on each host
+        Execute sosreport on host, passing hostname
+        and ticket number
         """
-        return execute(self.sosreport_command_task, hosts=hosts)
-
+        self.info('Running sosreport on ' + host)
+        sosreport_command = ("sosreport --name=" + host.replace(".", "_")
+                             + " --ticket-number=000 "
+                             + "--batch")
+        return get_pool().run(host, sosreport_command)
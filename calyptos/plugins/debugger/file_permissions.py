@@ -6,7 +6,7 @@ from calyptos.plugins.debugger.debuggerplugin import DebuggerPlugin
 class FilePermissions(DebuggerPlugin):
     def debug(self):
         euca_hosts = self.component_deployer.get_euca_hosts()
-        roles = self.component_deployer.get_roles()
+        roles = self.roles
         common_files = {'eucalyptus': ['/var/lib/eucalyptus',
                                     '/var/log/eucalyptus'],
                         'root': []}
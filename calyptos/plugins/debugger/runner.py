@@ -0,0 +1,100 @@
+import threading
+import time
+import traceback
+import Queue
+
+from fabric.colors import cyan, red
+
+from calyptos.output import captured_output, install, uninstall
+from calyptos.tracing import span
+
+
+class DebuggerRunner(object):
+    """
+    Runs debugger plugins concurrently.
+
+    Up to workers plugins run at the same time. Everything a plugin prints
+    is held back and printed as one block once the plugin is done, so the
+    output of different plugins is never interleaved. Plugins that declare
+    themselves exclusive run one at a time after all the others finished,
+    with nothing else running next to them.
+    """
+
+    def __init__(self, plugins, component_deployer, workers=4):
+        """
+        :param plugins: list of (name, plugin class)
+        :param component_deployer: RoleBuilder passed to every plugin
+        :param workers: maximum number of plugins running at once
+        """
+        self.plugins = list(plugins)
+        self.component_deployer = component_deployer
+        self.workers = max(1, int(workers))
+        self.results = {}
+
+    def _run_plugin(self, name, plugin_class):
+        start = time.time()
+        passed, failed = 0, 0
+        plugin = None
+        with captured_output() as chunks, span(name, 'debug'):
+            try:
+                plugin = plugin_class(self.component_deployer)
+                passed, failed = plugin.debug()
+                plugin.report()
+            except Exception:
+                print red('[{0: <20}] {1}'.format('DEBUG ERROR', name))
+                print red(traceback.format_exc())
+                if plugin is not None:
+                    plugin.failed += 1
+                    plugin.report()
+                    passed, failed = plugin.passed, plugin.failed
+                else:
+                    failed += 1
+        self.results[name] = (passed, failed, time.time() - start)
+        self.output.emit(chunks)
+
+    def _run_concurrently(self, plugins):
+        work = Queue.Queue()
+        for name, plugin_class in plugins:
+            work.put((name, plugin_class))
+
+        def worker():
+            while True:
+                try:
+                    name, plugin_class = work.get_nowait()
+                except Queue.Empty:
+                    return
+                self._run_plugin(name, plugin_class)
+
+        threads = [threading.Thread(target=worker, name='debugger-worker')
+                   for _ in range(min(self.workers, len(plugins)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                # Wake up periodically so KeyboardInterrupt is delivered
+                thread.join(1)
+
+    def run(self):
+        """
+        :returns: dict of plugin name -> (passed, failed, seconds)
+        """
+        shared = [(name, plugin_class) for name, plugin_class in self.plugins
+                  if not getattr(plugin_class, 'exclusive', False)]
+        exclusive = [(name, plugin_class) for name, plugin_class in self.plugins
+                     if getattr(plugin_class, 'exclusive', False)]
+        self.output = install()
+        try:
+            self._run_concurrently(shared)
+            for name, plugin_class in exclusive:
+                self._run_plugin(name, plugin_class)
+        finally:
+            uninstall()
+        return self.results
+
+    def print_timings(self):
+        print cyan('Debugger timings:')
+        for name in sorted(self.results, key=lambda name: -self.results[name][2]):
+            passed, failed, seconds = self.results[name]
+            print cyan('  {0: <30} {1:>8.1f}s  passed: {2: <4} failed: {3}'.format(
+                name, seconds, passed, failed))
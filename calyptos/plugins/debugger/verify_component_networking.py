@@ -1,17 +1,14 @@
-import fabric
-from fabric.colors import white
-from fabric.decorators import task
-from fabric.operations import run, settings
-from fabric.state import env
-from fabric.tasks import execute
 from fabric.context_managers import hide
 import re
 from calyptos.plugins.debugger.debuggerplugin import DebuggerPlugin
 
 class VerifyComponentNetworking(DebuggerPlugin):
+    # iperf results are skewed by other traffic
+    exclusive = True
+
     def debug(self):
         all_hosts = self.component_deployer.all_hosts
-        roles = self.component_deployer.get_roles()
+        roles = self.roles
         self._confirm_nics(all_hosts)
         self._confirm_multicast(roles)
 
@@ -67,14 +64,7 @@ class VerifyComponentNetworking(DebuggerPlugin):
         self.info('Verify multicast group communication between all'
                   + ' Eucalyptus java components')
         # Make a set of all Eucalyptus Java components
-        java_components = roles['clc']
-        
-        euca_java_roles = ['user-facing', 'storage-controller']
-        if roles['walrus']:
-            euca_java_roles.append('walrus')
-
-        for component in euca_java_roles:
-            java_components.update(roles[component])
+        java_components = self.component_deployer.get_java_components()
 
         # Install prerequisite packages for multicast test
         self._install_multicast_test_prereq(java_components)
@@ -190,34 +180,9 @@ class VerifyComponentNetworking(DebuggerPlugin):
         :param java_components: list of Eucalyptus Java components
         """
         packages = ['iperf']
-        for package in packages:
-            with hide('everything'):
-                """
-                Use rpm --query --all to confirm package
-                exists; if not, issue a warning and install
-                missing package
-                """
-                rpm_output = self.run_command_on_hosts('rpm '
-                                                       + '--query --all '
-                                                       + package,
-                                                       java_components)
-            for host in java_components:
-                if re.search(package, rpm_output[host]):
-                    self.success(host + ':Package found - ' + package)
-                else:
-                    self.warning(host + ':Package not installed - '
-                                + package + '; Installing ' + package)
-                    with hide('everything'):
-                        yum_output = self.run_command_on_host('yum install '
-                                     + ' --assumeyes --quiet --nogpgcheck ' + package,
-                                     host=host)
-                    if not yum_output:
-                        self.success(host + ':Package installed - ' + package)
-                    else:
-                        self.failure(host + ':Package failed to install - ' + package)
+        self.check_packages(packages, java_components)
 
-    @task
-    def iperf_command_task(user='root', password='foobar'):
+    def execute_iperf_on_hosts(self, hosts, host=None):
         """
         Execute iperf on each host in client mode,
         testing UDP connection, binding to 228.7.7.3.
@@ -225,70 +190,25 @@ class VerifyComponentNetworking(DebuggerPlugin):
         and pausing 1 second between periodic bandwidth
         reports.
 
-        :param user: username of the remote user
-        :param password:  password of the remote user
+        :param  hosts: list of hosts on which to execute
+                the iperf client
+        :param  host: unused
         """
-        env.user = user
-        env.password = password
-        env.parallel = True
-        message = 'Running iperf (client mode) on ' + env.host
-        message_style = "[{0: <20}] {1}"
-        print white(message_style.format('INFO', message))
+        for client in hosts:
+            self.info('Running iperf (client mode) on ' + client)
         iperf_command = ('iperf -c 228.7.7.3 -u -T 32'
                          + '-p 8773 -t 5 -i 1')
-        return run(iperf_command)
-
-    @task
-    def iperf_server_command(command, user='root', password='foobar'):
-        """
-        Run given iperf command on specific host
-
-        :param command: iperf command with arguments
-        :param user: username of remote user
-        :param password: password of remote user
-        """
-        env.user = user
-        env.password = password
-        env.parallel = True
-        with settings(warn_only=True):
-            return run(command, pty=False, combine_stderr=True)
-
-    @task
-    def iperf_server_pid(command, user='root', password='foobar'):
-        """
-        Task to discover iperf (running in server mode) PID
- 
-        :param command: command to obtain iperf PID
-        :param user: username of remote user
-        :param password: password of remote user
-        """
-        env.user = user
-        env.password = password
-        env.parallel = True
-        with settings(warn_only=True):
-            return run(command, pty=False, combine_stderr=True)
-
-    def execute_iperf_on_hosts(self, hosts, host=None):
-        """
-        Run iperf_command_task on each host
-        
-        :param  hosts: list of hosts on which to execute 
-                the iperf_command_task
-        :param  host: single host on which to execute
-                the iperf_command_task
-        """
-        return execute(self.iperf_command_task, hosts=hosts)
+        return self.run_command_on_hosts(iperf_command, hosts)
 
     def start_iperf_server(self, iperf_command, host):
         """
         Execute command on given host to start iperf in server
         mode
-  
+
         :param iperf_command: iperf command with server mode flag
         :param host: host on which to start iperf in server mode
         """
-        return execute(self.iperf_server_command, command=iperf_command,
-                       host=host)[host]
+        return self.run_command_on_host(iperf_command, host)
 
     def get_iperf_pid(self, iperf_command, host):
         """
@@ -298,5 +218,4 @@ class VerifyComponentNetworking(DebuggerPlugin):
         :param iperf_command: command to grab iperf process
         :param host: host on which to discover the iperf process
         """
-        return execute(self.iperf_server_pid, command=iperf_command,
-                       host=host)[host]
+        return self.run_command_on_host(iperf_command, host)
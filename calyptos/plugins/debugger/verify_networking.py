@@ -1,17 +1,16 @@
-import fabric
-from fabric.colors import white
 from fabric.decorators import task
-from fabric.operations import run, settings, local
-from fabric.state import env
-from fabric.tasks import execute
+from fabric.operations import local
 from fabric.context_managers import hide
 import re
 from calyptos.plugins.debugger.debuggerplugin import DebuggerPlugin
 
 class VerifyConnectivity(DebuggerPlugin):
+    # iperf results are skewed by other traffic
+    exclusive = True
+
     def debug(self):
         all_hosts = self.component_deployer.all_hosts
-        roles = self.component_deployer.get_roles()
+        roles = self.roles
         self._install_conn_tool(all_hosts)
         self._verify_enduser_access(roles['user-facing'])
         self._verify_storage_controller_comms(roles)
@@ -33,31 +32,7 @@ class VerifyConnectivity(DebuggerPlugin):
         self.info('Confirm iperf has been installed on'
                   + ' all components')
         packages = ['iperf']
-        for package in packages:
-            with hide('everything'):
-                """
-                Use rpm --query --all to confirm package
-                exists; if not, issue a warning and install
-                missing package
-                """
-                rpm_output = self.run_command_on_hosts('rpm '
-                                                       + '--query --all '
-                                                       + package,
-                                                       all_hosts)
-            for host in all_hosts:
-                if re.search(package, rpm_output[host]):
-                    self.success(host + ':Package found - ' + package)
-                else:
-                    self.warning(host + ':Package not installed - '
-                                + package + '; Installing ' + package)
-                    with hide('everything'):
-                        yum_output = self.run_command_on_host('yum install '
-                                     + ' --assumeyes --quiet --nogpgcheck ' + package,
-                                     host=host)
-                    if not yum_output:
-                        self.success(host + ':Package installed - ' + package)
-                    else:
-                        self.failure(host + ':Package failed to install - ' + package) 
+        self.check_packages(packages, all_hosts)
 
     def _verify_enduser_access(self, end_user_service_pts):
         """
@@ -293,23 +268,6 @@ class VerifyConnectivity(DebuggerPlugin):
                              + ' successfully connected to '
                              + test_component + ' on TCP port ' + port)
 
-    @task
-    def iperf_command_task(command, user='root', password='foobar'):
-        """
-        Execute iperf on each host in client mode
-
-        :param command:  Iperf command to execute
-        :param user: username of the remote user
-        :param password:  password of the remote user
-        """
-        env.user = user
-        env.password = password
-        env.parallel = True
-        message = 'Running iperf test on ' + env.host
-        message_style = "[{0: <20}] {1}"
-        print white(message_style.format('INFO', message))
-        return run(command)
-
     @task
     def test_service_port(host):
         """
@@ -323,14 +281,14 @@ class VerifyConnectivity(DebuggerPlugin):
 
     def execute_iperf_on_hosts(self, iperf_test, hosts, host=None):
         """
-        Run iperf_command_task on each host
+        Run iperf client test on each host
 
         :param  iperf_test: specific iperf client test to execute
                             on each host
         :param  hosts: list of hosts on which to execute
-                the iperf_command_task
-        :param  host: single host on which to execute
-                the iperf_command_task
+                the iperf client test
+        :param  host: unused
         """
-        return execute(self.iperf_command_task, command=iperf_test,
-                       hosts=hosts)
+        for client in hosts:
+            self.info('Running iperf test on ' + client)
+        return self.run_command_on_hosts(iperf_test, hosts)
@@ -3,11 +3,14 @@ from fabric.operations import local
 from fabric.colors import red, green, cyan, yellow
 import yaml
 from deployerplugin import DeployerPlugin
-from fabric.context_managers import hide, warn_only, lcd
-from fabric.tasks import execute
-from calyptos.chefmanager import ChefManager
+from fabric.context_managers import hide, lcd
+from calyptos.chefmanager import ChefManager, run_task
+from calyptos.chefreport import ChefRunReport
+from calyptos.executor import get_executor
 import os
 from calyptos.rolebuilder import RoleBuilder
+from calyptos.scheduler import ProvisionScheduler
+from calyptos.tracing import span, trace_context, traced
 
 
 class Chef(DeployerPlugin):
@@ -20,14 +23,20 @@ class Chef(DeployerPlugin):
             self.hidden_outputs = []
         else:
             self.hidden_outputs = ['running', 'stdout', 'stderr']
+        # Timings of every chef-client run, per recipe and resource
+        self.chef_report = ChefRunReport(branch)
         self.role_builder = RoleBuilder(environment_file)
         self.roles = self.role_builder.get_roles()
         self.all_hosts = self.roles['all']
         self._prepare_fs(cookbook_repo, branch, debug, update_repo)
         self.environment_name = self._write_json_environment()
-        self.chef_manager = ChefManager(password, self.environment_name,
-                                        self.roles['all'])
         self.config = self.get_chef_config(config_file)
+        self.chef_manager = ChefManager(password, self.environment_name,
+                                        self.roles['all'],
+                                        push_mode=self.config.get('push-mode', 'rsync'),
+                                        distribution=self.config.get('distribution', 'direct'),
+                                        fanout=self.config.get('fanout', 2),
+                                        seed_groups=self.roles.get('cluster', {}).values())
 
     def _prepare_fs(self, cookbook_repo, branch, debug, update_repo):
         ChefManager.install_chef_dk()
@@ -65,6 +74,8 @@ class Chef(DeployerPlugin):
             for xr in exclude_recipes:
                 for role in chef_config['roles']:
                     for component in role:
+                        if component == 'depends_on':
+                            continue
                         if xr in role[component]:
                             role[component].remove(xr)
         except:
@@ -77,6 +88,22 @@ class Chef(DeployerPlugin):
                 return recipe_dict[component]
         raise ValueError('No component found for: ' + component)
 
+    @staticmethod
+    def _get_component_name(role_dict):
+        components = [key for key in role_dict if key != 'depends_on']
+        if len(components) != 1:
+            raise ValueError('Expected exactly one component in role entry: ' +
+                             str(role_dict))
+        return components[0]
+
+    def _get_role_dependencies(self):
+        dependencies = {}
+        for role_dict in self.config['roles']:
+            if 'depends_on' in role_dict:
+                dependencies[self._get_component_name(role_dict)] = \
+                    role_dict['depends_on']
+        return dependencies
+
     def _write_json_environment(self):
         environment_dict = yaml.load(open(self.environment_file).read())
         current_environment = environment_dict['name']
@@ -92,13 +119,32 @@ class Chef(DeployerPlugin):
                   self.environment_name + '.json') as env_file:
             return json.loads(env_file.read())
 
-    def _run_chef_on_hosts(self, hosts):
+    def _record_chef_runs(self, results, role=None):
+        for machine, result in results.iteritems():
+            if not isinstance(result, BaseException):
+                self.chef_report.add(machine, result.stdout, role)
+        self.chef_report.save()
+
+    def _print_chef_report(self):
+        self.chef_report.print_summary()
+        if self.chef_report.path:
+            print cyan('Chef run timings written to ' + self.chef_report.path)
+
+    @traced('chef')
+    def _run_chef_on_hosts(self, hosts, role=None):
         with hide(*self.hidden_outputs):
-            execute(self.chef_manager.push_deployment_data, hosts=hosts)
-        with warn_only():
-            results = execute(self.chef_manager.run_chef_client, hosts=hosts)
+            self.chef_manager.sync_deployment_data(hosts)
+        results = {}
         failed = False
-        for machine, result in results.iteritems():
+        # Report each host as soon as its chef-client run is done
+        for machine, result in get_executor().stream(self.chef_manager.run_chef_client,
+                                                     hosts, warn_only=True):
+            results[machine] = result
+            if isinstance(result, BaseException):
+                failed = True
+                print red('Unable to run Chef Client on ' + machine + ': ' + str(result))
+                continue
+            self.chef_report.add(machine, result.stdout, role)
             if result.succeeded:
                 print green('Success on host: ' + machine)
             if result.failed:
@@ -107,33 +153,40 @@ class Chef(DeployerPlugin):
                 print red('Chef Client failed on ' + machine + ' log available at ' +  fail_log_name)
                 with open(fail_log_name, 'w') as file:
                     file.write(result.stdout)
+        self.chef_report.save()
         if failed:
             exit(1)
-        execute(self.chef_manager.pull_node_info, hosts=hosts)
+        run_task(self.chef_manager.pull_node_info, hosts)
         return results
 
     def prepare(self):
         self.chef_manager.sync_ssh_key(self.all_hosts)
         self.chef_manager.clear_run_list(self.all_hosts)
-        order = [self.chef_manager.push_deployment_data,
-                 self.chef_manager.bootstrap_chef,
+        # Hosts may have been rebuilt since the last deployment
+        self.chef_manager.forget_deployment_data(self.all_hosts)
+        with hide(*self.hidden_outputs):
+            self.chef_manager.sync_deployment_data(self.all_hosts)
+        order = [self.chef_manager.bootstrap_chef,
                  self.chef_manager.run_chef_client,
                  self.chef_manager.pull_node_info]
         for method in order:
             with hide(*self.hidden_outputs):
-                execute(method, hosts=self.all_hosts)
+                results = run_task(method, self.all_hosts)
+            if method == self.chef_manager.run_chef_client:
+                self._record_chef_runs(results, 'prepare')
+        self._print_chef_report()
         print green('Prepare has completed successfully. '
                     'Continue on to the provision phase')
 
     def _pre_provision_check(self):
         if self.roles['clc']:
-            clc_attributes = self.chef_manager.get_node_json(list(self.roles['clc'])[0])
-            clc_euca_attributes = clc_attributes['normal']['eucalyptus']
-            if 'cloud-keys' in clc_euca_attributes:
+            clc_node = self.chef_manager.get_node_record(list(self.roles['clc'])[0])
+            cloud_keys = clc_node.attribute('normal', 'eucalyptus', 'cloud-keys')
+            if cloud_keys is not None:
                 keys = ['cloud-cert.pem', 'cloud-pk.pem', 'euca.p12']
                 for key in keys:
-                    if key not in clc_euca_attributes['cloud-keys']:
-                        print red('Unable to find cloud keys {0} in CLC attributes'.format(clc_euca_attributes[key]))
+                    if key not in cloud_keys:
+                        print red('Unable to find cloud keys {0} in CLC attributes'.format(key))
                         print red('Re-run the prepare step and ensure that it '
                                   'is successful')
                         exit(1)
@@ -143,22 +196,63 @@ class Chef(DeployerPlugin):
                           'successful')
                 exit(1)
 
+    def _provision_role(self, component_name):
+        # Every span below, also on the executor's threads, is tagged with the role
+        with trace_context(role=component_name), span('provision_role', 'chef'):
+            self.chef_manager.add_to_run_list(
+                self.roles[component_name],
+                self._get_recipe_list(component_name))
+            self._run_chef_on_hosts(self.roles[component_name], component_name)
+            self.chef_manager.clear_run_list(self.roles[component_name])
+        print green('Provision has completed successfully on ' +
+                    str(self.roles[component_name]) + ' ran roles: ' +
+                    str(self._get_recipe_list(component_name)) + '.')
+
+    def _provision_by_host(self, scheduler):
+        # Merge the run lists of every role a host holds so each host
+        # converges once per phase instead of once per role
+        phases = scheduler.phases()
+        for number, phase_roles in enumerate(phases):
+            with trace_context(phase=number + 1), \
+                    span('provision_phase', 'chef', roles=','.join(phase_roles)):
+                hosts = set()
+                for component_name in phase_roles:
+                    self.chef_manager.add_to_run_list(
+                        self.roles[component_name],
+                        self._get_recipe_list(component_name))
+                    hosts.update(self.roles[component_name])
+                self._run_chef_on_hosts(hosts, ','.join(phase_roles))
+                self.chef_manager.clear_run_list(hosts)
+            print green('Provision phase {0}/{1} has completed successfully on {2}'
+                        ' hosts, ran roles: {3}.'.format(number + 1, len(phases),
+                                                        len(hosts), phase_roles))
+
     def provision(self):
         # self._pre_provision_check()
+        role_order = []
         for role_dict in self.config['roles']:
-            component_name = role_dict.keys().pop()
+            component_name = self._get_component_name(role_dict)
             if self.roles.get(component_name):
-                self.chef_manager.add_to_run_list(
-                    self.roles[component_name],
-                    self._get_recipe_list(component_name))
-                self._run_chef_on_hosts(self.roles[component_name])
-                self.chef_manager.clear_run_list(self.roles[component_name])
-                print green('Provision has completed successfully on ' +
-                            str(self.roles[component_name]) + ' ran roles: ' +
-                            str(self._get_recipe_list(component_name)) + '.')
+                role_order.append(component_name)
             else:
                 print yellow('Found ' + component_name + ' in config, but no' +
                              ' host for this role!')
+        workers = self.config.get('role-workers', 4)
+        if get_executor().name == 'fabric':
+            # fabric's execute and hide change process wide state, roles
+            # can not be provisioned side by side
+            workers = 1
+        scheduler = ProvisionScheduler(role_order, self.roles,
+                                       depends_on=self._get_role_dependencies(),
+                                       workers=workers)
+        if self.config.get('provision-mode', 'role') == 'host':
+            self._provision_by_host(scheduler)
+        else:
+            try:
+                scheduler.run(self._provision_role)
+            finally:
+                scheduler.print_critical_path()
+        self._print_chef_report()
         print green('Provision has completed successfully. '
                     'Your cloud is now configured and ready to use.')
 
@@ -188,9 +282,9 @@ class Chef(DeployerPlugin):
         if self.roles['midolman']:
             self.chef_manager.add_to_run_list(self.all_hosts,
                                               ['eucalyptus::midolman-nuke'])
-        self._run_chef_on_hosts(self.all_hosts)
+        self._run_chef_on_hosts(self.all_hosts, 'uninstall')
         with lcd('chef-repo'):
             local('knife node bulk delete -z -E {0} -y ".*"'.format(self.environment_name))
-        execute(self.chef_manager.clear_node_info, hosts=self.all_hosts)
+        run_task(self.chef_manager.clear_node_info, self.all_hosts)
         print green('Uninstall has completed successfully. '
                     'Your cloud is now torn down.')
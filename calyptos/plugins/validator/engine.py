@@ -0,0 +1,75 @@
+ANY = '*'
+
+# Paths of the environment shared by several validators
+EUCALYPTUS = ('default_attributes', 'eucalyptus')
+TOPOLOGY = EUCALYPTUS + ('topology',)
+CLUSTERS = TOPOLOGY + ('clusters', ANY)
+SYSTEM_PROPERTIES = EUCALYPTUS + ('system-properties',)
+
+
+class _RuleNode(object):
+    __slots__ = ('callbacks', 'children', 'wildcard')
+
+    def __init__(self):
+        self.callbacks = []
+        self.children = {}
+        self.wildcard = None
+
+
+class ValidationEngine(object):
+    """
+    Walks the environment once for all validators.
+
+    Validators register rules, a path and a callback. Path elements are
+    keys of the environment, or ANY to match every key of a mapping or every
+    item of a list. Callbacks are called with the path of the node and the
+    node, for every node that matches. The walk only descends into the parts
+    of the environment some rule is interested in, so every node is visited
+    at most once no matter how many validators there are.
+    """
+
+    def __init__(self, validators=None):
+        self.root = _RuleNode()
+        self.validators = list(validators or [])
+        for validator in self.validators:
+            for path, callback in validator.rules():
+                self.register(path, callback)
+
+    def register(self, path, callback):
+        node = self.root
+        for key in path:
+            if key == ANY:
+                if node.wildcard is None:
+                    node.wildcard = _RuleNode()
+                node = node.wildcard
+            else:
+                node = node.children.setdefault(key, _RuleNode())
+        node.callbacks.append(callback)
+
+    def walk(self, environment):
+        self._visit(self.root, (), environment)
+
+    def _visit(self, node, path, value):
+        for callback in node.callbacks:
+            callback(path, value)
+        if node.wildcard is not None:
+            if isinstance(value, dict):
+                items = value.iteritems()
+            elif isinstance(value, list):
+                items = enumerate(value)
+            else:
+                return
+            for key, child_value in items:
+                self._visit(node.wildcard, path + (key,), child_value)
+        if isinstance(value, dict):
+            for key, child in node.children.iteritems():
+                if key in value:
+                    self._visit(child, path + (key,), value[key])
+
+    def run(self, environment):
+        """
+        Walk environment and mark every validator as fed
+        """
+        self.walk(environment)
+        for validator in self.validators:
+            validator.walked = True
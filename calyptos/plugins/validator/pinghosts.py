@@ -1,33 +1,30 @@
 from calyptos.plugins.validator.validatorplugin import ValidatorPlugin
-from fabric.colors import yellow, red
-import threading
-import subprocess
-import platform
+from calyptos.reachability import probe_hosts
+from fabric.colors import green, yellow, red
 
 
 
 class PingHosts(ValidatorPlugin):
-    hostlock = threading.Lock()
+    # 'tcp' connects to port, 'icmp' needs a raw socket, 'auto' picks icmp
+    # when it is permitted
+    method = 'auto'
+    port = 22
+    count = 3
+    concurrency = 200
+    timeout = 3
+    # Seconds allowed for probing every host
+    deadline = 60
 
     def validate(self):
-        results = {}
-        threads = []
-
-        def results_ping(host, count, hostlock):
-            res = self.ping_ip(host, count=count)
-            with hostlock:
-                results[host] = res
-        for host in self.component_deployer.all_hosts:
-            t = threading.Thread(target=results_ping, args=(host, 3, self.hostlock))
-            threads.append(t)
-            t.start()
-        for t in threads:
-            t.join()
+        results = probe_hosts(self.component_deployer.all_hosts, method=self.method,
+                              port=self.port, count=self.count,
+                              concurrency=self.concurrency, timeout=self.timeout,
+                              deadline=self.deadline)
+        self.print_summary(results)
         total_pings_failed = 0
         total_pings_passed = 0
         for host, result in results.iteritems():
-            if result:
-                self.success('Ping to ' + host)
+            if result.reachable:
                 total_pings_passed += 1
             else:
                 self.failure('Ping to ' + host)
@@ -40,17 +37,18 @@ class PingHosts(ValidatorPlugin):
             print red('Unable to reach all hosts, validation failed.')
             exit(total_pings_failed)
 
-    def ping_ip(self, host, count=3):
-        check_platform = platform.system()
-        if check_platform == "Linux":
-            args = 'ping -W 3 -c {0} {1}'.format(count, host)
-        else:
-            args = 'ping -W 3000 -c {0} {1}'.format(count, host)
-        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                                   bufsize=4096, shell=True)
-        output, unused_err = process.communicate()
-        retcode = process.poll()
-        print output
-        if retcode:
-            return False
-        return True
+    def print_summary(self, results):
+        print yellow('{0: <20} {1: <5} {2: >9} {3: >6} {4: >9} {5: >9} {6: >9}'.format(
+            'HOST', 'PROBE', 'RECEIVED', 'LOSS', 'MIN ms', 'AVG ms', 'MAX ms'))
+        for host in sorted(results):
+            result = results[host]
+            received = '{0}/{1}'.format(result.received, result.sent)
+            if result.reachable:
+                print green('{0: <20} {1: <5} {2: >9} {3: >5.0f}% {4: >9.1f} {5: >9.1f} '
+                            '{6: >9.1f}'.format(host, result.method, received, result.loss,
+                                                result.min * 1000, result.avg * 1000,
+                                                result.max * 1000))
+            else:
+                print red('{0: <20} {1: <5} {2: >9} {3: >5.0f}% {4}'.format(
+                    host, result.method, received, result.loss,
+                    result.error or 'no answer'))
@@ -1,34 +1,138 @@
+from calyptos.plugins.validator.engine import EUCALYPTUS
 from calyptos.plugins.validator.validatorplugin import ValidatorPlugin
-from urllib2 import Request, urlopen, URLError
+from urllib2 import Request, urlopen, URLError, HTTPError
+import httplib
+import json
+import os
+import random
+import socket
+import threading
 import time
 
+
+class HeadRequest(Request):
+    def get_method(self):
+        return 'HEAD'
+
+
+def _reason(error):
+    if isinstance(error, HTTPError):
+        return str(error.code)
+    return str(getattr(error, 'reason', error))
+
+
 class Repos(ValidatorPlugin):
+    repotypes = ['default-img-url', 'euca2ools-repo', 'eucalyptus-repo', 'init-script-url', 'post-script-url']
+    # Seconds allowed for checking all repos, retries included
+    deadline = 120
+    # Retries back off exponentially from base_delay up to max_delay seconds
+    base_delay = 1.0
+    max_delay = 20.0
+    # Seconds a reachable URL is remembered and not checked again
+    cache_ttl = 3600
+    cache_file = os.path.join(os.path.expanduser('~'), '.cache', 'calyptos', 'repos.json')
+
+    def __init__(self, *args, **kwargs):
+        super(Repos, self).__init__(*args, **kwargs)
+        self.found_repos = {}
+
+    def rules(self):
+        return [(EUCALYPTUS + (repotype,), self._collect_repo) for repotype in self.repotypes]
+
+    def _collect_repo(self, path, url):
+        self.found_repos[path[-1]] = url
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_file) as cache_file:
+                cache = json.load(cache_file)
+        except (IOError, ValueError):
+            return {}
+        now = time.time()
+        return dict((url, checked) for url, checked in cache.iteritems()
+                    if now - checked < self.cache_ttl)
+
+    def _save_cache(self, cache):
+        try:
+            directory = os.path.dirname(self.cache_file)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            partial = self.cache_file + '.' + str(os.getpid())
+            with open(partial, 'w') as cache_file:
+                json.dump(cache, cache_file)
+            os.rename(partial, self.cache_file)
+        except (IOError, OSError):
+            pass
+
+    def _request(self, url, timeout):
+        # HEAD first, servers that do not allow it get a one byte GET
+        try:
+            response = urlopen(HeadRequest(url), timeout=timeout)
+        except HTTPError, e:
+            if e.code not in (405, 501):
+                raise
+            request = Request(url, headers={'Range': 'bytes=0-0'})
+            response = urlopen(request, timeout=timeout)
+        response.close()
+
+    def check_url(self, url, deadline):
+        """
+        :returns: None if url is reachable before deadline, else the last error
+        """
+        attempt = 0
+        while True:
+            try:
+                self._request(url, timeout=max(1, min(10, deadline - time.time())))
+                return None
+            except (URLError, socket.error, httplib.HTTPException), e:
+                error = e
+            except ValueError, e:
+                # Malformed url, e.g. unknown url type
+                return e
+            if isinstance(error, HTTPError) and 400 <= error.code < 500 \
+                    and error.code not in (408, 429):
+                # The server answered, asking again will not change its mind
+                return error
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            if time.time() + delay >= deadline:
+                return error
+            self.warning("Retrying to resolve " + str(url) + " and got: " + _reason(error))
+            time.sleep(delay)
+            attempt += 1
+
     def validate(self):
-        eucalyptus_attributes = self.environment['default_attributes']['eucalyptus']
-        self.repotypes = ['default-img-url', 'euca2ools-repo', 'eucalyptus-repo', 'init-script-url', 'post-script-url']
-        self.repos = []
-        for val in self.repotypes:
-            if val in eucalyptus_attributes:
-                self.repos.append(eucalyptus_attributes[val])
-        retry_delay = 10
-        retries = 12
+        self.walk_environment()
+        self.repos = [self.found_repos[val] for val in self.repotypes if val in self.found_repos]
+        cache = self._load_cache()
+        pending = []
         for url in self.repos:
-            req = Request(url)
-            for x in range(retries + 1):
-                try:
-                    response = urlopen(req)
-                    self.success('URL: ' + str(url) + ' is valid and reachable!')
-                except URLError, e:
-                    if x < retries:
-                        if hasattr(e, 'reason'):
-                            self.warning("Retrying to resolve " + str(url) + " and got: " + str(e.reason))
-                        elif hasattr(e, 'code'):
-                            self.warning("Retrying to resolve " + str(url) + " and got: " + str(e.code))
-                        time.sleep(retry_delay)
-                        continue
-                    else:
-                        if hasattr(e, 'reason'):
-                            raise AssertionError("INVALID URL: " + str(url) + "  " + str(e.reason))
-                        elif hasattr(e, 'code'):
-                            raise AssertionError("INVALID REQUEST: " + str(url) + "  " + str(e.code))
-                break
+            if url in cache:
+                self.success('URL: ' + str(url) + ' is valid and reachable! (checked recently)')
+            elif url not in pending:
+                pending.append(url)
+
+        errors = {}
+        deadline = time.time() + self.deadline
+
+        def check(url):
+            errors[url] = self.check_url(url, deadline)
+
+        threads = [threading.Thread(target=check, args=(url,)) for url in pending]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        invalid = []
+        for url in pending:
+            error = errors[url]
+            if error is None:
+                self.success('URL: ' + str(url) + ' is valid and reachable!')
+                cache[url] = time.time()
+            elif isinstance(error, HTTPError):
+                invalid.append("INVALID REQUEST: " + str(url) + "  " + _reason(error))
+            else:
+                invalid.append("INVALID URL: " + str(url) + "  " + _reason(error))
+        self._save_cache(cache)
+        if invalid:
+            raise AssertionError('\n'.join(invalid))
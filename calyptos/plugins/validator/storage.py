@@ -1,12 +1,26 @@
+from calyptos.plugins.validator.engine import CLUSTERS, SYSTEM_PROPERTIES
 from calyptos.plugins.validator.validatorplugin import ValidatorPlugin
 
 class Storage(ValidatorPlugin):
+    def __init__(self, *args, **kwargs):
+        super(Storage, self).__init__(*args, **kwargs)
+        self.clusters = []
+        self.systemproperties = {}
+
+    def rules(self):
+        return [(CLUSTERS, self._collect_cluster),
+                (SYSTEM_PROPERTIES, self._collect_system_properties)]
+
+    def _collect_cluster(self, path, cluster):
+        self.clusters.append((path[-1], cluster))
+
+    def _collect_system_properties(self, path, properties):
+        self.systemproperties = properties or {}
+
     def validate(self):
-        self.topology = self.environment['default_attributes']['eucalyptus']['topology']
-        if 'system-properties' in self.environment['default_attributes']['eucalyptus']:
-            self.systemproperties = self.environment['default_attributes']['eucalyptus']['system-properties']
-        for name in self.topology['clusters'].keys():
-            if 'storage-backend' in self.topology['clusters'][name]:
+        self.walk_environment()
+        for name, cluster in self.clusters:
+            if 'storage-backend' in cluster:
                 storage_options = ['netapp', 'ceph-rbd', 'threepar']
                 netapp_properties = [name + '.storage.chapuser', name + '.storage.ncpaths', name + '.storage.scpaths',
                                      name + '.storage.sanhost', name + '.storage.sanpassword', name +
@@ -19,7 +33,7 @@ class Storage(ValidatorPlugin):
                                        '.storage.scpaths', name + '.storage.threeparusercpg',
                                        name + '.storage.threeparcopycpg']
                 for val1 in storage_options:
-                    if val1 in self.topology['clusters'][name]['storage-backend']:
+                    if val1 in cluster['storage-backend']:
                         if val1 == "netapp":
                             storage_properties = netapp_properties
                         if val1 == "ceph-rbd":
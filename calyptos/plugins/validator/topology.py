@@ -1,14 +1,54 @@
+from calyptos.plugins.validator.engine import CLUSTERS, TOPOLOGY
 from calyptos.plugins.validator.validatorplugin import ValidatorPlugin
 
+
+def _hosts(value):
+    if isinstance(value, list):
+        return value
+    return str(value).split()
+
+
 class Topology(ValidatorPlugin):
+    def __init__(self, *args, **kwargs):
+        super(Topology, self).__init__(*args, **kwargs)
+        self.topology = None
+        self.clusters = []
+        # host -> clusters it is part of, and node -> clusters listing it
+        self.host_clusters = {}
+        self.node_clusters = {}
+
+    def rules(self):
+        return [(TOPOLOGY, self._collect_topology),
+                (CLUSTERS, self._collect_cluster)]
+
+    def _collect_topology(self, path, topology):
+        self.topology = topology
+
+    def _collect_cluster(self, path, cluster):
+        name = path[-1]
+        self.clusters.append((name, cluster))
+        if not isinstance(cluster, dict):
+            return
+        for key, value in cluster.iteritems():
+            if key == 'nodes':
+                for host in _hosts(value):
+                    self.node_clusters.setdefault(host, []).append(name)
+                    self.host_clusters.setdefault(host, set()).add(name)
+            elif key.split('-')[0] in ('cc', 'sc'):
+                for host in _hosts(value):
+                    self.host_clusters.setdefault(host, set()).add(name)
+
     def validate(self):
+        self.walk_environment()
         self.failed_hosts = []
         self.good_hosts = []
         # Check each cluster
         self._single_cluster_per_host()
+        self._unique_nodes()
 
         riakcs_keys_master = ['access-key', 'admin-email', 'admin-name', 'endpoint', 'port', 'secret-key']
-        self.topology = self.environment['default_attributes']['eucalyptus']['topology']
+        if self.topology is None:
+            raise AssertionError("No eucalyptus topology found in the environment")
         assert self.roles['clc']
         assert self.roles['user-facing']
         if 'walrus' in self.topology and 'riakcs' in self.topology:
@@ -23,37 +63,26 @@ class Topology(ValidatorPlugin):
                     self.success('Found riakcs key: ' + val)
                 except AssertionError, e:
                     self.failure('riakcs key "' + val + '" is missing or invalid!  ' + str(e))
-        for name in self.topology['clusters'].keys():
-            assert self.topology['clusters'][name]['cc-1']
-            assert self.topology['clusters'][name]['sc-1']
+        for name, cluster in self.clusters:
+            assert cluster['cc-1']
+            assert cluster['sc-1']
             self.success('Cluster ' + name + ' has both an SC and CC')
-            assert self.topology['clusters'][name]['nodes']
+            assert cluster['nodes']
             self.success('Cluster ' + name + ' has node controllers')
 
-
-
     def _single_cluster_per_host(self):
-        cluster_hosts = self.roles['cluster']
-        for name, hosts in cluster_hosts.iteritems():
-            # Check that each host...
-            for host in hosts:
-                # Only appears in one cluster
-                appearances = []
-                for cluster in cluster_hosts.keys():
-                    if host in cluster:
-                        appearances.append(cluster)
-                if len(appearances) > 1:
-                    raise AssertionError("Found " + host + " in multiple clusters: " + str(
-                            appearances))
-                else:
-                    self.success(host + " only in 1 cluster")
-                    self.good_hosts.append(host)
-
-
-
-
-
-
-
-
+        for host, clusters in sorted(self.host_clusters.iteritems()):
+            if len(clusters) > 1:
+                self.failure("Found " + host + " in multiple clusters: " + str(sorted(clusters)))
+                self.failed_hosts.append(host)
+            else:
+                self.success(host + " only in 1 cluster")
+                self.good_hosts.append(host)
 
+    def _unique_nodes(self):
+        for host, clusters in sorted(self.node_clusters.iteritems()):
+            if len(clusters) > 1:
+                self.failure("Node " + host + " is listed more than once, in clusters: " +
+                             str(clusters))
+                if host not in self.failed_hosts:
+                    self.failed_hosts.append(host)
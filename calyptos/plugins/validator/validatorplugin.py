@@ -2,6 +2,7 @@
 import abc
 from fabric.colors import red, green, cyan, yellow
 import six
+from calyptos.plugins.validator.engine import ValidationEngine
 
 
 @six.add_metaclass(abc.ABCMeta)
@@ -15,6 +16,7 @@ class ValidatorPlugin(object):
         self.component_deployer = component_deployer
         self.environment = self.component_deployer.read_environment()
         self.roles = self.component_deployer.get_roles()
+        self.walked = False
         print cyan(self.message_style.format('TEST STARTING', self.name))
 
     def success(self, message):
@@ -34,6 +36,18 @@ class ValidatorPlugin(object):
                                                  str(passed),
                                                  str(failed))))
 
+    def rules(self):
+        """
+        :returns: list of (path, callback) fed by the ValidationEngine, see
+                  calyptos.plugins.validator.engine
+        """
+        return []
+
+    def walk_environment(self):
+        # Validators that are not run through the engine walk on their own
+        if not self.walked:
+            ValidationEngine([self]).run(self.environment)
+
     def validate(self):
         """Format the data and return unicode text.
 
@@ -17,13 +17,27 @@ class VPC(ValidatorPlugin):
         self.bgp_peers_path = self.midokura_path + ['bgp-peers']
         self.midonet_api_path = self.midokura_path + ['midonet-api-url']
 
+        self.mido_host_mapping_path = self.midokura_path + ['midolman-host-mapping']
+
         # Store Euca/Midonet Gateways Hostnames for verification purposes
         self.mido_gw_hostnames = []
+        # Attributes collected while walking the environment, by path
+        self.attributes = {}
+
+    def rules(self):
+        paths = [self.net_mode_path, self.mido_config_path,
+                 self.mido_config_path + ['GatewayHost'], self.mido_config_path + ['Gateways'],
+                 self.zookeepers_path, self.cassandras_path, self.mido_host_mapping_path]
+        return [(tuple(path), self._collect_attr) for path in paths]
+
+    def _collect_attr(self, path, value):
+        self.attributes[path] = value
 
     def validate(self):
         """
         Top level Validation Method
         """
+        self.walk_environment()
         net_mode = self._get_env_attr(self.net_mode_path)
         if net_mode == 'VPCMIDO':
             # Make sure the mido config section is present
@@ -46,6 +60,9 @@ class VPC(ValidatorPlugin):
         info on missing attributes in the requested path.
         :raises :KeyError
         """
+        if tuple(path) in self.attributes:
+            return self.attributes[tuple(path)]
+        # Not collected by the walk, follow the path to find where it ends
         context = self.environment
         for key in path:
             if isinstance(context, dict) and context.has_key(key):
@@ -73,7 +90,7 @@ class VPC(ValidatorPlugin):
                              .format(self._path_to_string(gateways_path)))
             try:
                 # Check to make sure only one method of providing a gateway is present
-                self.mido_config_path + ['Gateways']
+                self._get_env_attr(self.mido_config_path + ['Gateways'])
                 self.failure('Found both "Gateways" and the older "GatewayHost" config attributes '
                              'present in the Environment. Replace GatewayHost to use only the '
                              '"Gateways" list attribute instead')
@@ -116,14 +133,20 @@ class VPC(ValidatorPlugin):
         in the hostname to IP addr mapping attribute
         """
         try:
-            mapping = self._get_env_attr(['default_attributes', 'midokura',
-                                          'midolman-host-mapping'])
+            mapping = self._get_env_attr(self.mido_host_mapping_path)
             self.success('VPC - Midolman hostmapping exists')
         except KeyError as KE:
             self.failure(str(KE))
             return
         clc = self.component_deployer.roles['clc']
         nc = self.component_deployer.roles['node-controller']
+        mapped_hostnames = {}
+        for hostname, ip in mapping.iteritems():
+            mapped_hostnames.setdefault(ip, []).append(hostname)
+        for ip, hostnames in sorted(mapped_hostnames.iteritems()):
+            if len(hostnames) > 1:
+                self.failure('VPC - The IP {0} is mapped from more than one host in the Midolman '
+                             'host-mapping: {1}'.format(ip, ', '.join(sorted(hostnames))))
 
         for hostname, ip in mapping.iteritems():
             if ip not in clc and ip not in nc and hostname not in self.mido_gw_hostnames:
@@ -133,12 +156,12 @@ class VPC(ValidatorPlugin):
                 self.success('VPC - VPC midolman check: {0}:{1} is either an NCs, CLCs, '
                              'or MidoGateway'.format(hostname, ip))
         for ip in clc:
-            if ip not in mapping.values():
+            if ip not in mapped_hostnames:
                 self.failure('VPC - Did not find clc ({0}) in Midolman host-mapping'.format(ip))
             else:
                 self.success('VPC - CLC {0} is in the Midolman host-mapping'.format(ip))
         for ip in nc:
-            if ip not in mapping.values():
+            if ip not in mapped_hostnames:
                 self.failure('VPC - Did not find NC ({0}) in Midolman host-mapping'.format(ip))
             else:
                 self.success('VPC - NC {0} is in the midolman host-mapping'.format(ip))
@@ -0,0 +1,65 @@
+import uuid
+
+from calyptos.sshpool import get_pool, RemoteResult
+
+
+def _probe_items(probes):
+    if isinstance(probes, dict):
+        return sorted(probes.items())
+    return list(probes)
+
+
+def build_probe_script(probes, marker):
+    """
+    Join probes into one shell script. Each probe runs in its own subshell
+    with stderr combined into stdout, and its output is framed by marker
+    lines carrying the probe name and exit status.
+    """
+    lines = []
+    for name, command in _probe_items(probes):
+        lines.append("echo '{0} begin {1}'".format(marker, name))
+        lines.append('( {0}\n) 2>&1 < /dev/null'.format(command))
+        lines.append("echo '{0} end {1}' $?".format(marker, name))
+    return '\n'.join(lines)
+
+
+def parse_probe_output(output, host, probes, marker):
+    """
+    :returns: dict of probe name -> RemoteResult, probes that never finished
+              get a return_code of -1
+    """
+    commands = dict(_probe_items(probes))
+    results = {}
+    name = None
+    lines = []
+    for line in output.splitlines():
+        if line.startswith(marker + ' '):
+            fields = line.split()
+            if fields[1] == 'begin':
+                name = fields[2]
+                lines = []
+            elif fields[1] == 'end' and name == fields[2]:
+                return_code = int(fields[3]) if len(fields) > 3 else -1
+                results[name] = RemoteResult('\n'.join(lines).strip(), host,
+                                             commands[name], return_code)
+                name = None
+        elif name is not None:
+            lines.append(line)
+    for name, command in commands.iteritems():
+        if name not in results:
+            results[name] = RemoteResult('', host, command, -1)
+    return results
+
+
+def run_probes(host, probes, timeout=None):
+    """
+    Run a set of named probes on host in a single round trip
+
+    :param probes: dict of probe name -> shell command, or a list of
+                   (name, command) pairs to keep their order
+    :returns: dict of probe name -> RemoteResult
+    """
+    marker = '@@calyptos-probe-' + uuid.uuid4().hex
+    result = get_pool().run(host, build_probe_script(probes, marker),
+                            timeout=timeout)
+    return parse_probe_output(result, host, probes, marker)
@@ -0,0 +1,202 @@
+from collections import deque
+import errno
+import os
+import select
+import socket
+import struct
+import time
+
+
+class Reachability(object):
+    """
+    Round trip times of the probes sent to one host
+    """
+
+    def __init__(self, host, method):
+        self.host = host
+        self.method = method
+        self.sent = 0
+        self.rtts = []
+        self.error = None
+
+    @property
+    def received(self):
+        return len(self.rtts)
+
+    @property
+    def reachable(self):
+        return bool(self.rtts)
+
+    @property
+    def loss(self):
+        if not self.sent:
+            return 100.0
+        return 100.0 * (self.sent - self.received) / self.sent
+
+    @property
+    def min(self):
+        return min(self.rtts) if self.rtts else None
+
+    @property
+    def max(self):
+        return max(self.rtts) if self.rtts else None
+
+    @property
+    def avg(self):
+        return sum(self.rtts) / len(self.rtts) if self.rtts else None
+
+
+def icmp_permitted():
+    try:
+        socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP).close()
+        return True
+    except socket.error:
+        return False
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += '\0'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def _echo_request(identifier, sequence):
+    payload = struct.pack('!d', time.time())
+    header = struct.pack('!BBHHH', 8, 0, 0, identifier, sequence)
+    checksum = _checksum(header + payload)
+    return struct.pack('!BBHHH', 8, 0, checksum, identifier, sequence) + payload
+
+
+def _resolve(hosts, results):
+    addresses = {}
+    for host in hosts:
+        try:
+            addresses[host] = socket.gethostbyname(host)
+        except socket.error, e:
+            results[host].error = e
+    return addresses
+
+
+def _probe_tcp(addresses, results, port, count, concurrency, timeout, deadline):
+    # Every host gets its first probe before any host gets its second
+    queue = deque((host, address) for _ in range(count)
+                  for host, address in sorted(addresses.iteritems()))
+    in_flight = {}
+    while (queue or in_flight) and time.time() < deadline:
+        while queue and len(in_flight) < concurrency:
+            host, address = queue.popleft()
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(0)
+            results[host].sent += 1
+            started = time.time()
+            code = sock.connect_ex((address, port))
+            if code in (0, errno.ECONNREFUSED):
+                results[host].rtts.append(time.time() - started)
+                sock.close()
+            elif code in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                in_flight[sock] = (host, started)
+            else:
+                results[host].error = socket.error(code, os.strerror(code))
+                sock.close()
+        if not in_flight:
+            continue
+        now = time.time()
+        wait = min(deadline, min(started for _, started in in_flight.itervalues()) + timeout) - now
+        _, writable, failed = select.select([], in_flight.keys(), in_flight.keys(), max(0, wait))
+        now = time.time()
+        for sock in set(writable) | set(failed):
+            host, started = in_flight.pop(sock)
+            code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            # A refused connection still proves the host answered
+            if code in (0, errno.ECONNREFUSED):
+                results[host].rtts.append(now - started)
+            else:
+                results[host].error = socket.error(code, os.strerror(code))
+            sock.close()
+        for sock, (host, started) in in_flight.items():
+            if now - started >= timeout:
+                del in_flight[sock]
+                sock.close()
+    for sock in in_flight:
+        sock.close()
+
+
+def _probe_icmp(addresses, results, count, concurrency, timeout, deadline):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+    sock.setblocking(0)
+    identifier = os.getpid() & 0xffff
+    queue = deque((host, address) for _ in range(count)
+                  for host, address in sorted(addresses.iteritems()))
+    in_flight = {}
+    sequence = 0
+    try:
+        while (queue or in_flight) and time.time() < deadline:
+            while queue and len(in_flight) < concurrency:
+                host, address = queue.popleft()
+                sequence = (sequence + 1) & 0xffff
+                results[host].sent += 1
+                in_flight[sequence] = (host, address, time.time())
+                try:
+                    sock.sendto(_echo_request(identifier, sequence), (address, 0))
+                except socket.error, e:
+                    results[host].error = e
+                    del in_flight[sequence]
+            if not in_flight:
+                continue
+            now = time.time()
+            wait = min(deadline,
+                       min(started for _, _, started in in_flight.itervalues()) + timeout) - now
+            readable, _, _ = select.select([sock], [], [], max(0, wait))
+            while readable:
+                try:
+                    packet, (source, _) = sock.recvfrom(2048)
+                except socket.error:
+                    break
+                now = time.time()
+                offset = (ord(packet[0]) & 0x0f) * 4
+                kind, _, _, reply_id, reply_sequence = struct.unpack(
+                    '!BBHHH', packet[offset:offset + 8])
+                if kind != 0 or reply_id != identifier or reply_sequence not in in_flight:
+                    continue
+                host, address, started = in_flight[reply_sequence]
+                if address == source:
+                    del in_flight[reply_sequence]
+                    results[host].rtts.append(now - started)
+            now = time.time()
+            for key, (host, address, started) in in_flight.items():
+                if now - started >= timeout:
+                    del in_flight[key]
+    finally:
+        sock.close()
+
+
+def probe_hosts(hosts, method='auto', port=22, count=3, concurrency=200, timeout=3.0,
+                deadline=60.0):
+    """
+    Probe hosts from a single select loop, without a thread or process per
+    host.
+
+    :param method: 'tcp' connects to port, a refused connection counts as an
+                   answer. 'icmp' sends echo requests and needs a raw socket.
+                   'auto' uses icmp when permitted and tcp otherwise
+    :param count: probes sent to every host
+    :param concurrency: probes outstanding at once
+    :param timeout: seconds to wait for the answer to one probe
+    :param deadline: seconds allowed for probing all hosts
+    :returns: dict of host -> Reachability
+    """
+    # select() can not watch descriptors past FD_SETSIZE
+    concurrency = max(1, min(concurrency, 900))
+    if method == 'auto':
+        method = 'icmp' if icmp_permitted() else 'tcp'
+    results = dict((host, Reachability(host, method)) for host in hosts)
+    addresses = _resolve(hosts, results)
+    deadline = time.time() + deadline
+    if method == 'icmp':
+        _probe_icmp(addresses, results, count, concurrency, timeout, deadline)
+    else:
+        _probe_tcp(addresses, results, port, count, concurrency, timeout, deadline)
+    return results
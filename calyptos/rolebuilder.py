@@ -1,6 +1,30 @@
+import os
+import threading
 import yaml
 
 
+_environments = {}
+_environments_lock = threading.Lock()
+
+
+def load_environment(environment_file):
+    """
+    :returns: the parsed environment file. The file is parsed once and the
+              result is shared, until the file changes on disk, so treat it
+              as read-only
+    """
+    path = os.path.abspath(environment_file)
+    info = os.stat(path)
+    key = (info.st_mtime, info.st_size)
+    with _environments_lock:
+        cached = _environments.get(path)
+        if cached is None or cached[0] != key:
+            with open(path) as env_file:
+                cached = (key, yaml.load(env_file.read()))
+            _environments[path] = cached
+        return cached[1]
+
+
 class RoleBuilder():
 
     # Global list of roles
@@ -28,17 +52,18 @@ class RoleBuilder():
 
     def __init__(self, environment_file='environment.yml'):
         self.environment_file = environment_file
+        self.environment = load_environment(environment_file)
         self.env_dict = self.get_all_attributes()
-        self.roles = self.get_roles()
+        self.roles = self._freeze_roles(self._build_roles())
         self.all_hosts = self.roles['all']
+        self._build_indexes()
+        self._build_groups()
 
     def read_environment(self):
-        with open(self.environment_file) as env_file:
-            return yaml.load(env_file.read())
+        return self.environment
 
     def get_all_attributes(self):
-        env_dicts = self.read_environment()
-        return env_dicts['default_attributes']
+        return self.environment['default_attributes']
 
     def get_euca_attributes(self):
         try:
@@ -76,21 +101,86 @@ class RoleBuilder():
             roles[role] = set()
         return roles
 
+    @staticmethod
+    def _freeze_roles(roles):
+        # Role sets are shared by every consumer, so they can not be changed
+        frozen = dict((role, frozenset(hosts)) for role, hosts in roles.iteritems()
+                      if role != 'cluster')
+        if 'cluster' in roles:
+            frozen['cluster'] = dict((name, frozenset(hosts))
+                                     for name, hosts in roles['cluster'].iteritems())
+        return frozen
+
+    def _build_groups(self):
+        # Eucalyptus only components
+        euca_components = ['clc', 'user-facing', 'cluster-controller',
+                           'storage-controller', 'node-controller', 'walrus']
+        self.euca_hosts = frozenset().union(*[self.roles[component]
+                                              for component in euca_components])
+        # Eucalyptus Java components
+        java_components = ['clc', 'user-facing', 'storage-controller', 'walrus']
+        self.java_components = frozenset().union(*[self.roles[component]
+                                                   for component in java_components])
+
     def get_euca_hosts(self):
-        roles = self.get_roles()
+        return self.euca_hosts
+
+    def get_java_components(self):
+        return self.java_components
+
+    def _build_indexes(self):
+        self.role_hosts = dict((role, hosts) for role, hosts in self.roles.iteritems()
+                               if role != 'cluster')
+        self.host_roles = {}
+        for role, hosts in self.role_hosts.iteritems():
+            if role == 'all':
+                continue
+            for host in hosts:
+                self.host_roles.setdefault(host, set()).add(role)
+        self.host_roles = dict((host, frozenset(roles))
+                               for host, roles in self.host_roles.iteritems())
+        self.clusters = self.roles.get('cluster', {})
+        self.host_cluster = {}
+        for name, hosts in self.clusters.iteritems():
+            for host in hosts:
+                self.host_cluster[host] = name
+        # midolman hostname -> ip, and ip -> hostname
+        self.midolman_hosts = self._get_midolman_host_mapping()
+        self.midolman_hostnames = dict((host_ip, hostname) for hostname, host_ip
+                                       in self.midolman_hosts.iteritems())
+
+    def _get_midolman_host_mapping(self):
+        euca_attributes = self.get_euca_attributes()
+        if not euca_attributes or euca_attributes['network']['mode'] != 'VPCMIDO':
+            return {}
+        midonet = euca_attributes.get('midonet') or {}
+        return dict(midonet.get('midolman-host-mapping') or {})
+
+    def get_host_roles(self, host):
+        return self.host_roles.get(host, frozenset())
 
-        # Create set of Eucalytpus only componnents
-        euca_components = ['user-facing', 'cluster-controller',
-                           'storage-controller', 'node-controller']
-        if roles['walrus']:
-            euca_components.append('walrus')
+    def get_role_hosts(self, role):
+        return self.role_hosts.get(role, frozenset())
 
-        all_hosts = roles['clc']
-        for component in euca_components:
-            all_hosts.update(roles[component])
-        return all_hosts
+    def get_cluster(self, host):
+        """
+        :returns: name of the cluster host belongs to, None if it is not
+                  part of a cluster
+        """
+        return self.host_cluster.get(host)
 
     def get_roles(self):
+        """
+        :returns: dict of role -> frozenset of hosts, plus 'cluster' with a
+                  dict of cluster name -> frozenset of hosts. The sets are
+                  shared, use set(...) or union() to get a set to change
+        """
+        roles = dict(self.roles)
+        if 'cluster' in roles:
+            roles['cluster'] = dict(roles['cluster'])
+        return roles
+
+    def _build_roles(self):
         roles = self._initialize_roles()
         euca_attributes = self.get_euca_attributes()
         ceph_attributes = self.get_ceph_attributes()
@@ -190,8 +280,8 @@ class RoleBuilder():
                 roles['walrus'] = set()
 
             # Add cluster level components
+            roles['cluster'] = {}
             for name in topology['clusters']:
-                roles['cluster'] = {}
                 if 'cc' in topology['clusters'][name]:
                     cc = topology['clusters'][name]['cc']
                     for c in cc:
@@ -246,7 +336,6 @@ class RoleBuilder():
             roles['midonet-gateway'] = set(mido_gw_ips)
             for mngw in roles['midonet-gateway']:
                 roles['all'].add(mngw)
-            midolman_host_mapping = midonet.get('midolman-host-mapping', None)
-            for hostname, host_ip in midolman_host_mapping.iteritems():
+            for host_ip in self._get_midolman_host_mapping().itervalues():
                 roles['midolman'].add(host_ip)
         return roles
@@ -0,0 +1,266 @@
+import threading
+import time
+
+from fabric.colors import cyan, yellow
+
+
+# Orderings between roles that hold no matter how the roles are listed in the
+# deployer config. A '*' entry means every role listed before it in the config
+# has to be finished first. Roles that are not listed here (and have no
+# explicit depends_on) wait for every role listed before them. Roles sharing a
+# host also run in config order, e.g. midolman before node-controller.
+DEFAULT_ROLE_DEPENDENCIES = {
+    'zookeeper': [],
+    'cassandra': [],
+    'clc': [],
+    'midonet-cluster': ['zookeeper', 'cassandra', 'clc'],
+    'midolman': ['midonet-cluster'],
+    'walrus': ['clc'],
+    'user-facing': ['clc'],
+    'cluster-controller': ['clc', 'walrus'],
+    'storage-controller': ['clc', 'walrus'],
+    'node-controller': ['clc', 'cluster-controller'],
+    'console': ['user-facing'],
+    'configure-eucalyptus': ['*'],
+    'configure-vpc': ['configure-eucalyptus'],
+    'setup-admin-creds': ['configure-eucalyptus'],
+    'riak-head': [],
+    'riak-node': ['riak-head'],
+    'haproxy': ['riak-head', 'riak-node'],
+    'mon-bootstrap': [],
+    'ceph-mons': ['mon-bootstrap'],
+    'ceph-osds': ['mon-bootstrap', 'ceph-mons'],
+}
+
+
+class SchedulerError(Exception):
+    pass
+
+
+class ProvisionScheduler(object):
+    """
+    Runs provisioning roles concurrently while honoring the ordering that
+    really exists between them.
+
+    A role starts once all of its dependencies have finished and none of its
+    hosts is busy with another role, since two chef-client runs can not share
+    a host. Roles sharing a host run in the order of the deployer config.
+    """
+
+    def __init__(self, role_order, role_hosts, depends_on=None, workers=4):
+        """
+        :param role_order: role names in deployer config order
+        :param role_hosts: dict of role name -> set of hosts
+        :param depends_on: dict of role name -> explicit dependency list,
+                           overrides DEFAULT_ROLE_DEPENDENCIES
+        :param workers: maximum number of roles provisioned at the same time
+        """
+        self.role_order = [role for role in role_order if role_hosts.get(role)]
+        self.role_hosts = dict((role, set(role_hosts[role]))
+                               for role in self.role_order)
+        self.explicit_dependencies = depends_on or {}
+        self.workers = max(1, int(workers))
+        self.dependencies = self._build_dependencies()
+        self.timings = {}
+        self.blocked_by = {}
+
+    def _build_dependencies(self):
+        dependencies = {}
+        for index, role in enumerate(self.role_order):
+            listed_before = self.role_order[:index]
+            if role in self.explicit_dependencies:
+                wanted = self.explicit_dependencies[role] or []
+            elif role in DEFAULT_ROLE_DEPENDENCIES:
+                wanted = DEFAULT_ROLE_DEPENDENCIES[role]
+            else:
+                wanted = ['*']
+            deps = set()
+            for dep in wanted:
+                if dep == '*':
+                    deps.update(listed_before)
+                elif dep in self.role_hosts and dep != role:
+                    deps.add(dep)
+            dependencies[role] = deps
+        # Unless told otherwise, roles sharing a host converge in config order
+        for index, role in enumerate(self.role_order):
+            for earlier in self.role_order[:index]:
+                if (self.role_hosts[earlier] & self.role_hosts[role] and
+                        role not in self._all_dependencies(earlier, dependencies)):
+                    dependencies[role].add(earlier)
+        self._check_for_cycles(dependencies)
+        return dependencies
+
+    @staticmethod
+    def _all_dependencies(role, dependencies):
+        found = set()
+        stack = [role]
+        while stack:
+            for dep in dependencies[stack.pop()]:
+                if dep not in found:
+                    found.add(dep)
+                    stack.append(dep)
+        return found
+
+    def _check_for_cycles(self, dependencies):
+        visiting = set()
+        done = set()
+
+        def visit(role, path):
+            if role in done:
+                return
+            if role in visiting:
+                raise SchedulerError('Role dependency cycle: ' +
+                                     ' -> '.join(path + [role]))
+            visiting.add(role)
+            for dep in sorted(dependencies[role]):
+                visit(dep, path + [role])
+            visiting.discard(role)
+            done.add(role)
+
+        for role in self.role_order:
+            visit(role, [])
+
+    def topological_order(self):
+        """
+        :returns: roles ordered so every role follows its dependencies, using
+                  config order wherever the dependencies allow it
+        """
+        order = []
+        placed = set()
+        remaining = list(self.role_order)
+        while remaining:
+            for role in remaining:
+                if self.dependencies[role].issubset(placed):
+                    order.append(role)
+                    placed.add(role)
+                    remaining.remove(role)
+                    break
+        return order
+
+    def phases(self):
+        """
+        Group roles into the fewest ordered phases such that each host can
+        converge all of its roles for a phase in a single chef-client run.
+
+        A role can share a phase with a role it depends on only when both run
+        on the same single host, where the run list order keeps them in
+        sequence. Otherwise it has to wait for the next phase.
+
+        :returns: list of phases, each a list of roles in run list order
+        """
+        phase_of = {}
+        for role in self.topological_order():
+            phase = 0
+            for dep in self.dependencies[role]:
+                same_host = (len(self.role_hosts[dep]) == 1 and
+                             self.role_hosts[dep] == self.role_hosts[role])
+                phase = max(phase, phase_of[dep] + (0 if same_host else 1))
+            phase_of[role] = phase
+        phases = [[] for _ in range(max(phase_of.values()) + 1)] if phase_of else []
+        for role in self.topological_order():
+            phases[phase_of[role]].append(role)
+        return phases
+
+    def run(self, task):
+        """
+        Call task(role) for every role, concurrently where allowed. If a role
+        fails no new roles are started, running ones are waited on and the
+        first failure is re-raised.
+
+        :returns: dict of role -> (start, end) wall clock times
+        """
+        condition = threading.Condition()
+        pending = list(self.role_order)
+        running = set()
+        finished = set()
+        busy_hosts = set()
+        host_last_role = {}
+        failures = []
+
+        def worker(role):
+            try:
+                task(role)
+            except BaseException as e:
+                failures.append((role, e))
+            finally:
+                with condition:
+                    start, _ = self.timings[role]
+                    self.timings[role] = (start, time.time())
+                    running.discard(role)
+                    finished.add(role)
+                    for host in self.role_hosts[role]:
+                        busy_hosts.discard(host)
+                        host_last_role[host] = role
+                    condition.notify_all()
+
+        def ready(role):
+            if not self.dependencies[role].issubset(finished):
+                return False
+            return not self.role_hosts[role] & busy_hosts
+
+        with condition:
+            while pending or running:
+                if not failures:
+                    for role in list(pending):
+                        if len(running) >= self.workers:
+                            break
+                        if not ready(role):
+                            continue
+                        pending.remove(role)
+                        running.add(role)
+                        busy_hosts.update(self.role_hosts[role])
+                        gating = set(self.dependencies[role])
+                        gating.update(host_last_role[host] for host in self.role_hosts[role]
+                                      if host in host_last_role)
+                        self.blocked_by[role] = self._last_finished(gating)
+                        self.timings[role] = (time.time(), None)
+                        thread = threading.Thread(target=worker, args=(role,),
+                                                  name='provision-' + role)
+                        thread.daemon = True
+                        thread.start()
+                if not running:
+                    break
+                # Wake up periodically so KeyboardInterrupt is delivered
+                condition.wait(1)
+        if failures:
+            role, exception = failures[0]
+            print yellow('Provisioning of role ' + role + ' failed, '
+                         'remaining roles were not started: ' + str(pending))
+            raise exception
+        return self.timings
+
+    def _last_finished(self, roles):
+        last = None
+        for role in roles:
+            if last is None or self.timings[role][1] > self.timings[last][1]:
+                last = role
+        return last
+
+    def critical_path(self):
+        """
+        Walk back from the last role to finish through the role that gated
+        the start of each role. The result is the chain of roles that
+        determined the total wall clock time.
+
+        :returns: list of (role, duration in seconds) in execution order
+        """
+        finished = [role for role in self.timings if self.timings[role][1]]
+        if not finished:
+            return []
+        path = []
+        role = max(finished, key=lambda r: self.timings[r][1])
+        while role:
+            start, end = self.timings[role]
+            path.append((role, end - start))
+            role = self.blocked_by.get(role)
+        path.reverse()
+        return path
+
+    def print_critical_path(self):
+        path = self.critical_path()
+        if not path:
+            return
+        total = sum(duration for _, duration in path)
+        print cyan('Critical path ({0:.1f}s):'.format(total))
+        for role, duration in path:
+            print cyan('  {0: <24} {1:>8.1f}s'.format(role, duration))
@@ -0,0 +1,388 @@
+from contextlib import contextmanager
+import os
+import pipes
+import threading
+import time
+import Queue
+
+from fabric.network import connect, normalize
+from paramiko import SFTPClient
+from paramiko.agent import AgentRequestHandler
+from fabric.state import connections, env, output as fabric_output
+
+from calyptos.concurrency import get_controller
+from calyptos.output import bind_output
+from calyptos.tracing import get_tracer, span
+
+
+def _span_label(command, length=80):
+    # Spans name the command by its first line, scripts can be long
+    lines = command.strip().splitlines()
+    label = lines[0] if lines else ''
+    if len(lines) > 1 or len(label) > length:
+        label = label[:length] + '...'
+    return label
+
+
+class RemoteResult(str):
+    """
+    Output of a remote command. Mimics the string returned by fabric's run()
+    so callers can use return_code, succeeded, failed and stdout the same way.
+    """
+
+    def __new__(cls, output, host, command, return_code):
+        result = str.__new__(cls, output)
+        result.host = host
+        result.command = command
+        result.return_code = return_code
+        result.stderr = ''
+        return result
+
+    def __reduce__(self):
+        # Results travel back from forked fabric workers pickled
+        return (RemoteResult, (str(self), self.host, self.command,
+                               self.return_code))
+
+    @property
+    def stdout(self):
+        return str(self)
+
+    @property
+    def succeeded(self):
+        return self.return_code == 0
+
+    @property
+    def failed(self):
+        return self.return_code != 0
+
+
+class PooledSession(object):
+    def __init__(self, host, client, max_channels):
+        self.host = host
+        self.client = client
+        self.channels = threading.BoundedSemaphore(max_channels)
+        self.last_used = time.time()
+        self.in_use = 0
+        self.lock = threading.Lock()
+
+    def is_active(self):
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def check_health(self):
+        # A transport can look active while the peer is long gone, an ignore
+        # message forces a write on the socket
+        if not self.is_active():
+            return False
+        try:
+            self.client.get_transport().send_ignore()
+        except Exception:
+            return False
+        return True
+
+    def is_idle(self, idle_timeout):
+        with self.lock:
+            return not self.in_use and time.time() - self.last_used > idle_timeout
+
+    @contextmanager
+    def channel_slot(self):
+        # Hold one of the host's channels for the duration of an operation
+        with self.channels:
+            with self.lock:
+                self.in_use += 1
+            try:
+                yield self.client.get_transport()
+            finally:
+                with self.lock:
+                    self.in_use -= 1
+                    self.last_used = time.time()
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+class SSHSessionPool(object):
+    """
+    Process wide pool of SSH sessions keyed by host.
+
+    A session is opened on first use and shared by every plugin and phase
+    after that. Sessions are health checked when they have been idle for
+    health_check_interval seconds and closed once they have been idle for
+    idle_timeout seconds. At most max_channels commands run on a host at the
+    same time.
+    """
+
+    def __init__(self, user=None, password=None, port=None, max_channels=4,
+                 idle_timeout=300, health_check_interval=30):
+        self.user = user
+        self.password = password
+        self.port = port
+        self.max_channels = max_channels
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.connect_locks = {}
+        self.handshakes = 0
+
+    def _connect(self, host):
+        user, hostname, port = normalize(host)
+        user = self.user or env.user or user
+        if self.password is not None:
+            env.password = self.password
+        try:
+            with span('connect', 'ssh', host=host):
+                client = connect(user, hostname, self.port or port, cache=connections)
+        except BaseException:
+            get_controller().observe(failed=True)
+            raise
+        self.handshakes += 1
+        return PooledSession(host, client, self.max_channels)
+
+    def session(self, host):
+        """
+        :returns: a healthy session to host, connecting if needed
+        """
+        self.evict_idle()
+        with self.lock:
+            connect_lock = self.connect_locks.setdefault(host, threading.Lock())
+        with connect_lock:
+            with self.lock:
+                session = self.sessions.get(host)
+            if session is not None:
+                idle = time.time() - session.last_used
+                healthy = session.is_active()
+                if healthy and idle > self.health_check_interval:
+                    healthy = session.check_health()
+                if not healthy:
+                    session.close()
+                    session = None
+            if session is None:
+                session = self._connect(host)
+                with self.lock:
+                    self.sessions[host] = session
+            session.last_used = time.time()
+            return session
+
+    def run(self, host, command, timeout=None, shell=True, forward_agent=False):
+        """
+        Run command on host and wait for it to finish. The command is run
+        through a login bash shell like fabric's run() does and stderr is
+        combined into the output. A non zero exit status does not raise, check
+        return_code on the result instead. With forward_agent the local
+        ssh-agent is available to the command. Like fabric's run() the
+        command and its output are echoed, prefixed with the host, unless
+        hidden with fabric's hide().
+
+        :returns: RemoteResult
+        """
+        session = self.session(host)
+        if shell:
+            wire_command = '/bin/bash -l -c ' + pipes.quote(command)
+        else:
+            wire_command = command
+        with session.channel_slot() as transport, \
+                span('run', 'ssh', host=host, command=_span_label(command)) as trace:
+            # Opening a channel is one round trip, a cheap latency sample
+            started = time.time()
+            try:
+                channel = transport.open_session()
+            except Exception:
+                get_controller().observe(failed=True)
+                raise
+            get_controller().observe(latency=time.time() - started)
+            try:
+                channel.settimeout(timeout)
+                channel.set_combine_stderr(True)
+                if forward_agent:
+                    AgentRequestHandler(channel)
+                if fabric_output.running:
+                    print '[{0}] run: {1}'.format(host, command)
+                channel.exec_command(wire_command)
+                output = []
+                line = ''
+                while True:
+                    data = channel.recv(32768)
+                    if not data:
+                        break
+                    output.append(data)
+                    if fabric_output.stdout:
+                        lines = (line + data).split('\n')
+                        line = lines.pop()
+                        for complete in lines:
+                            print '[{0}] out: {1}'.format(host, complete.rstrip('\r'))
+                if line and fabric_output.stdout:
+                    print '[{0}] out: {1}'.format(host, line.rstrip('\r'))
+                return_code = channel.recv_exit_status()
+            finally:
+                channel.close()
+            trace['bytes'] = sum(len(data) for data in output)
+        return RemoteResult(''.join(output).strip(), host, command, return_code)
+
+    @contextmanager
+    def sftp(self, host):
+        """
+        SFTPClient on the host's session, holding one of its channels
+        """
+        session = self.session(host)
+        with session.channel_slot() as transport:
+            sftp = SFTPClient.from_transport(transport)
+            try:
+                yield sftp
+            finally:
+                sftp.close()
+
+    def get(self, host, remote_path, local_path):
+        """
+        Download remote_path from host to local_path over the host's session
+        """
+        with self.sftp(host) as sftp, span('get', 'ssh', host=host, path=remote_path) as trace:
+            sftp.get(remote_path, local_path)
+            trace['bytes'] = os.path.getsize(local_path)
+        return local_path
+
+    def put(self, host, local_path, remote_path):
+        with self.sftp(host) as sftp, span('put', 'ssh', host=host, path=remote_path) as trace:
+            sftp.put(local_path, remote_path)
+            trace['bytes'] = os.path.getsize(local_path)
+        return remote_path
+
+    def run_on_hosts(self, command, hosts, workers=None, timeout=None):
+        """
+        Run command on every host, as many at once as the concurrency
+        controller allows
+
+        :returns: dict of host -> RemoteResult, or the exception raised for
+                  hosts that could not be reached
+        """
+        return map_hosts(lambda host: self.run(host, command, timeout=timeout),
+                         hosts, workers=workers)
+
+    def evict_idle(self):
+        with self.lock:
+            idle = [host for host, session in self.sessions.iteritems()
+                    if session.is_idle(self.idle_timeout)]
+            evicted = [self.sessions.pop(host) for host in idle]
+        for session in evicted:
+            session.close()
+
+    def close(self, host):
+        with self.lock:
+            session = self.sessions.pop(host, None)
+        if session is not None:
+            session.close()
+
+    def close_all(self):
+        with self.lock:
+            sessions = self.sessions.values()
+            self.sessions = {}
+        for session in sessions:
+            session.close()
+
+    def fork(self):
+        """
+        :returns: an empty pool with the same settings, for use in a forked
+                  child where the parent's sessions can not be used
+        """
+        return SSHSessionPool(user=self.user, password=self.password,
+                              port=self.port, max_channels=self.max_channels,
+                              idle_timeout=self.idle_timeout,
+                              health_check_interval=self.health_check_interval)
+
+
+def imap_hosts(function, hosts, workers=None):
+    """
+    Call function(host) for every host from up to workers threads, each call
+    holding a slot of the concurrency controller. Results are yielded in the
+    order the hosts finish.
+
+    :returns: generator of (host, return value or the exception raised)
+    """
+    hosts = list(hosts)
+    if not hosts:
+        return
+    controller = get_controller()
+    workers = workers or controller.max_limit
+    function = get_tracer().bind(bind_output(function))
+    work = Queue.Queue()
+    done = Queue.Queue()
+    for host in hosts:
+        work.put(host)
+
+    def worker():
+        while True:
+            try:
+                host = work.get_nowait()
+            except Queue.Empty:
+                return
+            with controller.slot(host):
+                try:
+                    result = function(host)
+                except (Exception, SystemExit) as e:
+                    result = e
+            done.put((host, result))
+
+    for _ in range(min(max(1, workers), len(hosts))):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+    for _ in hosts:
+        while True:
+            # Time out periodically so KeyboardInterrupt is delivered
+            try:
+                yield done.get(timeout=1)
+                break
+            except Queue.Empty:
+                continue
+
+
+def map_hosts(function, hosts, workers=None):
+    """
+    :returns: dict of host -> return value of function(host), or the
+              exception raised, see imap_hosts
+    """
+    return dict(imap_hosts(function, hosts, workers=workers))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure_pool(**kwargs):
+    """
+    Replace the process wide pool, closing the sessions of the old one
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _pool = SSHSessionPool(**kwargs)
+        return _pool
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SSHSessionPool()
+        return _pool
+
+
+def close_pool():
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+
+
+def reset_pool_after_fork():
+    """
+    Give a forked child its own pool. The inherited sessions share their
+    sockets with the parent and are dropped without being closed.
+    """
+    global _pool, _pool_lock
+    _pool_lock = threading.Lock()
+    if _pool is not None:
+        _pool = _pool.fork()
@@ -0,0 +1,132 @@
+from contextlib import contextmanager
+from functools import wraps
+import inspect
+import json
+import os
+import threading
+import time
+
+from fabric.colors import cyan
+
+
+class Tracer(object):
+    """
+    Collects timed spans of the operations of a run.
+
+    Spans carry the host, role and operation they belong to plus anything
+    the operation adds, like bytes transferred. Attributes set with
+    context() are added to every span started below it, also on the
+    threads of the executor. Spans are exported in the Chrome trace event
+    format, viewable in chrome://tracing.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.pid = os.getpid()
+
+    def current_context(self):
+        return getattr(self.local, 'context', {})
+
+    @contextmanager
+    def context(self, **args):
+        previous = self.current_context()
+        self.local.context = dict(previous, **args)
+        try:
+            yield
+        finally:
+            self.local.context = previous
+
+    @contextmanager
+    def span(self, name, category='calyptos', **args):
+        """
+        Time the block as a span. The dict yielded are the span's arguments,
+        the block can add to them.
+        """
+        args = dict(self.current_context(), **args)
+        started = time.time()
+        try:
+            yield args
+        finally:
+            finished = time.time()
+            event = {'name': name, 'cat': category, 'ph': 'X',
+                     'ts': int(started * 1000000),
+                     'dur': int((finished - started) * 1000000),
+                     'pid': self.pid, 'tid': threading.current_thread().ident,
+                     'args': args}
+            with self.lock:
+                self.events.append(event)
+
+    def bind(self, function):
+        """
+        :returns: function wrapped so that, when called from another thread,
+                  its spans get the calling thread's context
+        """
+        context = self.current_context()
+        if not context:
+            return function
+
+        def bound(*args, **kwargs):
+            with self.context(**context):
+                return function(*args, **kwargs)
+        return bound
+
+    def write_chrome_trace(self, path):
+        with self.lock:
+            events = list(self.events)
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+
+    def slowest(self, top=10):
+        with self.lock:
+            return sorted(self.events, key=lambda event: -event['dur'])[:top]
+
+    def print_summary(self, top=10):
+        events = self.slowest(top)
+        if not events:
+            return
+        print cyan('Slowest operations:')
+        for event in events:
+            details = ' '.join('{0}={1}'.format(key, value)
+                               for key, value in sorted(event['args'].iteritems()))
+            print cyan('  {0:>9.1f}s  {1: <10} {2: <30} {3}'.format(
+                event['dur'] / 1000000.0, event['cat'], event['name'], details))
+
+
+_tracer = Tracer()
+
+
+def get_tracer():
+    return _tracer
+
+
+def span(name, category='calyptos', **args):
+    return _tracer.span(name, category, **args)
+
+
+def trace_context(**args):
+    return _tracer.context(**args)
+
+
+def traced(category, name=None):
+    """
+    Decorator timing every call as a span, with the function's host
+    argument, if it has one, recorded as the span's host
+    """
+    def decorator(function):
+        span_name = name or function.__name__
+        arg_names = inspect.getargspec(function).args
+        host_index = arg_names.index('host') if 'host' in arg_names else None
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            extra = {}
+            if 'host' in kwargs:
+                extra['host'] = kwargs['host']
+            elif host_index is not None and host_index < len(args):
+                extra['host'] = args[host_index]
+            with _tracer.span(span_name, category, **extra):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
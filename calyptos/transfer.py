@@ -0,0 +1,185 @@
+import hashlib
+import os
+import pipes
+import socket
+import threading
+import Queue
+
+from fabric.colors import yellow
+from paramiko import SSHException
+
+from calyptos.output import bind_output
+from calyptos.sshpool import get_pool
+
+CHUNK_SIZE = 1024 * 1024
+PARTIAL_SUFFIX = '.part'
+
+
+class TransferError(Exception):
+    pass
+
+
+class QuotaExceeded(TransferError):
+    pass
+
+
+class DiskQuota(object):
+    """
+    Caps the bytes kept in a local directory. Downloads reserve the size of
+    their file before they start, and wait while the directory plus what is
+    reserved would go over the limit. Space freed in the directory by anyone
+    lets waiting downloads continue.
+    """
+
+    def __init__(self, directory, limit, poll_interval=10):
+        self.directory = directory
+        self.limit = limit
+        self.poll_interval = poll_interval
+        self.reserved = {}
+        self.condition = threading.Condition()
+
+    def usage(self, exclude=None):
+        # Files being downloaded are accounted for by their reservation, as
+        # is the partial file a reservation is being made for
+        used = 0
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.abspath(os.path.join(dirpath, filename))
+                if path not in self.reserved and path != exclude and os.path.isfile(path):
+                    used += os.path.getsize(path)
+        return used
+
+    def reserve(self, path, size):
+        if size > self.limit:
+            raise QuotaExceeded('{0} needs {1} bytes, more than the quota of {2}'.format(
+                path, size, self.limit))
+        path = os.path.abspath(path)
+        with self.condition:
+            paused = False
+            while self.usage(path) + sum(self.reserved.itervalues()) + size > self.limit:
+                if not paused:
+                    print yellow('Disk quota of {0} bytes for {1} reached, pausing download '
+                                 'of {2}'.format(self.limit, self.directory, path))
+                    paused = True
+                self.condition.wait(self.poll_interval)
+            self.reserved[path] = size
+
+    def release(self, path):
+        with self.condition:
+            self.reserved.pop(os.path.abspath(path), None)
+            self.condition.notify_all()
+
+
+def _local_checksum(path):
+    digest = hashlib.md5()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def remote_checksum(host, remote_path, pool=None):
+    pool = pool or get_pool()
+    result = pool.run(host, 'md5sum ' + pipes.quote(remote_path))
+    if result.failed or not result.split():
+        raise TransferError('Unable to checksum {0} on {1}: {2}'.format(remote_path, host, result))
+    return result.split()[0]
+
+
+def download(host, remote_path, local_path, quota=None, attempts=3, pool=None):
+    """
+    Download remote_path from host into local_path, verified against the
+    md5sum of the remote file. Data is written to local_path.part first. An
+    interrupted download, in this run or an earlier one, continues from
+    where the partial file ends.
+
+    :returns: local_path
+    """
+    pool = pool or get_pool()
+    partial = local_path + PARTIAL_SUFFIX
+    expected = remote_checksum(host, remote_path, pool)
+    error = None
+    for _ in range(attempts):
+        try:
+            with pool.sftp(host) as sftp:
+                size = sftp.stat(remote_path).st_size
+            offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+            if offset > size:
+                offset = 0
+            # Waiting for the quota does not hold on to a channel
+            if quota is not None:
+                quota.reserve(partial, size)
+            try:
+                with pool.sftp(host) as sftp, \
+                        open(partial, 'r+b' if offset else 'wb') as local_file:
+                    local_file.seek(offset)
+                    local_file.truncate()
+                    remote_file = sftp.open(remote_path, 'rb')
+                    try:
+                        remote_file.seek(offset)
+                        for block in iter(lambda: remote_file.read(CHUNK_SIZE), b''):
+                            local_file.write(block)
+                    finally:
+                        remote_file.close()
+            finally:
+                if quota is not None:
+                    quota.release(partial)
+            if _local_checksum(partial) == expected:
+                os.rename(partial, local_path)
+                return local_path
+            # What was kept from before can not be trusted, start over
+            os.remove(partial)
+            error = TransferError('Checksum mismatch for {0} from {1}'.format(remote_path, host))
+        except (IOError, OSError, socket.error, SSHException), e:
+            error = e
+    raise error
+
+
+class DownloadQueue(object):
+    """
+    Downloads files with up to transfers running at once. Files can be
+    submitted while earlier ones are still being downloaded.
+    """
+
+    def __init__(self, transfers=4, quota=None, attempts=3):
+        self.quota = quota
+        self.attempts = attempts
+        self.work = Queue.Queue()
+        self.results = []
+        self.lock = threading.Lock()
+        worker = bind_output(self._worker)
+        self.threads = [threading.Thread(target=worker, name='download-worker')
+                        for _ in range(max(1, transfers))]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def _worker(self):
+        while True:
+            job = self.work.get()
+            if job is None:
+                return
+            host, remote_path, local_path = job
+            try:
+                result = download(host, remote_path, local_path, quota=self.quota,
+                                  attempts=self.attempts)
+            except Exception as e:
+                result = e
+            with self.lock:
+                self.results.append((host, remote_path, local_path, result))
+
+    def submit(self, host, remote_path, local_path):
+        self.work.put((host, remote_path, local_path))
+
+    def wait(self):
+        """
+        :returns: list of (host, remote path, local path, local path or the
+                  exception raised) in the order downloads finished
+        """
+        for _ in self.threads:
+            self.work.put(None)
+        for thread in self.threads:
+            while thread.is_alive():
+                # Wake up periodically so KeyboardInterrupt is delivered
+                thread.join(1)
+        return self.results
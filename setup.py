@@ -150,6 +150,8 @@ setup(
             'file_permissions:FilePermissions',
             'eucalyptus_sosreports = calyptos.plugins.debugger.'
             'eucalyptus_sosreports:EucalyptusSosReports',
+            'collect_artifacts = calyptos.plugins.debugger.'
+            'collect_artifacts:CollectArtifacts',
             'component_storage_check = calyptos.plugins.debugger.'
             'component_storage_check:CheckStorage',
             'debug_compute_req = calyptos.plugins.debugger.'
@@ -0,0 +1,38 @@
+import pytest
+from fabric.state import env
+
+from calyptos.sshpool import close_pool, configure_pool
+from sshstub import StubSFTPServer, StubSSHD
+
+
+@pytest.fixture
+def stub_env():
+    """
+    fabric env for connecting to StubSSHD servers, restored afterwards
+    """
+    saved = dict(env)
+    env.disable_known_hosts = True
+    env.no_keys = True
+    env.no_agent = True
+    env.abort_on_prompts = True
+    yield env
+    env.clear()
+    env.update(saved)
+
+
+@pytest.fixture
+def pool_env(stub_env):
+    """
+    Process wide pool logging in to StubSSHD servers
+    """
+    configure_pool(user='root', password='foobar')
+    yield stub_env
+    close_pool()
+
+
+@pytest.fixture
+def sshd(pool_env):
+    sshd = StubSSHD()
+    del StubSFTPServer.reads[:]
+    yield sshd
+    sshd.stop()
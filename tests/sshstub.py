@@ -0,0 +1,132 @@
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+
+import paramiko
+
+
+class StubServer(paramiko.ServerInterface):
+    def __init__(self, password):
+        self.password = password
+        self.commands = []
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if password == self.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        self.commands.append(command)
+        thread = threading.Thread(target=self._execute, args=(channel, command))
+        thread.daemon = True
+        thread.start()
+        return True
+
+    @staticmethod
+    def _execute(channel, command):
+        # A bare environment keeps the caller's login scripts out of the output
+        clean_env = {'PATH': os.environ.get('PATH', '/usr/bin:/bin'),
+                     'HOME': tempfile.gettempdir()}
+        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, env=clean_env)
+        output = process.communicate()[0]
+        channel.sendall(output)
+        channel.send_exit_status(process.returncode)
+        channel.close()
+
+
+class StubSFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class StubSFTPServer(paramiko.SFTPServerInterface):
+    """
+    Read only SFTP on the local file system, reads are recorded as
+    (path, offset) in reads
+    """
+    reads = []
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            handle = StubSFTPHandle(flags)
+            handle.readfile = open(path, 'rb')
+        except IOError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        handle.filename = path
+        reads = self.reads
+        read = handle.read
+
+        def recorded_read(offset, length):
+            reads.append((path, offset))
+            return read(offset, length)
+        handle.read = recorded_read
+        return handle
+
+
+class StubSSHD(object):
+    """
+    In-process SSH server listening on localhost. Commands are run with the
+    local shell and files are served over SFTP from the local file system, so
+    tests can exercise real remote execution code paths.
+    """
+
+    def __init__(self, password='foobar'):
+        self.password = password
+        self.host_key = paramiko.RSAKey.generate(1024)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.listen(50)
+        self.port = self.socket.getsockname()[1]
+        self.host = '127.0.0.1:{0}'.format(self.port)
+        self.handshakes = 0
+        self.servers = []
+        self.transports = []
+        self.running = True
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while self.running:
+            try:
+                client, _ = self.socket.accept()
+            except socket.error:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, StubSFTPServer)
+            server = StubServer(self.password)
+            transport.start_server(server=server)
+            self.handshakes += 1
+            self.servers.append(server)
+            self.transports.append(transport)
+
+    @property
+    def commands(self):
+        return [command for server in self.servers for command in server.commands]
+
+    def stop(self):
+        self.running = False
+        self.socket.close()
+        for transport in self.transports:
+            transport.close()
@@ -0,0 +1,61 @@
+import hashlib
+import json
+import sys
+
+from calyptos.artifacts import ArtifactStore
+from calyptos.plugins.debugger import collect_artifacts
+
+
+def test_only_changed_chunks_are_transferred(sshd, tmpdir):
+    logs = tmpdir.mkdir('logs')
+    logs.join('cloud-output.log').write('a' * 250)
+    logs.join('cloud-debug.log').write('a' * 100 + 'b' * 50)
+    store = ArtifactStore(root=str(tmpdir.join('store')), chunk_size=100,
+                          python=sys.executable)
+
+    files, stats = store.collect(sshd.host, [str(logs)])
+    # The first 100 bytes of both logs are the same chunk
+    assert stats == {'files': 2, 'bytes': 400, 'transferred': 200}
+    first = store.save_run({'host': files}, run_id='first')
+
+    logs.join('cloud-output.log').write('a' * 250 + 'c' * 30)
+    files, stats = store.collect(sshd.host, [str(logs)])
+    assert stats['transferred'] == 80
+    second = store.save_run({'host': files}, run_id='second')
+
+    path = str(logs.join('cloud-output.log'))
+    store.restore(first, 'host', path, str(tmpdir.join('restored')))
+    assert tmpdir.join('restored').read() == 'a' * 250
+    store.restore(second, 'host', path, str(tmpdir.join('restored')))
+    assert tmpdir.join('restored').read() == 'a' * 250 + 'c' * 30
+    assert store.prune(max_age_days=1) == 0
+
+
+def test_plugin_prunes_old_runs(sshd, tmpdir, monkeypatch):
+    logs = tmpdir.mkdir('logs')
+    logs.join('cloud-output.log').write('new')
+    store = ArtifactStore(root=str(tmpdir.join('store')), python=sys.executable)
+    store.put_chunk('old')
+    store.save_run({'host': {'/gone.log': {'size': 3, 'mtime': 0, 'chunks': []}}},
+                   run_id='old')
+    run = store.load_run('old')
+    run['created'] -= 30 * 86400
+    tmpdir.join('store', 'runs', 'old.json').write(json.dumps(run))
+
+    class Environment(object):
+        def read_environment(self):
+            return {}
+
+        def get_roles(self):
+            return {}
+
+        def get_euca_hosts(self):
+            return [sshd.host]
+
+    monkeypatch.setattr(collect_artifacts, 'ArtifactStore', lambda: store)
+    monkeypatch.setattr(collect_artifacts.CollectArtifacts, 'paths', [str(logs)])
+    plugin = collect_artifacts.CollectArtifacts(Environment())
+    assert plugin.debug() == (1, 0)
+    assert 'old' not in store.runs() and len(store.runs()) == 1
+    assert not store.has_chunk(hashlib.sha1('old').hexdigest())
+    assert store.has_chunk(hashlib.sha1('new').hexdigest())
@@ -0,0 +1,100 @@
+from contextlib import contextmanager
+from StringIO import StringIO
+import json
+import os
+import shutil
+
+import pytest
+
+from calyptos import chefmanager
+from calyptos.chefmanager import ChefManager, RemoteCommandException
+from calyptos.deploydata import DeploymentTree
+from calyptos.nodestore import NodeStore
+
+
+def write_node(node_dir, name, ip):
+    with open(os.path.join(node_dir, name + '.json'), 'w') as node_file:
+        json.dump({'name': name, 'run_list': [], 'automatic': {'ipaddress': ip}}, node_file)
+
+
+class LocalChefManager(ChefManager):
+    def __init__(self, node_dir):
+        self.node_store = NodeStore(node_dir)
+        self.node_lock = self.node_store.lock
+        self.bootstrapped = []
+
+    def bootstrap_nodes(self, hosts):
+        self.bootstrapped.append(sorted(hosts))
+        for host in hosts:
+            write_node(self.node_store.node_dir, 'node-' + host, host)
+
+
+def test_unknown_hosts_are_bootstrapped_in_one_pass(tmpdir):
+    node_dir = str(tmpdir)
+    write_node(node_dir, 'known', '10.0.0.1')
+    manager = LocalChefManager(node_dir)
+    hosts = ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+    manager.add_to_run_list(hosts, ['recipe[eucalyptus::nc]'])
+    assert manager.bootstrapped == [['10.0.0.2', '10.0.0.3']]
+    for host in hosts:
+        assert manager.get_node_record(host).run_list == ['recipe[eucalyptus::nc]']
+
+    manager.add_to_run_list(hosts, ['recipe[eucalyptus::nc]'])
+    manager.clear_run_list(hosts)
+    assert len(manager.bootstrapped) == 1
+    assert manager.get_node_json('10.0.0.3')['run_list'] == []
+
+
+def test_pull_node_info_reads_the_node_file_over_sftp(tmpdir, monkeypatch):
+    document = {'name': 'nc1', 'automatic': {'ipaddress': '10.0.1.2'}}
+    remote_files = {'/root/deploy/chef-repo/nodes/nc1.json': json.dumps(document),
+                    '/root/deploy/chef-repo/nodes/nc2.json': 'Last login: today\n{'}
+    opened = []
+
+    class FakePool(object):
+        @contextmanager
+        def sftp(self, host):
+            yield self
+
+        def open(self, path, mode):
+            opened.append(path)
+            if path not in remote_files:
+                raise IOError(2, 'No such file')
+            return StringIO(remote_files[path])
+
+    monkeypatch.setattr(chefmanager, 'get_pool', FakePool)
+    manager = LocalChefManager(str(tmpdir))
+    manager.remote_folder_path = '/root/deploy/'
+    manager.local_hostname = 'controller'
+    manager.remote_hostnames = {'10.0.1.2': 'nc1\n', '10.0.1.3': 'nc2', '10.0.1.4': 'nc3',
+                                '10.0.0.1': 'controller'}
+    manager.pull_node_info('10.0.1.2')
+    assert manager.node_store.find('10.0.1.2') == 'nc1'
+    assert json.load(tmpdir.join('nc1.json')) == document
+
+    for host, problem in [('10.0.1.3', 'Invalid node file'), ('10.0.1.4', 'Unable to read')]:
+        with pytest.raises(RemoteCommandException) as error:
+            manager.pull_node_info(host)
+        assert problem in str(error.value) and host in str(error.value)
+    manager.pull_node_info('10.0.0.1')
+    assert len(opened) == 3
+
+
+def test_apply_deployment_bundle_fails_when_extraction_fails(sshd, tmpdir):
+    tmpdir.join('local', 'chef-repo', 'nodes', 'nc1.json').write('{}', ensure=True)
+    tree = DeploymentTree(str(tmpdir.join('local')), state_dir=str(tmpdir.join('state')))
+    entries = tree.scan()
+    manager = LocalChefManager(str(tmpdir.mkdir('nodes')))
+    manager.remote_folder_path = str(tmpdir.join('remote')) + '/'
+    bundle = tree.build_bundle(sorted(entries), [], entries)
+    remote_bundle = manager._remote_bundle_path(bundle)
+    shutil.copy(bundle, remote_bundle)
+    manager.apply_deployment_bundle(sshd.host, {sshd.host: bundle})
+    assert tmpdir.join('remote', 'chef-repo', 'nodes', 'nc1.json').read() == '{}'
+    assert not os.path.exists(remote_bundle)
+
+    with open(remote_bundle, 'w') as truncated:
+        truncated.write(open(bundle, 'rb').read()[:20])
+    with pytest.raises(RemoteCommandException):
+        manager.apply_deployment_bundle(sshd.host, {sshd.host: bundle})
+    assert not os.path.exists(remote_bundle)
@@ -0,0 +1,42 @@
+from calyptos.chefreport import ChefRunReport, compare_reports, parse_chef_log
+
+CHEF_LOG = """Starting Chef Client, version 13.8.5
+[2018-03-01T12:00:00+00:00] INFO: *** Chef 13.8.5 ***
+[2018-03-01T12:00:01+00:00] INFO: Run List expands to [eucalyptus::cloud-controller]
+[2018-03-01T12:00:02+00:00] INFO: Processing yum_repository[eucalyptus-release] action create (eucalyptus::default line 30)
+[2018-03-01T12:00:03+00:00] INFO: Processing package[eucalyptus-cloud] action install (eucalyptus::cloud-controller line 21)
+[2018-03-01T12:01:33+00:00] INFO: package[eucalyptus-cloud] installing eucalyptus-cloud-4.4.3 from eucalyptus repository
+[2018-03-01T12:01:40+00:00] INFO: Processing execute[Initialize Database] action run (eucalyptus::cloud-controller line 40)
+[2018-03-01T12:01:50+00:00] INFO: execute[Initialize Database] ran successfully
+[2018-03-01T12:01:52+00:00] INFO: Chef Run complete in 112.4 seconds
+[2018-03-01T12:01:52+00:00] INFO: Running report handlers
+"""
+
+
+def test_parse_chef_log():
+    resources, total = parse_chef_log(CHEF_LOG)
+    assert total == 112.4
+    assert [(r.resource, r.recipe, r.duration, r.changed) for r in resources] == [
+        ('yum_repository[eucalyptus-release]', 'eucalyptus::default', 1, False),
+        ('package[eucalyptus-cloud]', 'eucalyptus::cloud-controller', 97, True),
+        ('execute[Initialize Database]', 'eucalyptus::cloud-controller', 12, True)]
+    assert resources[1].action == 'install'
+
+
+def test_report_aggregates_hosts_and_compares(tmpdir):
+    before = ChefRunReport('euca-4.3')
+    before.add('10.0.0.1', CHEF_LOG, 'clc')
+    after = ChefRunReport('euca-4.4')
+    after.add('10.0.0.1', CHEF_LOG, 'clc')
+    after.add('10.0.0.2', CHEF_LOG.replace('12:01:33', '12:03:33')
+              .replace('12:01:40', '12:03:40').replace('12:01:50', '12:03:50')
+              .replace('12:01:52', '12:03:52'), 'clc')
+    recipe = after.recipes()['eucalyptus::cloud-controller']
+    assert (recipe['seconds'], recipe['count'], recipe['changed']) == (338, 4, 4)
+    assert recipe['hosts'] == set(['10.0.0.1', '10.0.0.2']) and recipe['roles'] == set(['clc'])
+
+    path = after.save(str(tmpdir))
+    assert path.endswith('-euca-4.4.json') and after.save(str(tmpdir)) == path
+    loaded = ChefRunReport.load(path)
+    assert loaded.branch == 'euca-4.4' and len(loaded.runs) == 2
+    assert compare_reports(before, loaded)[0] == ('eucalyptus::cloud-controller', 109, 169)
@@ -0,0 +1,61 @@
+import threading
+import time
+
+from calyptos import concurrency
+from calyptos.concurrency import ConcurrencyController
+from calyptos.sshpool import map_hosts
+
+
+def _peak_in_flight(controller, hosts):
+    lock = threading.Lock()
+    counts = {'now': 0, 'peak': 0}
+
+    def function(host):
+        with lock:
+            counts['now'] += 1
+            counts['peak'] = max(counts['peak'], counts['now'])
+        time.sleep(0.05)
+        with lock:
+            counts['now'] -= 1
+        return host
+
+    concurrency._controller = controller
+    try:
+        results = map_hosts(function, hosts)
+    finally:
+        concurrency._controller = None
+    assert sorted(results) == sorted(set(hosts))
+    return counts['peak']
+
+
+def test_global_and_role_limits():
+    hosts = ['10.0.0.{0}'.format(i) for i in range(12)]
+    assert _peak_in_flight(ConcurrencyController(limit=3), hosts) == 3
+    controller = ConcurrencyController(limit=10, roles={'clc': 1},
+                                       role_hosts={'clc': set(hosts[:4])})
+    assert _peak_in_flight(controller, hosts[:4]) == 1
+    assert controller.width(hosts[:4]) == 1
+    assert controller.width(hosts) == 10
+
+
+def test_adaptive_limit():
+    controller = ConcurrencyController(limit=4, adaptive=True, max_limit=6)
+    for _ in range(40):
+        controller.observe(latency=0.01)
+    assert controller.limit == 6
+    for _ in range(10):
+        controller.observe(failed=True)
+    assert controller.limit == 1
+    for _ in range(30):
+        controller.observe(latency=0.01)
+    assert controller.limit > 1
+    for _ in range(20):
+        controller.observe(latency=1.0)
+    assert controller.limit == 1
+
+
+def test_static_limit_ignores_observations():
+    controller = ConcurrencyController(limit=4)
+    for _ in range(10):
+        controller.observe(failed=True)
+    assert controller.limit == 4 and controller.max_limit == 4
@@ -0,0 +1,43 @@
+import os
+import subprocess
+
+from calyptos.cookbooks import CookbookCache
+
+
+def git(directory, *args):
+    subprocess.check_call(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+                          + list(args), cwd=directory, stdout=open(os.devnull, 'w'))
+
+
+def test_vendored_cookbooks_are_reused_until_the_repo_changes(tmpdir):
+    repo = tmpdir.mkdir('eucalyptus-cookbook')
+    repo.join('Berksfile').write("source 'https://supermarket.chef.io'\nmetadata\n")
+    git(str(repo), 'init', '-q')
+    git(str(repo), 'add', 'Berksfile')
+    git(str(repo), 'commit', '-q', '-m', 'initial')
+    berksfile = str(repo.join('Berksfile'))
+    cookbook_path = str(tmpdir.join('chef-repo', 'cookbooks'))
+    vendored = []
+
+    def vendor(berksfile, cookbook_path):
+        vendored.append(berksfile)
+        os.makedirs(os.path.join(cookbook_path, 'eucalyptus', 'recipes'))
+        with open(os.path.join(cookbook_path, 'eucalyptus', 'recipes', 'default.rb'), 'w') as f:
+            f.write('package "eucalyptus"\n')
+        with open(berksfile + '.lock', 'w') as lock:
+            lock.write('DEPENDENCIES\n  eucalyptus\n')
+
+    cache = CookbookCache(str(tmpdir.join('cache')), max_entries=1)
+    assert not cache.vendor(berksfile, cookbook_path, vendor)
+    assert cache.vendor(berksfile, cookbook_path, vendor)
+    recipe = os.path.join(cookbook_path, 'eucalyptus', 'recipes', 'default.rb')
+    assert len(vendored) == 1 and os.stat(recipe).st_nlink == 2
+
+    repo.join('attributes.rb').write('default["x"] = 1\n')
+    git(str(repo), 'add', 'attributes.rb')
+    git(str(repo), 'commit', '-q', '-m', 'change')
+    assert not cache.vendor(berksfile, cookbook_path, vendor)
+    assert len(os.listdir(cache.root)) == 1
+
+    repo.join('Berksfile').write("source 'https://supermarket.chef.io'\n")
+    assert cache.key(berksfile) is None
@@ -0,0 +1,68 @@
+import re
+import threading
+import time
+
+from calyptos.plugins.debugger.debuggerplugin import DebuggerPlugin
+from calyptos.plugins.debugger.runner import DebuggerRunner
+
+
+class FakeDeployer(object):
+    def read_environment(self):
+        return {}
+
+    def get_roles(self):
+        return {}
+
+
+running = set()
+lock = threading.Lock()
+overlaps = []
+
+
+class SlowPlugin(DebuggerPlugin):
+    def debug(self):
+        with lock:
+            running.add(self.name)
+            overlaps.append(set(running))
+        for step in range(3):
+            self.success('{0} step {1}'.format(self.name, step))
+            time.sleep(0.05)
+        with lock:
+            running.discard(self.name)
+        return (self.passed, self.failed)
+
+
+class OtherSlowPlugin(SlowPlugin):
+    pass
+
+
+class BandwidthPlugin(SlowPlugin):
+    exclusive = True
+
+
+class BrokenPlugin(DebuggerPlugin):
+    def debug(self):
+        self.success('partial')
+        raise ValueError('boom')
+
+
+def test_plugins_run_concurrently_with_grouped_output(capsys):
+    runner = DebuggerRunner([('slow', SlowPlugin), ('bandwidth', BandwidthPlugin),
+                             ('other', OtherSlowPlugin), ('broken', BrokenPlugin)],
+                            FakeDeployer(), workers=3)
+    results = runner.run()
+    output = capsys.readouterr()[0]
+    assert results['slow'][:2] == (3, 0)
+    assert results['broken'][:2] == (1, 1)
+    assert results['bandwidth'][2] >= 0.15
+    # The two shared plugins overlapped, the exclusive one ran alone
+    assert set(['SlowPlugin', 'OtherSlowPlugin']) in overlaps
+    assert set(['BandwidthPlugin']) in overlaps
+    assert not any('BandwidthPlugin' in names and len(names) > 1 for names in overlaps)
+    # Each plugin's lines form one uninterrupted block
+    owners = re.findall(r'(\w+) step \d', output)
+    blocks = [name for index, name in enumerate(owners)
+              if index == 0 or owners[index - 1] != name]
+    assert sorted(blocks) == ['BandwidthPlugin', 'OtherSlowPlugin', 'SlowPlugin']
+    assert output.count('DEBUG RESULTS') == 4
+    assert 'ValueError: boom' in output
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tarfile
+import tempfile
+
+from calyptos.deploydata import DeploymentTree, REMOVED_LIST, plan_distribution
+
+
+def _write(root, relpath, data):
+    path = os.path.join(root, relpath)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as handle:
+        handle.write(data)
+
+
+def test_incremental_bundles():
+    root = tempfile.mkdtemp()
+    state = tempfile.mkdtemp()
+    try:
+        _write(root, 'chef-repo/cookbooks/a/recipe.rb', 'a')
+        _write(root, 'chef-repo/nodes/host.json', '{}')
+        tree = DeploymentTree(root, state_dir=state)
+        entries = tree.scan()
+        assert sorted(entries) == ['chef-repo/cookbooks/a/recipe.rb',
+                                   'chef-repo/nodes/host.json']
+        changed, removed = tree.diff(tree.load_manifest('10.0.0.1'), entries)
+        assert changed == sorted(entries) and removed == []
+        tree.save_manifest('10.0.0.1', entries)
+
+        # A fresh instance (new invocation) sees the host as up to date
+        tree = DeploymentTree(root, state_dir=state)
+        assert tree.diff(tree.load_manifest('10.0.0.1'), tree.scan()) == ([], [])
+        # Another deployment folder on the same host starts from nothing
+        other = DeploymentTree(root, state_dir=state, remote_path='/root/other/')
+        assert other.load_manifest('10.0.0.1') == {}
+
+        _write(root, 'chef-repo/nodes/host.json', '{"run_list": []}')
+        os.remove(os.path.join(root, 'chef-repo/cookbooks/a/recipe.rb'))
+        changed, removed = tree.diff(tree.load_manifest('10.0.0.1'), tree.scan())
+        assert changed == ['chef-repo/nodes/host.json']
+        assert removed == ['chef-repo/cookbooks/a/recipe.rb']
+        entries = tree.scan()
+        bundle = tree.build_bundle(changed, removed, entries)
+        assert tree.build_bundle(changed, removed, entries) == bundle
+        names = tarfile.open(bundle).getnames()
+        assert sorted(names) == sorted(changed + [REMOVED_LIST])
+
+        # The same path changing again needs a bundle with the new content
+        tree.save_manifest('10.0.0.1', entries)
+        _write(root, 'chef-repo/nodes/host.json', '{"run_list": ["recipe[nc]"]}')
+        entries = tree.scan()
+        changed, removed = tree.diff(tree.load_manifest('10.0.0.1'), entries)
+        assert changed == ['chef-repo/nodes/host.json'] and removed == []
+        newer = tree.build_bundle(changed, removed, entries)
+        assert newer != bundle
+        node_file = tarfile.open(newer).extractfile('chef-repo/nodes/host.json')
+        assert node_file.read() == '{"run_list": ["recipe[nc]"]}'
+    finally:
+        shutil.rmtree(root)
+        shutil.rmtree(state)
+
+
+def test_plan_distribution():
+    clusters = [set('10.0.1.%d' % i for i in range(20)),
+                set('10.0.2.%d' % i for i in range(20))]
+    hosts = set().union(*clusters)
+    rounds = plan_distribution(hosts, clusters, fanout=2)
+    assert len(rounds[0][None]) == 2
+    assert set(host[:7] for host in rounds[0][None]) == set(['10.0.1.', '10.0.2.'])
+    holders = set(rounds[0][None])
+    for relays in rounds[1:]:
+        for source, targets in relays.items():
+            assert source in holders
+            assert len(targets) <= 2
+        for targets in relays.values():
+            assert not holders & set(targets)
+            holders.update(targets)
+    assert holders == hosts
+    assert len(rounds) <= 5
+
+    rounds = plan_distribution(['a', 'b', 'c'], fanout=2)
+    assert rounds == [{None: ['a', 'b']}, {'a': ['c']}]
@@ -0,0 +1,61 @@
+import hashlib
+import os
+
+import yaml
+
+from calyptos import envschema
+
+VALID = """\
+name: test
+description: test cloud
+default_attributes:
+  eucalyptus:
+    network:
+      mode: EDGE
+      bridge-interface: br0
+    topology:
+      clc-1: 10.0.0.1
+      user-facing:
+      - 10.0.0.1
+      clusters:
+        one: {}
+    eucalyptus-repo: http://example.com/eucalyptus
+    euca2ools-repo: http://example.com/euca2ools
+"""
+
+
+def validate(tmpdir, content):
+    path = tmpdir.join('environment.yml')
+    path.write(content)
+    return envschema.validate_environment(yaml.load(content), str(path))
+
+
+def test_valid_environment_has_no_errors(tmpdir, monkeypatch):
+    monkeypatch.setattr(envschema, 'CACHE_DIR', str(tmpdir.join('cache')))
+    assert validate(tmpdir, VALID) == []
+
+
+def test_all_errors_are_reported_with_lines(tmpdir, monkeypatch):
+    monkeypatch.setattr(envschema, 'CACHE_DIR', str(tmpdir.join('cache')))
+    content = (VALID.replace('      mode: EDGE\n', '')
+                    .replace('clc-1: 10.0.0.1', 'clc-1: [10.0.0.1]')
+                    .replace('    eucalyptus-repo', '    bogus: 1\n    eucalyptus-repo'))
+    errors = validate(tmpdir, content)
+    assert sorted(errors) == [
+        (5, "Missing key: 'mode'"),
+        (8, "Invalid environment.yml value(s) for 'clc-1'."),
+        (13, "Unexpected key: 'bogus'"),
+    ]
+
+
+def test_compiled_schema_is_cached_on_disk(tmpdir):
+    spec = {'name': str, 'size': int}
+    check = envschema.compile_schema(spec, cache_dir=str(tmpdir))
+    errors = []
+    check({'name': 1, 'extra': True}, errors)
+    assert sorted(errors) == [((), "Missing key: 'size'"),
+                              (('extra',), "Unexpected key: 'extra'"),
+                              (('name',), "Invalid environment.yml value(s) for 'name'.")]
+    cached = os.listdir(str(tmpdir))
+    digest = hashlib.sha1(envschema.generate_source(spec)).hexdigest()
+    assert len(cached) == 1 and digest in cached[0]
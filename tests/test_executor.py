@@ -0,0 +1,44 @@
+import pickle
+
+from calyptos.executor import ForkingExecutor, ThreadedExecutor
+from calyptos.sshpool import get_pool, RemoteResult
+from sshstub import StubSSHD
+
+
+def _probe(host, slow_host):
+    if host == slow_host:
+        return get_pool().run(host, 'sleep 1; echo slow')
+    return get_pool().run(host, 'echo fast')
+
+
+def test_threaded_executor_streams_results(pool_env):
+    slow, fast = StubSSHD(), StubSSHD()
+    try:
+        executor = ThreadedExecutor()
+        stream = executor.stream(_probe, [slow.host, fast.host], slow.host)
+        assert next(stream) == (fast.host, 'fast')
+        assert next(stream) == (slow.host, 'slow')
+        results = executor.run_command('echo $((6 * 7)); exit 1',
+                                       [slow.host, fast.host])
+        assert results[slow.host] == results[fast.host] == '42'
+        assert results[fast.host].failed
+        assert slow.handshakes == fast.handshakes == 1
+        unreachable = executor.run_command('true', ['127.0.0.1:1'])
+        assert isinstance(unreachable['127.0.0.1:1'], BaseException)
+    finally:
+        slow.stop()
+        fast.stop()
+
+
+def test_forking_executor_keeps_dict_api(sshd):
+    get_pool().run(sshd.host, 'true')
+    results = ForkingExecutor().run_command('echo forked', [sshd.host])
+    assert results == {sshd.host: 'forked'}
+    assert results[sshd.host].succeeded
+    # Children connect on their own instead of using the parent's session
+    assert sshd.handshakes == 2
+
+
+def test_remote_results_pickle():
+    result = pickle.loads(pickle.dumps(RemoteResult('out', 'host', 'cmd', 2), 2))
+    assert result == 'out' and result.host == 'host' and result.return_code == 2
@@ -0,0 +1,49 @@
+from calyptos.facts import HostFacts
+
+
+OUTPUTS = {
+    'os_release': 'CentOS release 6.9 (Final)',
+    'arch': 'x86_64',
+    'cpuinfo': 'processor\t: 0\nmodel name\t: Intel(R) Xeon(R) CPU\n'
+               'flags\t\t: fpu vme vmx sse\n\n'
+               'processor\t: 1\nmodel name\t: Intel(R) Xeon(R) CPU\n'
+               'flags\t\t: fpu vme vmx sse',
+    'memory': '             total       used       free     shared    buffers     cached\n'
+              'Mem:       8061404    7794212     267192          0     165736    5946064\n'
+              '-/+ buffers/cache:    1682412    6378992\n'
+              'Swap:      2097148          0    2097148',
+    'disks': 'Filesystem     Type  1G-blocks  Used Available Capacity Mounted on\n'
+             '/dev/sda1      ext4        50G   10G       38G      21% /\n'
+             '/dev/sdb1      xfs        200G  180G       20G      90% /var/lib/eucalyptus',
+    'path_mounts': '/var/lib/eucalyptus /var/lib/eucalyptus\n/var/log/eucalyptus /',
+    'listening': 'Proto Recv-Q Send-Q Local Address   Foreign Address  State   PID/Program name\n'
+                 'tcp        0      0 0.0.0.0:8773   0.0.0.0:*        LISTEN  1234/java\n'
+                 'udp        0      0 :::7500        :::*                     1234/java',
+    'packages': 'ntp\nntpdate\neucalyptus-cloud',
+    'runlevels': 'ntpd           \t0:off\t1:off\t2:on\t3:on\t4:on\t5:on\t6:off\n'
+                 'xinetd based services:\n\trsync:\toff',
+    'service_ntpd': 'ntpd (pid  1563) is running...',
+    'service_libvirtd': 'libvirtd is stopped',
+}
+
+
+def test_host_facts_are_parsed():
+    facts = HostFacts('10.0.0.1', OUTPUTS)
+    assert facts.cpu_count == 2 and 'vmx' in facts.cpu_flags
+    assert facts.memory['total'] == 8061404
+    assert facts.memory['available'] == 6378992
+    assert facts.disk_for('/var/lib/eucalyptus')['size'] == 200
+    assert facts.disk_for('/var/log/eucalyptus')['use_percent'] == 21
+    assert facts.listening_on('tcp', 8773) and facts.listening_on('udp', 7500)
+    assert not facts.listening_on('tcp', 8777)
+    assert facts.has_package('ntpdate') and not facts.has_package('iperf')
+    assert facts.runlevels['ntpd'] == set(['2', '3', '4', '5'])
+    assert facts.service_running('ntpd')
+    assert not facts.service_running('libvirtd')
+    assert not facts.service_running('eucalyptus-nc')
+
+
+def test_unreachable_host_has_empty_facts():
+    facts = HostFacts('10.0.0.2', error=IOError('unreachable'))
+    assert facts.error and facts.cpu_count == 0 and facts.memory == {}
+    assert facts.disk_for('/var/lib/eucalyptus') is None
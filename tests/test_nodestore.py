@@ -0,0 +1,69 @@
+import json
+import os
+
+import pytest
+
+from calyptos.nodestore import FailedToFindNodeException, NodeStore
+
+
+def write_node(node_dir, name, ip, extra_address=None):
+    addresses = {ip: {'family': 'inet'}}
+    if extra_address:
+        addresses[extra_address] = {'family': 'inet'}
+    document = {'name': name, 'run_list': [],
+                'automatic': {'ipaddress': ip, 'hostname': name,
+                              'network': {'interfaces': {'eth0': {'addresses': addresses}}}}}
+    with open(os.path.join(node_dir, name + '.json'), 'w') as node_file:
+        json.dump(document, node_file)
+
+
+def test_index_follows_node_files(tmpdir):
+    node_dir = str(tmpdir)
+    for number in range(200):
+        write_node(node_dir, 'node{0}'.format(number), '10.0.{0}.{1}'.format(number // 100,
+                                                                            number % 100))
+    store = NodeStore(node_dir)
+    loads = []
+    original_load = store.load
+    store.load = lambda path: loads.append(path) or original_load(path)
+    store.refresh()
+    assert len(loads) == 200
+    assert store.find('10.0.1.5') == 'node105' and store.find('node7') == 'node7'
+
+    store.refresh()
+    assert len(loads) == 200
+
+    write_node(node_dir, 'node3', '10.0.0.3', extra_address='192.168.0.3')
+    os.utime(os.path.join(node_dir, 'node3.json'), (1, 1))
+    os.remove(os.path.join(node_dir, 'node4.json'))
+    store.refresh()
+    assert len(loads) == 201
+    assert store.find('192.168.0.3') == 'node3'
+    with pytest.raises(FailedToFindNodeException):
+        store.find('10.0.0.4')
+
+
+def test_records_keep_only_what_is_used(tmpdir):
+    node_dir = str(tmpdir)
+    write_node(node_dir, 'clc', '10.0.0.1')
+    with open(os.path.join(node_dir, 'clc.json')) as node_file:
+        document = json.load(node_file)
+    document['automatic']['packages'] = dict(('package%d' % i, {}) for i in range(1000))
+    document['normal'] = {'eucalyptus': {'cloud-keys': {'euca.p12': 'key'}}}
+    with open(os.path.join(node_dir, 'clc.json'), 'w') as node_file:
+        json.dump(document, node_file)
+
+    store = NodeStore(node_dir)
+    assert store.find('10.0.0.1') == 'clc'
+    record = store.record('clc')
+    assert not hasattr(record, '__dict__')
+    assert record.attribute('normal', 'eucalyptus', 'cloud-keys') == {'euca.p12': 'key'}
+
+    store.set_run_list('clc', ['recipe[eucalyptus::cloud-controller]'])
+    assert store.record('clc').run_list == ['recipe[eucalyptus::cloud-controller]']
+    full = store.document('clc')
+    assert len(full['automatic']['packages']) == 1000
+    assert full['run_list'] == ['recipe[eucalyptus::cloud-controller]']
+    # Saved by the store, nothing to read back
+    store.load = None
+    store.refresh()
@@ -0,0 +1,13 @@
+from calyptos.probes import run_probes
+
+
+def test_probes_run_in_one_round_trip(sshd):
+    results = run_probes(sshd.host, [('greeting', 'echo hello; echo world'),
+                                     ('failing', 'echo oops >&2; exit 3'),
+                                     ('quoted', "echo 'a b' | awk '{print $2}'")])
+    assert results['greeting'] == 'hello\nworld'
+    assert results['greeting'].succeeded
+    assert results['failing'] == 'oops'
+    assert results['failing'].return_code == 3
+    assert results['quoted'] == 'b'
+    assert len(sshd.commands) == 1
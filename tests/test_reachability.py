@@ -0,0 +1,38 @@
+import socket
+
+import pytest
+
+from calyptos.reachability import icmp_permitted, probe_hosts
+
+
+def test_tcp_probes_measure_round_trips():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(16)
+    try:
+        results = probe_hosts(['127.0.0.1', 'no-such-host.invalid'], method='tcp',
+                              port=listener.getsockname()[1], count=3, timeout=1,
+                              deadline=5)
+    finally:
+        listener.close()
+    local = results['127.0.0.1']
+    assert (local.sent, local.received, local.loss) == (3, 3, 0)
+    assert 0 <= local.min <= local.avg <= local.max < 1
+    missing = results['no-such-host.invalid']
+    assert not missing.reachable and missing.error is not None and missing.loss == 100
+
+
+def test_refused_connection_counts_as_reachable():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    result = probe_hosts(['127.0.0.1'], method='tcp', port=port, count=2)['127.0.0.1']
+    assert result.received == 2
+
+
+@pytest.mark.skipif(not icmp_permitted(), reason='raw sockets are not permitted')
+def test_icmp_echo():
+    result = probe_hosts(['127.0.0.1'], method='icmp', count=2, timeout=1)['127.0.0.1']
+    assert result.method == 'icmp'
+    assert result.received == 2
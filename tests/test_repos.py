@@ -0,0 +1,91 @@
+import threading
+import BaseHTTPServer
+
+import pytest
+
+from calyptos.plugins.validator.repos import Repos
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    requests = []
+    flaky = [2]
+
+    def do_HEAD(self):
+        self.requests.append(('HEAD', self.path))
+        if self.path == '/nohead':
+            self.send_response(405)
+        elif self.path == '/missing':
+            self.send_response(404)
+        elif self.path == '/flaky' and self.flaky[0]:
+            self.flaky[0] -= 1
+            self.send_response(503)
+        else:
+            self.send_response(200)
+        self.end_headers()
+
+    def do_GET(self):
+        self.requests.append(('GET', self.path, self.headers.get('Range')))
+        self.send_response(206)
+        self.send_header('Content-Length', '1')
+        self.end_headers()
+        self.wfile.write('x')
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeDeployer(object):
+    def __init__(self, repos):
+        self.environment = {'default_attributes': {'eucalyptus': repos}}
+
+    def read_environment(self):
+        return self.environment
+
+    def get_roles(self):
+        return {}
+
+
+@pytest.fixture
+def server():
+    httpd = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    del Handler.requests[:]
+    yield 'http://127.0.0.1:{0}'.format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def repos(deployer, tmpdir):
+    validator = Repos(deployer)
+    validator.cache_file = str(tmpdir.join('repos.json'))
+    validator.base_delay = 0.01
+    validator.deadline = 5
+    return validator
+
+
+def test_reachable_urls_are_cached(server, tmpdir):
+    deployer = FakeDeployer({'eucalyptus-repo': server + '/repo',
+                             'euca2ools-repo': server + '/nohead',
+                             'init-script-url': server + '/flaky'})
+    repos(deployer, tmpdir).validate()
+    assert ('GET', '/nohead', 'bytes=0-0') in Handler.requests
+    assert Handler.requests.count(('HEAD', '/flaky')) == 3
+    del Handler.requests[:]
+    repos(deployer, tmpdir).validate()
+    assert Handler.requests == []
+
+
+def test_client_errors_are_not_retried(server, tmpdir):
+    deployer = FakeDeployer({'eucalyptus-repo': server + '/missing',
+                             'default-img-url': 'http://127.0.0.1:1/unreachable',
+                             'post-script-url': 'repo.example.com/no-scheme'})
+    validator = repos(deployer, tmpdir)
+    validator.deadline = 0.5
+    with pytest.raises(AssertionError) as error:
+        validator.validate()
+    assert 'INVALID REQUEST: ' + server + '/missing  404' in str(error.value)
+    assert 'INVALID URL: http://127.0.0.1:1/unreachable' in str(error.value)
+    assert 'INVALID URL: repo.example.com/no-scheme  unknown url type' in str(error.value)
+    assert Handler.requests == [('HEAD', '/missing')]
@@ -0,0 +1,88 @@
+import os
+import time
+
+import pytest
+
+from calyptos.rolebuilder import RoleBuilder
+
+ENVIRONMENT = """
+default_attributes:
+  eucalyptus:
+    topology:
+      clc:
+      - 10.0.0.1
+      user-facing:
+      - 10.0.0.1
+      clusters:
+        one:
+          cc:
+          - 10.0.1.1
+          sc:
+          - 10.0.1.1
+          nodes:
+          - 10.0.1.2
+          - 10.0.1.3
+        two:
+          cc:
+          - 10.0.2.1
+          sc:
+          - 10.0.2.1
+          nodes:
+          - 10.0.2.2
+    network:
+      mode: VPCMIDO
+    midonet:
+      Gateways:
+      - Ip: 10.0.3.1
+      midolman-host-mapping:
+        node-a: 10.0.1.2
+        node-b: 10.0.2.2
+"""
+
+
+def write_environment(tmpdir, content=ENVIRONMENT):
+    path = tmpdir.join('environment.yml')
+    path.write(content)
+    return str(path)
+
+
+def test_roles_are_indexed(tmpdir):
+    builder = RoleBuilder(write_environment(tmpdir))
+    roles = builder.get_roles()
+    assert sorted(roles['cluster']) == ['one', 'two']
+    assert roles['cluster']['two'] == set(['10.0.2.1', '10.0.2.2'])
+    assert builder.get_host_roles('10.0.0.1') == set(['clc', 'user-facing', 'midonet-cluster',
+                                                      'configure-eucalyptus',
+                                                      'setup-admin-creds', 'configure-vpc'])
+    assert builder.get_host_roles('10.0.2.2') == set(['node-controller', 'midolman'])
+    assert builder.get_role_hosts('node-controller') == set(['10.0.1.2', '10.0.1.3',
+                                                             '10.0.2.2'])
+    assert builder.get_cluster('10.0.1.3') == 'one'
+    assert builder.get_cluster('10.0.0.1') is None
+    assert builder.midolman_hostnames['10.0.2.2'] == 'node-b'
+    assert '10.0.3.1' in builder.all_hosts
+
+
+def test_environment_is_parsed_once(tmpdir):
+    path = write_environment(tmpdir)
+    first = RoleBuilder(path)
+    second = RoleBuilder(path)
+    assert first.read_environment() is second.read_environment()
+    assert first.get_roles()['clc'] is first.get_roles()['clc']
+    # A changed file is parsed again
+    write_environment(tmpdir, ENVIRONMENT.replace('10.0.0.1', '10.0.0.100'))
+    os.utime(path, (time.time() + 5, time.time() + 5))
+    assert RoleBuilder(path).get_role_hosts('clc') == set(['10.0.0.100'])
+
+
+def test_role_sets_can_not_be_changed(tmpdir):
+    builder = RoleBuilder(write_environment(tmpdir))
+    roles = builder.get_roles()
+    with pytest.raises(AttributeError):
+        roles['clc'].add('10.9.9.9')
+    with pytest.raises(AttributeError):
+        builder.get_euca_hosts().update(roles['midonet-gateway'])
+    assert builder.get_euca_hosts() == set(['10.0.0.1', '10.0.1.1', '10.0.1.2', '10.0.1.3',
+                                            '10.0.2.1', '10.0.2.2'])
+    assert builder.get_java_components() == set(['10.0.0.1', '10.0.1.1', '10.0.2.1'])
+    assert builder.get_role_hosts('clc') == set(['10.0.0.1'])
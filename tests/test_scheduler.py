@@ -0,0 +1,120 @@
+import threading
+import time
+
+from calyptos.scheduler import ProvisionScheduler, SchedulerError
+
+
+ROLE_HOSTS = {'clc': set(['10.0.0.1']),
+              'user-facing': set(['10.0.0.2']),
+              'cluster-controller': set(['10.0.0.3']),
+              'storage-controller': set(['10.0.0.3']),
+              'node-controller': set(['10.0.0.4', '10.0.0.5']),
+              'console': set(['10.0.0.6']),
+              'configure-eucalyptus': set(['10.0.0.1'])}
+ROLE_ORDER = ['clc', 'cluster-controller', 'storage-controller',
+              'node-controller', 'user-facing', 'console',
+              'configure-eucalyptus']
+
+
+def test_default_dependencies():
+    scheduler = ProvisionScheduler(ROLE_ORDER, ROLE_HOSTS)
+    assert scheduler.dependencies['clc'] == set()
+    assert scheduler.dependencies['node-controller'] == set(['clc', 'cluster-controller'])
+    assert scheduler.dependencies['configure-eucalyptus'] == set(ROLE_ORDER[:-1])
+
+
+def test_roles_sharing_a_host_run_in_config_order():
+    role_hosts = {'clc': set(['10.0.0.1']),
+                  'midolman': set(['10.0.0.4', '10.0.0.5']),
+                  'walrus': set(['10.0.0.2']),
+                  'cluster-controller': set(['10.0.0.3']),
+                  'node-controller': set(['10.0.0.4', '10.0.0.5'])}
+    order = ['clc', 'midolman', 'walrus', 'cluster-controller', 'node-controller']
+    scheduler = ProvisionScheduler(order, role_hosts, depends_on={'midolman': []})
+    assert scheduler.dependencies['node-controller'] == set(['clc', 'cluster-controller',
+                                                             'midolman'])
+    assert scheduler.dependencies['cluster-controller'] == set(['clc', 'walrus'])
+
+    # An explicit dependency on a role listed later wins over config order
+    scheduler = ProvisionScheduler(order, role_hosts,
+                                   depends_on={'midolman': ['node-controller']})
+    assert 'midolman' not in scheduler.dependencies['node-controller']
+
+
+def test_roles_without_hosts_are_dropped():
+    scheduler = ProvisionScheduler(ROLE_ORDER + ['walrus'], ROLE_HOSTS)
+    assert 'walrus' not in scheduler.dependencies
+
+
+def test_explicit_dependencies_and_cycles():
+    scheduler = ProvisionScheduler(ROLE_ORDER, ROLE_HOSTS,
+                                   depends_on={'console': []})
+    assert scheduler.dependencies['console'] == set()
+    try:
+        ProvisionScheduler(['clc', 'user-facing'], ROLE_HOSTS,
+                           depends_on={'clc': ['user-facing']})
+    except SchedulerError:
+        pass
+    else:
+        raise AssertionError('Expected a dependency cycle')
+
+
+def test_run_honors_dependencies_and_hosts():
+    lock = threading.Lock()
+    active_hosts = set()
+    started = []
+
+    def task(role):
+        with lock:
+            assert not active_hosts & ROLE_HOSTS[role]
+            active_hosts.update(ROLE_HOSTS[role])
+            started.append(role)
+        time.sleep(0.05)
+        with lock:
+            active_hosts.difference_update(ROLE_HOSTS[role])
+
+    scheduler = ProvisionScheduler(ROLE_ORDER, ROLE_HOSTS, workers=8)
+    timings = scheduler.run(task)
+    assert set(started) == set(ROLE_ORDER)
+    assert started[0] == 'clc'
+    assert started[-1] == 'configure-eucalyptus'
+    for role, deps in scheduler.dependencies.items():
+        for dep in deps:
+            assert timings[dep][1] <= timings[role][0]
+    path = [role for role, _ in scheduler.critical_path()]
+    assert path[0] == 'clc'
+    assert path[-1] == 'configure-eucalyptus'
+
+
+def test_failure_stops_scheduling():
+    ran = []
+
+    def task(role):
+        ran.append(role)
+        if role == 'clc':
+            raise SystemExit(1)
+
+    scheduler = ProvisionScheduler(ROLE_ORDER, ROLE_HOSTS)
+    try:
+        scheduler.run(task)
+    except SystemExit:
+        pass
+    else:
+        raise AssertionError('Expected the failure to propagate')
+    assert ran == ['clc']
+
+
+def test_phases_merge_roles_per_host():
+    role_hosts = {'clc': set(['10.0.0.1']),
+                  'midonet-cluster': set(['10.0.0.1']),
+                  'user-facing': set(['10.0.0.1']),
+                  'cluster-controller': set(['10.0.0.3']),
+                  'node-controller': set(['10.0.0.4', '10.0.0.5']),
+                  'configure-eucalyptus': set(['10.0.0.1'])}
+    order = ['clc', 'midonet-cluster', 'cluster-controller',
+             'node-controller', 'user-facing', 'configure-eucalyptus']
+    phases = ProvisionScheduler(order, role_hosts).phases()
+    assert phases == [['clc', 'midonet-cluster', 'user-facing'],
+                      ['cluster-controller'],
+                      ['node-controller'],
+                      ['configure-eucalyptus']]
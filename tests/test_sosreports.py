@@ -0,0 +1,44 @@
+import os
+import uuid
+
+from calyptos.plugins.debugger import eucalyptus_sosreports
+from calyptos.plugins.debugger.eucalyptus_sosreports import (EucalyptusSosReports,
+                                                             UNFINISHED_MARKER)
+
+
+class FakeDeployer(object):
+    def read_environment(self):
+        return {}
+
+    def get_roles(self):
+        return {}
+
+
+def test_unfinished_run_is_resumed(sshd, tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    report = 'sosreport-calyptos-{0}.tar.xz'.format(uuid.uuid4().hex)
+    with open('/tmp/' + report, 'w') as remote_file:
+        remote_file.write('a' * 1000)
+    directory = tmpdir.mkdir('sosreport-20260101-000000')
+    directory.join(UNFINISHED_MARKER).write('')
+    prefix = sshd.host.replace('.', '_') + '-'
+    directory.join(prefix + report + '.part').write('a' * 400)
+    directory.join('10_0_0_2-sosreport-100002.tar.xz').write('done')
+    tmpdir.mkdir('sosreport-20250101-000000').join(UNFINISHED_MARKER).write('')
+
+    cleaned, generated = [], []
+    monkeypatch.setattr(EucalyptusSosReports, 'run_command_on_hosts',
+                        lambda self, command, hosts: cleaned.extend(hosts) or
+                        dict((host, '') for host in hosts))
+    monkeypatch.setattr(EucalyptusSosReports, 'stream_sosreports_on_hosts',
+                        lambda self, hosts: generated.extend(hosts) or [])
+    monkeypatch.setattr(eucalyptus_sosreports, 'local', None)
+    plugin = EucalyptusSosReports(FakeDeployer())
+    try:
+        plugin._grab_sosreports([sshd.host, '10.0.0.2', '10.0.0.3'])
+    finally:
+        os.remove('/tmp/' + report)
+    assert cleaned == generated == ['10.0.0.3']
+    assert directory.join(prefix + report).read() == 'a' * 1000
+    assert not directory.join(UNFINISHED_MARKER).exists()
+    assert (plugin.passed, plugin.failed) == (2, 0)
@@ -0,0 +1,68 @@
+from fabric.context_managers import hide
+
+from calyptos.sshpool import SSHSessionPool, map_hosts
+from sshstub import StubSSHD
+
+
+def _pool(**kwargs):
+    return SSHSessionPool(user='root', password='foobar', **kwargs)
+
+
+def test_sessions_are_reused(stub_env):
+    sshd = StubSSHD()
+    pool = _pool()
+    try:
+        result = pool.run(sshd.host, 'echo hello; exit 3')
+        assert result == 'hello'
+        assert result.return_code == 3 and result.failed
+        results = pool.run_on_hosts('echo again', [sshd.host] * 3)
+        assert results[sshd.host] == 'again'
+        for _ in range(5):
+            assert pool.run(sshd.host, 'true').succeeded
+        assert sshd.handshakes == 1
+        assert pool.handshakes == 1
+    finally:
+        pool.close_all()
+        sshd.stop()
+
+
+def test_output_is_echoed_unless_hidden(stub_env, capsys):
+    sshd = StubSSHD()
+    pool = _pool()
+    try:
+        with hide('running'):
+            pool.run(sshd.host, 'echo one; sleep 0.1; printf two')
+        assert capsys.readouterr()[0] == '[{0}] out: one\n[{0}] out: two\n'.format(sshd.host)
+        with hide('stdout'):
+            pool.run(sshd.host, 'echo one')
+        assert capsys.readouterr()[0] == '[{0}] run: echo one\n'.format(sshd.host)
+    finally:
+        pool.close_all()
+        sshd.stop()
+
+
+def test_dead_and_idle_sessions_are_replaced(stub_env):
+    sshd = StubSSHD()
+    pool = _pool(idle_timeout=0)
+    try:
+        pool.run(sshd.host, 'true')
+        pool.evict_idle()
+        assert not pool.sessions
+        pool.run(sshd.host, 'true')
+        for transport in sshd.transports:
+            transport.close()
+        assert pool.run(sshd.host, 'echo back') == 'back'
+        assert pool.handshakes == 3
+    finally:
+        pool.close_all()
+        sshd.stop()
+
+
+def test_map_hosts_reports_exceptions():
+    def function(host):
+        if host == 'bad':
+            raise ValueError(host)
+        return host.upper()
+    results = map_hosts(function, ['good', 'bad'], workers=2)
+    assert results['good'] == 'GOOD'
+    assert isinstance(results['bad'], ValueError)
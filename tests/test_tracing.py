@@ -0,0 +1,49 @@
+import json
+import time
+
+from calyptos.sshpool import _span_label, map_hosts
+from calyptos.tracing import Tracer, get_tracer, trace_context, traced
+
+
+def test_spans_export_as_chrome_trace(tmpdir):
+    tracer = Tracer()
+    with tracer.context(role='clc'):
+        with tracer.span('push', 'transfer', host='10.0.0.1') as trace:
+            time.sleep(0.01)
+            trace['bytes'] = 42
+        with tracer.span('converge', 'chef', host='10.0.0.1'):
+            time.sleep(0.05)
+    with tracer.span('validate', 'validate'):
+        pass
+    slowest = tracer.slowest(2)
+    assert [event['name'] for event in slowest] == ['converge', 'push']
+    assert slowest[1]['args'] == {'role': 'clc', 'host': '10.0.0.1', 'bytes': 42}
+    assert slowest[0]['dur'] >= 50000
+    assert tracer.slowest(5)[-1]['args'] == {}
+
+    path = str(tmpdir.join('trace.json'))
+    tracer.write_chrome_trace(path)
+    with open(path) as trace_file:
+        events = json.load(trace_file)['traceEvents']
+    assert len(events) == 3
+    assert all(event['ph'] == 'X' for event in events)
+
+
+def test_traced_records_host_and_context_on_worker_threads():
+    @traced('test')
+    def task(host, delay=0):
+        return host
+
+    tracer = get_tracer()
+    before = len(tracer.events)
+    with trace_context(role='nc'):
+        assert map_hosts(task, ['a', 'b']) == {'a': 'a', 'b': 'b'}
+    events = [event for event in tracer.events[before:] if event['cat'] == 'test']
+    assert sorted(event['args']['host'] for event in events) == ['a', 'b']
+    assert all(event['args']['role'] == 'nc' for event in events)
+
+
+def test_run_spans_label_commands_by_their_first_line():
+    assert _span_label('uptime') == 'uptime'
+    assert _span_label('set -e\nfor x in a b; do\n  echo $x\ndone\n') == 'set -e...'
+    assert _span_label('echo ' + 'x' * 200) == 'echo ' + 'x' * 75 + '...'
@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+
+import pytest
+
+from calyptos.transfer import DiskQuota, DownloadQueue, QuotaExceeded, download
+from sshstub import StubSFTPServer
+
+
+def test_download_resumes_and_verifies(sshd, tmpdir):
+    remote = tmpdir.join('remote.tar')
+    content = os.urandom(3 * 1024 * 1024 + 17)
+    remote.write(content, 'wb')
+    local = str(tmpdir.join('local.tar'))
+    # Half of the file made it before the last run was interrupted
+    with open(local + '.part', 'wb') as partial:
+        partial.write(content[:len(content) // 2])
+    assert download(sshd.host, str(remote), local) == local
+    assert open(local, 'rb').read() == content
+    assert not os.path.exists(local + '.part')
+    assert min(offset for _, offset in StubSFTPServer.reads) == len(content) // 2
+
+
+def test_corrupt_partial_download_starts_over(sshd, tmpdir):
+    remote = tmpdir.join('remote.tar')
+    remote.write('a' * 1000, 'wb')
+    local = str(tmpdir.join('local.tar'))
+    with open(local + '.part', 'wb') as partial:
+        partial.write('b' * 500)
+    queue = DownloadQueue(transfers=2)
+    queue.submit(sshd.host, str(remote), local)
+    queue.submit(sshd.host, str(tmpdir.join('missing.tar')), str(tmpdir.join('missing')))
+    results = dict((remote_path, result) for _, remote_path, _, result in queue.wait())
+    assert results[str(remote)] == local
+    assert open(local, 'rb').read() == 'a' * 1000
+    assert isinstance(results[str(tmpdir.join('missing.tar'))], Exception)
+
+
+def test_quota_pauses_until_space_is_freed(tmpdir):
+    tmpdir.join('old-report').write('x' * 60)
+    quota = DiskQuota(str(tmpdir), 100, poll_interval=0.05)
+    with pytest.raises(QuotaExceeded):
+        quota.reserve(str(tmpdir.join('huge.part')), 101)
+    quota.reserve(str(tmpdir.join('first.part')), 30)
+    reserved = []
+    thread = threading.Thread(target=lambda: reserved.append(
+        quota.reserve(str(tmpdir.join('second.part')), 30)))
+    thread.start()
+    time.sleep(0.2)
+    assert not reserved
+    tmpdir.join('old-report').remove()
+    thread.join(2)
+    assert reserved
+
+    # A resumed partial file is part of its reservation, not extra usage
+    resumed = tmpdir.mkdir('resumed')
+    resumed.join('report.part').write('x' * 50)
+    quota = DiskQuota(str(resumed), 100, poll_interval=0.05)
+    thread = threading.Thread(target=lambda: reserved.append(
+        quota.reserve(str(resumed.join('report.part')), 60)))
+    thread.daemon = True
+    thread.start()
+    thread.join(2)
+    assert len(reserved) == 2
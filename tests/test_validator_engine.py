@@ -0,0 +1,71 @@
+from calyptos.plugins.validator.engine import ANY, ValidationEngine
+from calyptos.plugins.validator.topology import Topology
+from calyptos.plugins.validator.vpc import VPC
+
+ENVIRONMENT = {
+    'default_attributes': {
+        'eucalyptus': {
+            'topology': {
+                'clc-1': '10.0.0.1',
+                'user-facing': ['10.0.0.1'],
+                'clusters': {
+                    'one': {'cc-1': '10.0.1.1', 'sc-1': '10.0.1.1',
+                            'nodes': '10.0.1.2 10.0.9.9'},
+                    'two': {'cc-1': '10.0.2.1', 'sc-1': '10.0.2.1',
+                            'nodes': '10.0.2.2 10.0.9.9'},
+                },
+            },
+            'network': {'mode': 'VPCMIDO', 'config-json': {'Mido': {'GatewayHost': 'gw'}}},
+        },
+        'midokura': {
+            'zookeepers': ['10.0.0.1:2181'],
+            'cassandras': ['10.0.0.1'],
+            'midolman-host-mapping': {'clc': '10.0.0.1', 'nc-a': '10.0.1.2',
+                                      'nc-b': '10.0.1.2'},
+        },
+    },
+}
+
+
+class FakeDeployer(object):
+    roles = {'clc': set(['10.0.0.1']), 'user-facing': set(['10.0.0.1']),
+             'node-controller': set(['10.0.1.2', '10.0.2.2', '10.0.9.9'])}
+
+    def read_environment(self):
+        return ENVIRONMENT
+
+    def get_roles(self):
+        return self.roles
+
+
+class Recorder(object):
+    walked = False
+
+    def __init__(self):
+        self.seen = []
+
+    def rules(self):
+        return [(('default_attributes', 'eucalyptus', 'topology', 'clusters', ANY, 'nodes'),
+                 lambda path, value: self.seen.append((path[4], value)))]
+
+
+def test_rules_are_dispatched_by_path():
+    recorder = Recorder()
+    ValidationEngine([recorder]).run(ENVIRONMENT)
+    assert recorder.walked
+    assert sorted(recorder.seen) == [('one', '10.0.1.2 10.0.9.9'), ('two', '10.0.2.2 10.0.9.9')]
+
+
+def test_cross_references_share_one_walk(capsys):
+    topology = Topology(FakeDeployer())
+    vpc = VPC(FakeDeployer())
+    ValidationEngine([topology, vpc]).run(ENVIRONMENT)
+    topology.validate()
+    vpc.validate()
+    output = capsys.readouterr()[0]
+    assert topology.failed_hosts == ['10.0.9.9']
+    assert "Found 10.0.9.9 in multiple clusters: ['one', 'two']" in output
+    assert 'Node 10.0.9.9 is listed more than once' in output
+    assert 'The IP 10.0.1.2 is mapped from more than one host' in output
+    assert 'Did not find NC (10.0.2.2) in Midolman host-mapping' in output
+    assert 'Found both "Gateways"' not in output